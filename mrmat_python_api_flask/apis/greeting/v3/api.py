@@ -25,12 +25,12 @@
 
 from flask import Blueprint, g
 
-from mrmat_python_api_flask import oidc
+from mrmat_python_api_flask import auth
 
 bp = Blueprint('greeting_v3', __name__)
 
 
 @bp.route('/', methods=['GET'])
-@oidc.accept_token(require_token=True)
+@auth.accept_token(require_token=True)
 def get():
     return {'message': f'Hello {g.oidc_token_info["preferred_username"]}'}, 200
@@ -21,13 +21,112 @@
 #  SOFTWARE.
 
 """Blueprint for the Healthz API
+
+Liveness only tells whether the process serves requests at all. Readiness additionally checks the dependencies of the
+app. The result of every check is cached for HEALTHZ_CHECK_INTERVAL seconds, so that the probe rate of the
+orchestrator does not translate into load on the database or the identity provider.
 """
 
-from flask import Blueprint
+import threading
+from typing import Callable, Dict, Tuple
+
+import requests
+from flask import Blueprint, current_app
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from mrmat_python_api_flask import db, auth
+from mrmat_python_api_flask.cache import TTLCache
+from mrmat_python_api_flask.db_pool import pool_exhausted
+from mrmat_python_api_flask.db_migrations import HEAD_REVISION, current_revisions
 
 bp = Blueprint('healthz', __name__)
+_check_lock = threading.Lock()
+
+
+@bp.record_once
+def _init_check_cache(state):
+    state.app.config.setdefault('HEALTHZ_CHECK_INTERVAL', 10)
+    state.app.config.setdefault('HEALTHZ_TIMEOUT', 2)
+    state.app.extensions['healthz_cache'] = TTLCache(max_size=16, ttl=state.app.config['HEALTHZ_CHECK_INTERVAL'])
+
+
+def _check_database() -> Tuple[str, str]:
+    if pool_exhausted(db.engine.pool):
+        return 'FAILED', 'The connection pool is exhausted'
+    try:
+        with db.engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+    except SQLAlchemyError as sae:
+        return 'FAILED', f'The database is not reachable: {sae.__class__.__name__}'
+    return 'OK', 'The database is reachable'
+
+
+def _check_migrations() -> Tuple[str, str]:
+    try:
+        current = current_revisions()
+    except SQLAlchemyError as sae:
+        return 'FAILED', f'The revision of the database cannot be determined: {sae.__class__.__name__}'
+    if current != {HEAD_REVISION}:
+        return 'FAILED', f'The database is at revision {", ".join(sorted(current)) or "none"} ' \
+                         f'rather than {HEAD_REVISION}'
+    return 'OK', f'The database is at revision {HEAD_REVISION}'
+
+
+def _check_identity_provider() -> Tuple[str, str]:
+    if current_app.config['OIDC_TOKEN_VALIDATION'] == 'local':
+        uri = current_app.config['OIDC_JWKS_URI']
+    elif 'OIDC_CLIENT_SECRETS' in current_app.config:
+        uri = auth.oidc.client_secrets.get('token_introspection_uri')
+    else:
+        return 'SKIPPED', 'Token validation is not configured'
+    try:
+        resp = requests.get(uri, timeout=current_app.config['HEALTHZ_TIMEOUT'])
+    except requests.RequestException as re:
+        return 'FAILED', f'The identity provider at {uri} is not reachable: {re.__class__.__name__}'
+    if resp.status_code >= 500:
+        return 'FAILED', f'The identity provider at {uri} responds with status {resp.status_code}'
+    return 'OK', f'The identity provider at {uri} is reachable'
+
+
+_checks: Dict[str, Callable[[], Tuple[str, str]]] = {
+    'database': _check_database,
+    'migrations': _check_migrations,
+    'identity_provider': _check_identity_provider
+}
+
+
+def _run_check(name: str) -> Dict:
+    """Run a check unless its cached result is still current
+
+    Checks run one at a time, so that concurrent probes wait for a single check rather than all running it.
+    """
+    cache: TTLCache = current_app.extensions['healthz_cache']
+    result = cache.get(name)
+    if result is not None:
+        return result
+    with _check_lock:
+        result = cache.get(name)
+        if result is None:
+            (status, message) = _checks[name]()
+            result = {'status': status, 'message': message}
+            cache.put(name, result)
+    return result
 
 
 @bp.route('/', methods=['GET'])
 def healthz():
     return {'status': 'OK'}, 200
+
+
+@bp.route('/live', methods=['GET'])
+def live():
+    return {'status': 'OK'}, 200
+
+
+@bp.route('/ready', methods=['GET'])
+def ready():
+    checks = {name: _run_check(name) for name in _checks}
+    if any(check['status'] == 'FAILED' for check in checks.values()):
+        return {'status': 'UNAVAILABLE', 'checks': checks}, 503
+    return {'status': 'OK', 'checks': checks}, 200
@@ -0,0 +1,64 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Blueprint for the internal operational API
+
+This API is meant for operators and should not be exposed beyond the cluster by the reverse proxy. Profiles contain
+request paths and SQL statements while the pool and replica statistics reveal the load and topology of the service,
+so all of them require a token with the admin scope.
+"""
+
+from flask import Blueprint, current_app
+
+from mrmat_python_api_flask import db, auth
+from mrmat_python_api_flask.db_pool import pool_statistics
+
+bp = Blueprint('internal', __name__)
+
+
+@bp.route('/pool', methods=['GET'])
+@auth.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-admin'])
+def pool():
+    return pool_statistics(db.engine.pool), 200
+
+
+@bp.route('/replicas', methods=['GET'])
+@auth.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-admin'])
+def replicas():
+    return {'replicas': current_app.extensions['db_replicas'].health()}, 200
+
+
+@bp.route('/profiles', methods=['GET'])
+@auth.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-admin'])
+def profiles():
+    if 'profiler' not in current_app.extensions:
+        return {'status': 404, 'message': 'Profiling is not enabled'}, 404
+    return {'profiles': current_app.extensions['profiler'].store.list()}, 200
+
+
+@bp.route('/profiles/<report_id>', methods=['GET'])
+@auth.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-admin'])
+def profile(report_id: str):
+    report = current_app.extensions['profiler'].store.get(report_id) if 'profiler' in current_app.extensions else None
+    if report is None:
+        return {'status': 404, 'message': f'No profile with id {report_id}'}, 404
+    return report, 200
@@ -24,4 +24,4 @@
 """
 
 from .api import bp as api_resource_v1       # noqa: F401
-from .model import Owner, Resource, OwnerSchema, ResourceSchema  # noqa: F401
+from .model import Owner, Resource, ChangeMarker, OwnerSchema, ResourceSchema, ResourceRowSchema  # noqa: F401
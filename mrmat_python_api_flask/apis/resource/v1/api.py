@@ -23,17 +23,41 @@
 """Blueprint for the Resource API in V1
 """
 
-from typing import Tuple
+import base64
+import binascii
+import hashlib
+from typing import Tuple, Optional, List, Iterator, Dict
 
-from werkzeug.local import LocalProxy
-from flask import Blueprint, request, g, current_app
+from flask import Blueprint, Response, request, g, current_app, abort, json, stream_with_context
 from marshmallow import ValidationError
+from sqlalchemy import case, event, inspect
+from sqlalchemy.exc import IntegrityError
 
-from mrmat_python_api_flask import db, oidc
-from .model import Owner, Resource, resource_schema, resources_schema
+from mrmat_python_api_flask import db, auth
+from mrmat_python_api_flask.logs import access_log
+from mrmat_python_api_flask.cache import TTLCache
+from .model import Owner, Resource, ChangeMarker, ResourceRowSchema, resource_schema, resource_row_schema, \
+    resource_rows_schema
 
 bp = Blueprint('resource_v1', __name__)
-logger = LocalProxy(lambda: current_app.logger)
+
+
+@bp.record_once
+def _init_owner_cache(state):
+    state.app.config.setdefault('OWNER_CACHE_SIZE', 4096)
+    state.app.config.setdefault('OWNER_CACHE_TTL', 300)
+    state.app.extensions['owner_cache'] = TTLCache(max_size=state.app.config['OWNER_CACHE_SIZE'],
+                                                   ttl=state.app.config['OWNER_CACHE_TTL'])
+
+
+@event.listens_for(Owner, 'after_update')
+@event.listens_for(Owner, 'after_delete')
+def _invalidate_owner(mapper, connection, target):     # pylint: disable=unused-argument
+    """Drop owners from the cache as soon as they are changed through the ORM"""
+    cache = current_app.extensions.get('owner_cache')
+    if cache is not None:
+        for client_id in [target.client_id] + list(inspect(target).attrs.client_id.history.deleted):
+            cache.invalidate(client_id)
 
 
 def _extract_identity() -> Tuple:
@@ -41,31 +65,285 @@ def _extract_identity() -> Tuple:
            g.oidc_token_info['preferred_username']
 
 
+def _owner_id(client_id: str) -> Optional[int]:
+    """Look up the owner id of a client_id
+
+    The owner of a client_id practically never changes, so the mapping is cached for OWNER_CACHE_TTL seconds. Only
+    committed owners are ever cached.
+
+    Args:
+        client_id: The client_id of the caller
+
+    Returns:
+        The owner id or None if the client_id does not own anything yet
+    """
+    cache = current_app.extensions['owner_cache']
+    owner_id = cache.get(client_id)
+    if owner_id is None:
+        owner_id = db.session.query(Owner.id).filter(Owner.client_id == client_id).scalar()
+        if owner_id is not None:
+            cache.put(client_id, owner_id)
+    return owner_id
+
+
+def _create_owner(client_id: str, name: str) -> int:
+    """Create the owner of a client_id in a transaction of its own
+
+    Concurrent first requests of the same client_id race to create its owner. The unique index on the client_id lets
+    only one of them succeed, the others then use the owner it created. The change marker of the owner is created
+    along with it, so that its first writes do not race to create the marker instead.
+
+    Args:
+        client_id: The client_id of the caller
+        name: The name of the caller
+
+    Returns:
+        The owner id
+    """
+    try:
+        owner = Owner(client_id=client_id, name=name)
+        db.session.add(owner)
+        db.session.flush()
+        owner_id = owner.id
+        db.session.add(ChangeMarker(name=_marker(owner_id), version=0))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        owner_id = db.session.query(Owner.id).filter(Owner.client_id == client_id).scalar()
+        if owner_id is None:
+            raise
+    current_app.extensions['owner_cache'].put(client_id, owner_id)
+    return owner_id
+
+
+def _recover_owner(client_id: str, name: str, owner_id: int) -> Optional[int]:
+    """Find out whether an INSERT failed because the owner id it used was stale, and recover if so
+
+    The owner id of a client_id is cached, so the owner may have been removed in the meantime. The foreign key of
+    the resources then fails the INSERT. Must be called after the failed transaction was rolled back.
+
+    Args:
+        client_id: The client_id of the caller
+        name: The name of the caller
+        owner_id: The owner id the INSERT used
+
+    Returns:
+        The owner id to retry with, or None if owner_id is current and the INSERT failed for another reason
+    """
+    current_app.extensions['owner_cache'].invalidate(client_id)
+    current = _owner_id(client_id)
+    if current == owner_id:
+        return None
+    return current if current is not None else _create_owner(client_id, name)
+
+
+def _dump_one(i, status: int = 200) -> Tuple:
+    row = ResourceRowSchema.query().filter(Resource.id == i).one()
+    return resource_row_schema.dump(row), status, {'ETag': f'"{_resource_etag(row[0], row[-1])}"'}
+
+
+def _chunked(items: List, size: int = 500) -> Iterator[List]:
+    """Split a list into chunks to stay within the bind parameter limits of the database for IN clauses"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _batch_error() -> Optional[Tuple]:
+    json_body = request.get_json(silent=True)
+    if not isinstance(json_body, list) or len(json_body) == 0:
+        return {'status': 400, 'message': 'Expected a non-empty array'}, 400
+    if len(json_body) > current_app.config['RESOURCE_BATCH_SIZE_MAX']:
+        return {'status': 413,
+                'message': f'No more than {current_app.config["RESOURCE_BATCH_SIZE_MAX"]} items per batch'}, 413
+    return None
+
+
+def _classify_ownership(ids: List[int], owner_id: Optional[int]) -> Tuple[List[int], List[int], List[int]]:
+    """Classify resource identifiers by whether they exist and are owned by the caller
+
+    Args:
+        ids: The resource identifiers
+        owner_id: The owner id of the caller, None if the caller does not own anything
+
+    Returns:
+        A tuple of the identifiers owned by the caller, the identifiers that do not exist and the identifiers owned
+        by someone else
+    """
+    owners = {}
+    for chunk in _chunked(ids):
+        for (resource_id, resource_owner_id) in db.session\
+                .query(Resource.id, Resource.owner_id)\
+                .filter(Resource.id.in_(chunk)):
+            owners[resource_id] = resource_owner_id
+    owned = [i for i in ids if i in owners and owners[i] == owner_id]
+    missing = [i for i in ids if i not in owners]
+    not_owned = [i for i in ids if i in owners and owners[i] != owner_id]
+    return owned, missing, not_owned
+
+
+def _resource_etag(i: int, version: int) -> str:
+    return f'{i}-{version}'
+
+
+def _marker(owner_id: int) -> str:
+    """Return the name of the change marker covering the resources of an owner"""
+    return f'resources:{owner_id}'
+
+
+def _collection_etag(marker: int, limit: int, after: Optional[str]) -> str:
+    return hashlib.sha256(f'{marker}:{limit}:{after}'.encode('utf-8')).hexdigest()[:32]
+
+
+def _if_match_versions(i) -> Optional[List[int]]:
+    """Extract the versions of a resource the client expects from its If-Match header
+
+    Our ETags carry the version of the resource, so the precondition can be evaluated as part of the UPDATE or DELETE
+    statement itself rather than by reading the resource first.
+
+    Args:
+        i: The resource identifier
+
+    Returns:
+        The list of acceptable versions, which is empty if no ETag provided can match, or None if the request is
+        unconditional
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    versions = []
+    for tag in request.if_match.as_set():
+        (tag_id, _, tag_version) = tag.partition('-')
+        if tag_id == str(i) and tag_version.isdigit():
+            versions.append(int(tag_version))
+    return versions
+
+
+def _conditional_failure(i, owner_id: Optional[int], missing_status: int) -> Tuple:
+    """Work out why a conditional UPDATE or DELETE did not affect the resource
+
+    Only called once the statement has failed, so the successful path does not pay for this SELECT.
+    """
+    row = db.session.query(Resource.owner_id, Resource.version).filter(Resource.id == i).one_or_none()
+    if row is None:
+        return {'status': missing_status, 'message': 'Unable to find requested resource'}, missing_status
+    if row[0] != owner_id:
+        return {'status': 401, 'message': 'You do not own this resource'}, 401
+    return {'status': 412, 'message': 'The resource has been modified in the meantime'}, 412, \
+        {'ETag': f'"{_resource_etag(i, row[1])}"'}
+
+
+def _encode_cursor(i: int) -> str:
+    """Encode the identifier of the last resource on a page into an opaque cursor
+
+    Args:
+        i: The identifier of the last resource returned on the current page
+
+    Returns:
+        An URL-safe, opaque cursor string the client passes back via the 'after' query parameter
+    """
+    return base64.urlsafe_b64encode(str(i).encode('ascii')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> Optional[int]:
+    """Decode an opaque cursor back into the identifier of the last resource the client has seen
+
+    Args:
+        cursor: The opaque cursor as previously issued by _encode_cursor
+
+    Returns:
+        The resource identifier or None if the cursor is malformed
+    """
+    try:
+        i = int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii'))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    return i if i >= 0 else None
+
+
+def _export() -> Response:
+    """Stream the entire resource collection as newline-delimited JSON
+
+    Rows are read from a server-side cursor in batches of RESOURCE_EXPORT_BATCH_SIZE and written out as they arrive,
+    so the memory held by the worker does not grow with the size of the table.
+    """
+    batch_size = current_app.config['RESOURCE_EXPORT_BATCH_SIZE']
+
+    def generate():
+        rows = ResourceRowSchema.query()\
+            .order_by(Resource.id)\
+            .execution_options(stream_results=True)\
+            .yield_per(batch_size)
+        for row in rows:
+            yield json.dumps(resource_row_schema.dump(row)) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @bp.route('/', methods=['GET'])
-@oidc.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-resource-read'])
+@auth.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-resource-read'])
+@db.reads_from_replica
 def get_all():
     identity = _extract_identity()
-    logger.info(f'Called by {identity[1]} ({identity[0]}')
-    a = Resource.query.all()
-    return {'resources': resources_schema.dump(a)}, 200
+    access_log.info('Called by %s (%s)', identity[1], identity[0])
+    if request.args.get('format') == 'ndjson' or \
+            request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson':
+        return _export()
+
+    #
+    # Keyset pagination on the primary key. We fetch one more row than requested to find out whether there is
+    # another page without issuing a separate COUNT
+
+    max_limit = current_app.config['RESOURCE_PAGE_SIZE_MAX']
+    try:
+        limit = int(request.args.get('limit', current_app.config['RESOURCE_PAGE_SIZE_DEFAULT']))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return {'status': 400, 'message': 'The limit must be a positive integer'}, 400
+    limit = min(limit, max_limit)
+
+    #
+    # Every write bumps the marker of its owner, so an unchanged sum of the markers means an unchanged page. Summing
+    # reads one marker row per owner
+
+    etag = _collection_etag(ChangeMarker.total('resources:'), limit, request.args.get('after'))
+    if request.if_none_match.contains_weak(etag):
+        return '', 304, {'ETag': f'"{etag}"'}
+
+    query = ResourceRowSchema.query()
+    if 'after' in request.args:
+        after = _decode_cursor(request.args['after'])
+        if after is None:
+            return {'status': 400, 'message': 'The provided cursor is invalid'}, 400
+        query = query.filter(Resource.id > after)
+    a = query.order_by(Resource.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(a) > limit:
+        a = a[:limit]
+        next_cursor = _encode_cursor(a[-1][0])
+    return {'resources': resource_rows_schema.dump(a), 'next': next_cursor}, 200, {'ETag': f'"{etag}"'}
 
 
 @bp.route('/<i>', methods=['GET'])
-@oidc.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-resource-read'])
+@auth.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-resource-read'])
+@db.reads_from_replica
 def get_one(i: int):
     identity = _extract_identity()
-    logger.info(f'Called by {identity[1]} ({identity[0]}')
-    resource = Resource.query.filter(Resource.id == i).first_or_404()
-    if resource is None:
-        return {'status': 404, 'message': f'Unable to find entry with identifier {i} in database'}, 404
-    return resource_schema.dump(resource), 200
+    access_log.info('Called by %s (%s)', identity[1], identity[0])
+    row = ResourceRowSchema.query().filter(Resource.id == i).first()
+    if row is None:
+        abort(404)
+    etag = _resource_etag(row[0], row[-1])
+    if request.if_none_match.contains_weak(etag):
+        return '', 304, {'ETag': f'"{etag}"'}
+    return resource_row_schema.dump(row), 200, {'ETag': f'"{etag}"'}
 
 
 @bp.route('/', methods=['POST'])
-@oidc.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-resource-write'])
+@auth.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-resource-write'])
 def create():
     (client_id, name) = _extract_identity()
-    logger.info(f'Called by {name} ({client_id}')
+    access_log.info('Called by %s (%s)', name, client_id)
     try:
         json_body = request.get_json()
         if not json_body:
@@ -75,60 +353,228 @@ def create():
         return ve.messages, 422
 
     #
-    # Check if we have a resource with the same name and owner already
+    # Look up the owner and create one if necessary. The unique index on owner and name detects duplicates as part
+    # of the INSERT, which saves a SELECT upfront and cannot be raced by a concurrent request
 
-    resource = Resource.query\
-        .filter(Resource.name == body['name'] and Resource.owner.client_id == client_id)\
-        .one_or_none()
-    if resource is not None:
-        return {'status': 409,
-                'message': f'A resource with the same name and owner already exists with id {resource.id}'}, 409
+    owner_id = _owner_id(client_id)
+    if owner_id is None:
+        owner_id = _create_owner(client_id, name)
+    for attempt in range(0, 2):
+        try:
+            resource = Resource(owner_id=owner_id, name=body['name'])
+            db.session.add(resource)
+            db.session.flush()
+            resource_id = resource.id
+            ChangeMarker.bump(_marker(owner_id))
+            db.session.commit()
+            break
+        except IntegrityError:
+            db.session.rollback()
+            recovered = _recover_owner(client_id, name, owner_id) if attempt == 0 else None
+            if recovered is not None:
+                owner_id = recovered
+                continue
+            existing = db.session.query(Resource.id)\
+                .join(Resource.owner)\
+                .filter(Owner.client_id == client_id, Resource.name == body['name'])\
+                .scalar()
+            if existing is None:
+                raise
+            return {'status': 409,
+                    'message': f'A resource with the same name and owner already exists with id {existing}'}, 409
+    return _dump_one(resource_id, 201)
+
+
+@bp.route('/batch', methods=['POST'])
+@auth.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-resource-write'])
+def create_batch():
+    (client_id, name) = _extract_identity()
+    access_log.info('Called by %s (%s)', name, client_id)
+    error = _batch_error()
+    if error is not None:
+        return error
+    json_body = request.get_json()
 
     #
-    # Look up the owner and create one if necessary
+    # Validate every item on its own, a bad item must not fail the entire batch
 
-    owner = Owner.query.filter(Owner.client_id == client_id).one_or_none()
-    if owner is None:
-        owner = Owner(client_id=client_id, name=name)
-        db.session.add(owner)
+    results: List[Optional[dict]] = [None] * len(json_body)
+    pending = {}
+    for idx, item in enumerate(json_body):
+        try:
+            body = resource_schema.load(item)
+        except ValidationError as ve:
+            results[idx] = {'status': 422, 'message': ve.messages}
+            continue
+        if body['name'] in pending:
+            results[idx] = {'status': 409, 'message': 'A resource with the same name is already part of this batch'}
+            continue
+        pending[body['name']] = idx
+
+    #
+    # Look up the owner once and create one if necessary. The owner is not loaded, since the caller is the owner
+
+    owner_id = _owner_id(client_id)
+    if owner_id is None:
+        owner_id = _create_owner(client_id, name)
+    for attempt in range(0, 2):
+
+        #
+        # Find the names this owner already uses with a single set-based query (per chunk of names)
 
-    resource = Resource(owner=owner, name=body['name'])
-    db.session.add(resource)
+        for chunk in _chunked(list(pending.keys())):
+            existing = db.session.query(Resource.id, Resource.name)\
+                .filter(Resource.owner_id == owner_id, Resource.name.in_(chunk))
+            for (existing_id, existing_name) in existing:
+                results[pending.pop(existing_name)] = {
+                    'status': 409,
+                    'message': f'A resource with the same name and owner already exists with id {existing_id}'}
+
+        #
+        # Insert the remainder within a single flush and commit once. The ORM batches the INSERTs into a single
+        # multi-row statement where the database driver supports it. A cached owner id which turned out to be stale
+        # fails the foreign key, in which case the owner is looked up or created again and the batch retried once
+
+        resources = {idx: Resource(owner_id=owner_id, name=resource_name) for (resource_name, idx) in pending.items()}
+        db.session.add_all(resources.values())
+        try:
+            db.session.flush()
+            break
+        except IntegrityError:
+            db.session.rollback()
+            recovered = _recover_owner(client_id, name, owner_id) if attempt == 0 else None
+            if recovered is None:
+                return {'status': 409, 'message': 'A concurrent request created resources with the same names'}, 409
+            owner_id = recovered
+
+    #
+    # The results are serialised before the commit expires the instances, which would otherwise cause one SELECT per
+    # resource to reload them. The owner is the caller
+
+    owner = {'id': owner_id, 'client_id': client_id, 'name': name}
+    for (idx, resource) in resources.items():
+        results[idx] = {'status': 201, 'resource': {'id': resource.id, 'owner': owner, 'name': resource.name}}
+    if resources:
+        ChangeMarker.bump(_marker(owner_id))
+    db.session.commit()
+    current_app.extensions['owner_cache'].put(client_id, owner_id)
+    return {'results': results}, 207
+
+
+@bp.route('/batch', methods=['PUT'])
+@auth.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-resource-write'])
+def modify_batch():
+    (client_id, name) = _extract_identity()
+    access_log.info('Called by %s (%s)', name, client_id)
+    error = _batch_error()
+    if error is not None:
+        return error
+    try:
+        body = resource_schema.load(request.get_json(), many=True)
+    except ValidationError as ve:
+        return ve.messages, 422
+    names: Dict[int, str] = {}
+    for item in body:
+        if 'id' not in item or 'name' not in item:
+            return {'status': 422, 'message': 'Every item requires an id and a name'}, 422
+        names[item['id']] = item['name']
+
+    #
+    # Rename everything the caller owns with a single UPDATE per chunk. The owner predicate is part of the
+    # statement so that ownership cannot change between classification and update
+
+    owner_id = _owner_id(client_id)
+    (owned, missing, not_owned) = _classify_ownership(list(names.keys()), owner_id)
+    try:
+        for chunk in _chunked(owned):
+            Resource.query\
+                .filter(Resource.owner_id == owner_id, Resource.id.in_(chunk))\
+                .update({Resource.name: case({i: names[i] for i in chunk}, value=Resource.id),
+                         Resource.version: Resource.version + 1},
+                        synchronize_session=False)
+    except IntegrityError:
+        db.session.rollback()
+        return {'status': 409, 'message': 'The new names collide with names of other resources you own'}, 409
+    if owned:
+        ChangeMarker.bump(_marker(owner_id))
     db.session.commit()
-    return resource_schema.dump(resource), 201
+    return {'modified': [{'id': i, 'name': names[i]} for i in owned],
+            'missing': missing,
+            'not_owned': not_owned}, 200
+
+
+@bp.route('/batch', methods=['DELETE'])
+@auth.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-resource-write'])
+def remove_batch():
+    (client_id, name) = _extract_identity()
+    access_log.info('Called by %s (%s)', name, client_id)
+    error = _batch_error()
+    if error is not None:
+        return error
+    ids = request.get_json()
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return {'status': 422, 'message': 'Expected an array of resource identifiers'}, 422
+    ids = list(dict.fromkeys(ids))
+
+    owner_id = _owner_id(client_id)
+    (owned, missing, not_owned) = _classify_ownership(ids, owner_id)
+    for chunk in _chunked(owned):
+        Resource.query\
+            .filter(Resource.owner_id == owner_id, Resource.id.in_(chunk))\
+            .delete(synchronize_session=False)
+    if owned:
+        ChangeMarker.bump(_marker(owner_id))
+    db.session.commit()
+    return {'removed': owned, 'missing': missing, 'not_owned': not_owned}, 200
 
 
 @bp.route('/<i>', methods=['PUT'])
-@oidc.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-resource-write'])
+@auth.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-resource-write'])
 def modify(i: int):
     (client_id, name) = _extract_identity()
-    logger.info(f'Called by {name} ({client_id}')
+    access_log.info('Called by %s (%s)', name, client_id)
     body = resource_schema.load(request.get_json())
 
-    resource = Resource.query.filter(Resource.id == i).one_or_none()
-    if resource is None:
-        return {'status': 404, 'message': 'Unable to find requested resource'}, 404
-    if resource.owner.client_id != client_id:
-        return {'status': 401, 'message': 'You do not own this resource'}, 401
-    resource.name = body['name']
+    #
+    # Ownership and, with If-Match, the version are checked by the UPDATE itself
 
-    db.session.add(resource)
+    versions = _if_match_versions(i)
+    if versions is not None and len(versions) == 0:
+        return {'status': 412, 'message': 'The resource has been modified in the meantime'}, 412
+    owner_id = _owner_id(client_id)
+    query = Resource.query.filter(Resource.id == i, Resource.owner_id == owner_id)
+    if versions is not None:
+        query = query.filter(Resource.version.in_(versions))
+    try:
+        updated = query.update({Resource.name: body['name'], Resource.version: Resource.version + 1},
+                               synchronize_session=False)
+    except IntegrityError:
+        db.session.rollback()
+        return {'status': 409, 'message': 'A resource with the same name and owner already exists'}, 409
+    if updated == 0:
+        db.session.rollback()
+        return _conditional_failure(i, owner_id, 404)
+    ChangeMarker.bump(_marker(owner_id))
     db.session.commit()
-    return resource_schema.dump(resource), 200
+    return _dump_one(i)
 
 
 @bp.route('/<i>', methods=['DELETE'])
-@oidc.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-resource-write'])
+@auth.accept_token(require_token=True, scopes_required=['mrmat-python-api-flask-resource-write'])
 def remove(i: int):
     (client_id, name) = _extract_identity()
-    logger.info(f'Called by {name} ({client_id}')
-
-    resource = Resource.query.filter(Resource.id == i).one_or_none()
-    if resource is None:
-        return {'status': 410, 'message': 'Unable to find requested resource'}, 410
-    if resource.owner.client_id != client_id:
-        return {'status': 401, 'message': 'You do not own this resource'}, 401
+    access_log.info('Called by %s (%s)', name, client_id)
 
-    db.session.delete(resource)
+    versions = _if_match_versions(i)
+    if versions is not None and len(versions) == 0:
+        return {'status': 412, 'message': 'The resource has been modified in the meantime'}, 412
+    owner_id = _owner_id(client_id)
+    query = Resource.query.filter(Resource.id == i, Resource.owner_id == owner_id)
+    if versions is not None:
+        query = query.filter(Resource.version.in_(versions))
+    if query.delete(synchronize_session=False) == 0:
+        db.session.rollback()
+        return _conditional_failure(i, owner_id, 410)
+    ChangeMarker.bump(_marker(owner_id))
     db.session.commit()
     return {}, 204
@@ -23,7 +23,9 @@
 """Resource API SQLAlchemy model
 """
 
-from sqlalchemy import ForeignKey, Column, Integer, String, UniqueConstraint, BigInteger
+from typing import Dict, List, Tuple, Union
+
+from sqlalchemy import ForeignKey, Column, Integer, String, BigInteger, Index, func
 from sqlalchemy.orm import relationship
 from marshmallow import fields
 
@@ -43,9 +45,41 @@ class Resource(db.Model):
     id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
     owner_id = Column(Integer, ForeignKey('owners.id'), nullable=False)
     name = Column(String(255), nullable=False)
+    version = Column(Integer, nullable=False, server_default='1')
 
     owner = relationship('Owner', back_populates='resources')
-    UniqueConstraint('owner_id', 'name', name='no_duplicate_names_per_owner')
+
+    __table_args__ = (Index('no_duplicate_names_per_owner', 'owner_id', 'name', unique=True),)
+    __mapper_args__ = {'version_id_col': version}
+
+
+class ChangeMarker(db.Model):
+    """A counter per collection that is incremented by every write to the collection
+
+    Comparing the marker is sufficient to find out whether a collection has changed, without reading the collection
+    itself. A collection written by many may be split into several markers sharing a prefix, so that concurrent
+    writers do not all wait for the lock on a single row. The sum of those markers changes with every write to any
+    of them.
+    """
+    __tablename__ = 'change_markers'
+    name = Column(String(64), primary_key=True)
+    version = Column(BigInteger().with_variant(Integer, 'sqlite'), nullable=False, default=0)
+
+    @classmethod
+    def bump(cls, name: str):
+        """Increment the marker of a collection as part of the current transaction"""
+        if cls.query.filter(cls.name == name).update({cls.version: cls.version + 1}, synchronize_session=False) == 0:
+            db.session.add(cls(name=name, version=1))
+
+    @classmethod
+    def current(cls, name: str) -> int:
+        """Return the current marker of a collection"""
+        return db.session.query(cls.version).filter(cls.name == name).scalar() or 0
+
+    @classmethod
+    def total(cls, prefix: str) -> int:
+        """Return the sum of the markers whose names start with a prefix"""
+        return db.session.query(func.sum(cls.version)).filter(cls.name.startswith(prefix)).scalar() or 0
 
 
 class OwnerSchema(ma.Schema):
@@ -67,7 +101,39 @@ class ResourceSchema(ma.Schema):
     name = fields.Str()
 
 
+class ResourceRowSchema:
+    """Serialises resources from plain row tuples rather than ORM instances
+
+    Reading only the columns that are serialised and turning each row into a dict directly skips both the construction
+    of ORM instances and the field-by-field marshmallow dump. The output is identical to that of ResourceSchema,
+    including the order of the keys.
+    """
+    columns = (Resource.id, Resource.name, Owner.id, Owner.client_id, Owner.name, Resource.version)
+
+    def __init__(self, many: bool = False):
+        self.many = many
+
+    @classmethod
+    def query(cls):
+        """Query for the columns serialised by this schema, which is filtered and ordered like any other query"""
+        return db.session.query(*cls.columns).join(Resource.owner)
+
+    @staticmethod
+    def _dump_row(row: Tuple) -> Dict:
+        (resource_id, resource_name, owner_id, owner_client_id, owner_name, _) = row
+        return {'id': resource_id,
+                'owner': {'id': owner_id, 'client_id': owner_client_id, 'name': owner_name},
+                'name': resource_name}
+
+    def dump(self, obj) -> Union[Dict, List[Dict]]:
+        if self.many:
+            return list(map(self._dump_row, obj))
+        return self._dump_row(obj)
+
+
 owner_schema = OwnerSchema()
 owners_schema = OwnerSchema(many=True)
 resource_schema = ResourceSchema()
 resources_schema = ResourceSchema(many=True)
+resource_row_schema = ResourceRowSchema()
+resource_rows_schema = ResourceRowSchema(many=True)
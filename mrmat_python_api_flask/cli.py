@@ -26,9 +26,9 @@
 import sys
 import argparse
 
-from flask_migrate import upgrade
-
 from mrmat_python_api_flask import __version__, create_app
+from mrmat_python_api_flask.server import Server
+from mrmat_python_api_flask.db_migrations import HEAD_REVISION, migrate, is_current
 
 
 def main() -> int:
@@ -37,7 +37,17 @@ def main() -> int:
     :return: Exit code
     """
     parser = argparse.ArgumentParser(description=f'mrmat-python-api-flask - {__version__}')
+    parser.add_argument('command',
+                        nargs='?',
+                        choices=['serve', 'migrate'],
+                        default='serve',
+                        help='Serve the app (the default) or only migrate the database')
     parser.add_argument('-d', '--debug', action='store_true', dest='debug', help='Debug')
+    parser.add_argument('--migrate',
+                        dest='migrate',
+                        action=argparse.BooleanOptionalAction,
+                        default=True,
+                        help='Migrate the database before serving if it is not migrated yet, otherwise refuse to serve')
     parser.add_argument('--host',
                         dest='host',
                         required=False,
@@ -48,6 +58,45 @@ def main() -> int:
                         required=False,
                         default=8080,
                         help='Port to bind to')
+    parser.add_argument('--dev',
+                        dest='dev',
+                        action='store_true',
+                        help='Run the single-process development server (implied by --debug)')
+    parser.add_argument('-w', '--workers',
+                        dest='workers',
+                        type=int,
+                        required=False,
+                        help='Number of worker processes (defaults to the number of cores)')
+    parser.add_argument('--threads',
+                        dest='threads',
+                        type=int,
+                        required=False,
+                        default=4,
+                        help='Number of threads per worker process')
+    parser.add_argument('--keep-alive',
+                        dest='keep_alive',
+                        type=int,
+                        required=False,
+                        default=5,
+                        help='Seconds to keep an idle client connection open')
+    parser.add_argument('--timeout',
+                        dest='timeout',
+                        type=int,
+                        required=False,
+                        default=30,
+                        help='Seconds after which an unresponsive worker is restarted')
+    parser.add_argument('--graceful-timeout',
+                        dest='graceful_timeout',
+                        type=int,
+                        required=False,
+                        default=30,
+                        help='Seconds workers are given to finish requests in flight when restarting or stopping')
+    parser.add_argument('--max-requests',
+                        dest='max_requests',
+                        type=int,
+                        required=False,
+                        default=0,
+                        help='Replace a worker after it served this many requests, 0 to never replace it')
     parser.add_argument('--instance-path',
                         dest='instance_path',
                         required=False,
@@ -58,6 +107,56 @@ def main() -> int:
                         required=False,
                         default=None,
                         help='Database URI')
+    parser.add_argument('--db-replica',
+                        dest='db_replica_uris',
+                        action='append',
+                        required=False,
+                        help='Database URI of a read replica, may be repeated')
+    parser.add_argument('--db-pool-size',
+                        dest='db_pool_size',
+                        type=int,
+                        required=False,
+                        help='Number of connections kept in the database connection pool')
+    parser.add_argument('--db-max-overflow',
+                        dest='db_max_overflow',
+                        type=int,
+                        required=False,
+                        help='Number of connections permitted beyond the database connection pool size')
+    parser.add_argument('--db-pool-timeout',
+                        dest='db_pool_timeout',
+                        type=int,
+                        required=False,
+                        help='Seconds to wait for a connection from the database connection pool')
+    parser.add_argument('--db-pool-recycle',
+                        dest='db_pool_recycle',
+                        type=int,
+                        required=False,
+                        help='Seconds after which a pooled database connection is replaced')
+    parser.add_argument('--db-pool-pre-ping',
+                        dest='db_pool_pre_ping',
+                        action=argparse.BooleanOptionalAction,
+                        required=False,
+                        help='Test pooled database connections for liveness before using them')
+    parser.add_argument('--db-sqlite-profile',
+                        dest='db_sqlite_profile',
+                        action=argparse.BooleanOptionalAction,
+                        required=False,
+                        help='Tune connections to a file-based SQLite database for concurrent workers')
+    parser.add_argument('--log-queue',
+                        dest='log_queue',
+                        action=argparse.BooleanOptionalAction,
+                        required=False,
+                        help='Write log records from a background thread')
+    parser.add_argument('--log-json',
+                        dest='log_json',
+                        action=argparse.BooleanOptionalAction,
+                        required=False,
+                        help='Log one JSON object per record')
+    parser.add_argument('--log-access-sample-rate',
+                        dest='log_access_sample_rate',
+                        type=float,
+                        required=False,
+                        help='Fraction of the access log lines to keep')
     parser.add_argument('--oidc-secrets',
                         dest='oidc_secrets',
                         required=False,
@@ -70,11 +169,42 @@ def main() -> int:
         overrides['OIDC_CLIENT_SECRETS'] = args.oidc_secrets
     if args.db is not None:
         overrides['SQLALCHEMY_DATABASE_URI'] = args.db
+    if args.db_replica_uris is not None:
+        overrides['DB_REPLICA_URIS'] = args.db_replica_uris
+    for (key, value) in {'DB_POOL_SIZE': args.db_pool_size,
+                         'DB_MAX_OVERFLOW': args.db_max_overflow,
+                         'DB_POOL_TIMEOUT': args.db_pool_timeout,
+                         'DB_POOL_RECYCLE': args.db_pool_recycle,
+                         'DB_POOL_PRE_PING': args.db_pool_pre_ping,
+                         'DB_SQLITE_PROFILE': args.db_sqlite_profile,
+                         'LOG_QUEUE': args.log_queue,
+                         'LOG_JSON': args.log_json,
+                         'LOG_ACCESS_SAMPLE_RATE': args.log_access_sample_rate}.items():
+        if value is not None:
+            overrides[key] = value
 
     app = create_app(config_override=overrides, instance_path=args.instance_path)
-    with app.app_context():
-        upgrade()
-    app.run(host=args.host, port=args.port, debug=args.debug)
+    if args.command == 'migrate':
+        migrate(app)
+        return 0
+    if args.migrate:
+        migrate(app)
+    else:
+        with app.app_context():
+            if not is_current():
+                app.logger.error('The database is not migrated to %s, refusing to serve', HEAD_REVISION)
+                return 1
+    if args.debug or args.dev:
+        app.run(host=args.host, port=args.port, debug=args.debug)
+    else:
+        Server(app, {'bind': f'{args.host}:{args.port}',
+                     'workers': args.workers,
+                     'threads': args.threads,
+                     'keepalive': args.keep_alive,
+                     'timeout': args.timeout,
+                     'graceful_timeout': args.graceful_timeout,
+                     'max_requests': args.max_requests,
+                     'max_requests_jitter': args.max_requests // 10}).run()
 
     return 0
 
@@ -26,14 +26,22 @@
 import os.path
 import sys
 import json
+import time
+import random
+import uuid
 from time import sleep
 from argparse import ArgumentParser, Namespace
 from typing import List, Optional, Dict
 import cli_ui
 from halo import Halo
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from mrmat_python_api_flask import __version__
+from mrmat_python_api_flask.client_cache import ClientCache, default_cache_dir, freshness, token_expiry, is_valid
+from mrmat_python_api_flask.client_load import OPERATIONS, DEFAULT_MIX, DEFAULT_MIX_WITHOUT_TOKEN, LoadPlan, \
+    parse_mix, run_threads, run_asyncio
 
 
 class ClientException(Exception):
@@ -46,27 +54,116 @@ class ClientException(Exception):
     msg: str
 
     def __init__(self, exit_code: int = 1, msg: str = 'Unknown Exception'):
-        Exception.__init__()
+        Exception.__init__(self, msg)
         self.exit_code = exit_code
         self.msg = msg
 
 
-def oidc_discovery(config: Dict) -> Dict:
-    resp = requests.get(config['discovery_url'])
-    if resp.status_code != 200:
+class JitteredRetry(Retry):
+    """A retry policy which backs off exponentially with full jitter
+
+    Waiting a random time between zero and the exponential backoff keeps many clients which failed at the same time
+    from retrying in lockstep.
+    """
+
+    def get_backoff_time(self) -> float:
+        return random.uniform(0, super().get_backoff_time())
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """An HTTP adapter which applies a default timeout to every request sent without one"""
+
+    def __init__(self, timeout, *args, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):     # pylint: disable=arguments-differ
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def make_session(config: Dict) -> requests.Session:
+    """Create the HTTP session shared by all requests of the client
+
+    Connections are pooled and kept alive between requests. Connection errors, 429 and transient server errors are
+    retried with exponential backoff and jitter, honouring any Retry-After header. The token endpoint is polled
+    with POST, which is safe to repeat, so POST is retried as well.
+
+    Args:
+        config: The client configuration, which may override the connect_timeout, read_timeout, retries, backoff
+                and pool_size defaults
+
+    Returns:
+        The session, which should be closed after use
+    """
+    retry = JitteredRetry(total=config.get('retries', 3),
+                          backoff_factor=config.get('backoff', 0.5),
+                          status_forcelist=[429, 502, 503, 504],
+                          allowed_methods=['HEAD', 'GET', 'PUT', 'DELETE', 'OPTIONS', 'POST'],
+                          raise_on_status=False)
+    adapter = TimeoutHTTPAdapter(timeout=(config.get('connect_timeout', 5), config.get('read_timeout', 30)),
+                                 max_retries=retry,
+                                 pool_connections=config.get('pool_size', 10),
+                                 pool_maxsize=config.get('pool_size', 10))
+    session = requests.Session()
+    session.headers['User-Agent'] = f'mrmat-python-api-flask-client/{__version__}'
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def oidc_discovery(session: requests.Session, config: Dict, entry: Optional[Dict] = None) -> Dict:
+    """Return the discovery document of the identity provider
+
+    The document is cached in the provided cache entry for as long as the identity provider allows. Once stale, it is
+    revalidated with a conditional request.
+
+    Args:
+        session: The HTTP session
+        config: The client configuration
+        entry: Optional cache entry, which is updated in place
+
+    Returns:
+        The discovery document
+    """
+    entry = entry if entry is not None else {}
+    cached = entry.get('discovery')
+    if cached is not None and cached['fresh_until'] > time.time():
+        return cached['document']
+    headers = {}
+    if cached is not None and cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if cached is not None and cached.get('last_modified'):
+        headers['If-Modified-Since'] = cached['last_modified']
+    resp = session.get(config['discovery_url'], headers=headers)
+    if resp.status_code == 304 and cached is not None:
+        data = cached['document']
+    elif resp.status_code != 200:
         raise ClientException(exit_code=1, msg=f'Unexpected response {resp.status_code} from discovery endpoint')
-    try:
-        data = resp.json()
-    except ValueError as ve:
-        raise ClientException(exit_code=1, msg='Unable to parse response from discovery endpoint into JSON') from ve
+    else:
+        try:
+            data = resp.json()
+        except ValueError as ve:
+            raise ClientException(exit_code=1,
+                                  msg='Unable to parse response from discovery endpoint into JSON') from ve
+    fresh_until = freshness(resp.headers)
+    if fresh_until is None:
+        entry.pop('discovery', None)
+    else:
+        entry['discovery'] = {'document': data,
+                              'fresh_until': fresh_until,
+                              'etag': resp.headers.get('ETag', cached.get('etag') if cached else None),
+                              'last_modified': resp.headers.get('Last-Modified',
+                                                                cached.get('last_modified') if cached else None)}
     return data
 
 
-def oidc_device_auth(config: Dict, discovery: Dict) -> Dict:
-    resp = requests.post(url=discovery['device_authorization_endpoint'],
-                         data={'client_id': config['client_id'],
-                               'client_secret': config['client_secret'],
-                               'scope': ['openid', 'profile']})
+def oidc_device_auth(session: requests.Session, config: Dict, discovery: Dict) -> Dict:
+    resp = session.post(url=discovery['device_authorization_endpoint'],
+                        data={'client_id': config['client_id'],
+                              'client_secret': config['client_secret'],
+                              'scope': ['openid', 'profile']})
     if resp.status_code != 200:
         raise ClientException(exit_code=1, msg=f'Unexpected response {resp.status_code} from device endpoint')
     try:
@@ -76,32 +173,74 @@ def oidc_device_auth(config: Dict, discovery: Dict) -> Dict:
     return data
 
 
-@Halo(text='Checking authentication')
-def oidc_check_auth(config: Dict, discovery: Dict, device_auth: Dict):
-    wait = 5
-    stop = False
-    while not stop:
-        resp = requests.post(url=discovery['token_endpoint'],
-                             data={'grant_type': 'urn:ietf:params:oauth:grant-type:device_code',
-                                   'device_code': device_auth['device_code'],
-                                   'client_id': config['client_id'],
-                                   'client_secret': config['client_secret']})  # client_secret only for keycloak
-        if resp.status_code == 400:
+def oidc_check_auth(session: requests.Session, config: Dict, discovery: Dict, device_auth: Dict) -> Dict:
+    """Poll the token endpoint until the user has completed the device authorization
+
+    The token endpoint is polled no more often than the interval the identity provider asks for, and less often
+    whenever it asks to slow down.
+
+    Args:
+        session: The HTTP session
+        config: The client configuration
+        discovery: The discovery document of the identity provider
+        device_auth: The response of the device authorization endpoint
+
+    Returns:
+        The token response
+    """
+    interval = device_auth.get('interval', 5)
+    deadline = time.monotonic() + device_auth['expires_in']
+    # Halo detects its environment when it is created, which imports IPython if it is installed, so it is only
+    # created once it is needed
+    with Halo(text='Checking authentication'):
+        while time.monotonic() < deadline:
+            sleep(interval)
+            resp = session.post(url=discovery['token_endpoint'],
+                                data={'grant_type': 'urn:ietf:params:oauth:grant-type:device_code',
+                                      'device_code': device_auth['device_code'],
+                                      'client_id': config['client_id'],
+                                      'client_secret': config['client_secret']})  # client_secret only for keycloak
+            if resp.status_code == 200:
+                return resp.json()
+            if resp.status_code != 400:
+                raise ClientException(msg=f'Unexpected response {resp.status_code} from token endpoint')
             body = resp.json()
             if body['error'] == 'authorization_pending':
                 continue
-            elif body['error'] == 'slow_down':
-                wait += 5
+            if body['error'] == 'slow_down':
+                interval += 5
                 continue
-            elif body['error'] == 'access_denied':
+            if body['error'] == 'access_denied':
                 raise ClientException(msg='Access denied')
-            elif body['error'] == 'expired_token':
+            if body['error'] == 'expired_token':
                 raise ClientException(msg='Token expired')
-            else:
-                raise ClientException(msg=body['error_description'])
-        elif resp.status_code == 200:
-            return resp.json()
-        sleep(wait)
+            raise ClientException(msg=body.get('error_description', body['error']))
+    raise ClientException(msg='Token expired')
+
+
+def oidc_refresh(session: requests.Session, config: Dict, discovery: Dict, token: Dict) -> Optional[Dict]:
+    """Obtain a new token using the refresh token of a previous one
+
+    Args:
+        session: The HTTP session
+        config: The client configuration
+        discovery: The discovery document of the identity provider
+        token: The previous token response
+
+    Returns:
+        The new token response, None if the refresh token was refused
+    """
+    resp = session.post(url=discovery['token_endpoint'],
+                        data={'grant_type': 'refresh_token',
+                              'refresh_token': token['refresh_token'],
+                              'client_id': config['client_id'],
+                              'client_secret': config['client_secret']})  # client_secret only for keycloak
+    if resp.status_code != 200:
+        return None
+    refreshed = resp.json()
+    # Identity providers which do not rotate refresh tokens do not return one when refreshing
+    refreshed.setdefault('refresh_token', token['refresh_token'])
+    return refreshed
 
 
 def parse_args(argv: List[str]) -> Optional[Namespace]:
@@ -143,6 +282,84 @@ def parse_args(argv: List[str]) -> Optional[Namespace]:
                                      dest='discovery_url',
                                      required=False,
                                      help='Discovery of endpoints in the authentication platform')
+
+    config_group_cache = parser.add_argument_group(title='Cache',
+                                                   description='Configure the cache of tokens and discovery')
+    config_group_cache.add_argument('--cache-dir',
+                                    dest='cache_dir',
+                                    required=False,
+                                    help=f'Directory to cache tokens and discovery in (default {default_cache_dir()})')
+    config_group_cache.add_argument('--no-cache',
+                                    dest='no_cache',
+                                    action='store_true',
+                                    default=None,
+                                    help='Neither use nor update the cache')
+
+    config_group_http = parser.add_argument_group(title='Connection',
+                                                  description='Configure how the client connects')
+    config_group_http.add_argument('--connect-timeout',
+                                   dest='connect_timeout',
+                                   type=float,
+                                   required=False,
+                                   help='Seconds to wait for a connection to be established (default 5)')
+    config_group_http.add_argument('--read-timeout',
+                                   dest='read_timeout',
+                                   type=float,
+                                   required=False,
+                                   help='Seconds to wait for a response (default 30)')
+    config_group_http.add_argument('--retries',
+                                   dest='retries',
+                                   type=int,
+                                   required=False,
+                                   help='Number of retries of failed connections and transient errors (default 3)')
+    config_group_http.add_argument('--backoff',
+                                   dest='backoff',
+                                   type=float,
+                                   required=False,
+                                   help='Backoff factor in seconds between retries, doubled for every retry and '
+                                        'jittered (default 0.5)')
+
+    commands = parser.add_subparsers(dest='command', title='Commands',
+                                     description='Without a command, the Greeting API v3 is called once')
+    load_parser = commands.add_parser('load', help='Generate load against a server and report its latencies')
+    load_parser.add_argument('--url',
+                             dest='url',
+                             default='http://127.0.0.1:5000',
+                             help='The URL of the server (default http://127.0.0.1:5000)')
+    load_parser.add_argument('-n', '--concurrency',
+                             dest='concurrency',
+                             type=int,
+                             default=10,
+                             help='Number of concurrent workers (default 10)')
+    load_parser.add_argument('--model',
+                             dest='model',
+                             choices=['threads', 'asyncio'],
+                             default='threads',
+                             help='Whether the workers are threads or asyncio tasks (default threads)')
+    load_parser.add_argument('--mix',
+                             dest='mix',
+                             required=False,
+                             help=f'Weighted operations to issue, from {", ".join(OPERATIONS.keys())} '
+                                  f'(default {DEFAULT_MIX}, or {DEFAULT_MIX_WITHOUT_TOKEN} with --no-auth)')
+    load_parser.add_argument('--rate',
+                             dest='rate',
+                             type=float,
+                             default=0,
+                             help='Requests per second to issue in total, 0 for as many as possible (default 0)')
+    load_parser.add_argument('--duration',
+                             dest='duration',
+                             type=float,
+                             default=10,
+                             help='Seconds to generate load for (default 10)')
+    load_parser.add_argument('--no-auth',
+                             dest='no_auth',
+                             action='store_true',
+                             default=None,
+                             help='Do not authenticate, for servers without authentication')
+    load_parser.add_argument('--token',
+                             dest='token',
+                             required=False,
+                             help='Bearer token to use instead of authenticating')
     return parser.parse_args(argv)
 
 
@@ -174,41 +391,174 @@ def main(argv=None) -> int:
             config[key] = config_override[key]
 
     try:
-        discovery = oidc_discovery(config)
-        if 'device_authorization_endpoint' not in discovery:
-            raise ClientException(msg='No device_authorization_endpoint in discovery')
-        if 'token_endpoint' not in discovery:
-            raise ClientException(msg='No token_endpoint in discovery')
-
-        device_auth = oidc_device_auth(config, discovery)
-        if 'device_code' not in device_auth:
-            raise ClientException(msg='No device_code in device auth')
-        if 'user_code' not in device_auth:
-            raise ClientException(msg='No user_code in device auth')
-        if 'verification_uri' not in device_auth:
-            raise ClientException(msg='No verification_uri in device_auth')
-        if 'expires_in' not in device_auth:
-            raise ClientException(msg='No expires_in in device_auth')
-
-        # Adding the user code to the URL is convenient, but not as secure as it could be
-        cli_ui.info(f'Please visit {device_auth["verification_uri"]} within {device_auth["expires_in"]} seconds and '
-                    f'enter code {device_auth["user_code"]}. Or just visit {device_auth["verification_uri_complete"]}')
-
-        auth = oidc_check_auth(config, discovery, device_auth)
-        cli_ui.info('Authenticated')
+        cache = None if config.get('no_cache') else ClientCache(config.get('cache_dir') or default_cache_dir())
+        with make_session(config) as session:
+            if config.get('command') == 'load':
+                return load(session, config, cache)
+            return run(session, config, cache)
+    except ClientException as ce:
+        cli_ui.error(ce.msg)
+        return ce.exit_code
+    except requests.RequestException as re:
+        cli_ui.error(f'Unable to communicate: {re}')
+        return 1
+
+
+def authenticate(session: requests.Session, config: Dict, entry: Dict) -> Dict:
+    """Obtain a token, from the cache entry if it holds a valid one
+
+    A cached token which expired is refreshed if possible. Only if that fails is the user asked to authenticate.
+
+    Args:
+        session: The HTTP session
+        config: The client configuration
+        entry: The cache entry, which is updated in place
+
+    Returns:
+        The token response
+    """
+    cached = entry.get('token')
+    if is_valid(cached):
+        return cached
+
+    discovery = oidc_discovery(session, config, entry)
+    if 'device_authorization_endpoint' not in discovery:
+        raise ClientException(msg='No device_authorization_endpoint in discovery')
+    if 'token_endpoint' not in discovery:
+        raise ClientException(msg='No token_endpoint in discovery')
+
+    if cached is not None and cached.get('refresh_token') and \
+            (cached.get('refresh_expires_at') is None or is_valid(cached, 'refresh_expires_at')):
+        refreshed = oidc_refresh(session, config, discovery, cached)
+        if refreshed is not None:
+            entry['token'] = token_expiry(refreshed)
+            return entry['token']
+
+    device_auth = oidc_device_auth(session, config, discovery)
+    if 'device_code' not in device_auth:
+        raise ClientException(msg='No device_code in device auth')
+    if 'user_code' not in device_auth:
+        raise ClientException(msg='No user_code in device auth')
+    if 'verification_uri' not in device_auth:
+        raise ClientException(msg='No verification_uri in device_auth')
+    if 'expires_in' not in device_auth:
+        raise ClientException(msg='No expires_in in device_auth')
+
+    # Adding the user code to the URL is convenient, but not as secure as it could be
+    cli_ui.info(f'Please visit {device_auth["verification_uri"]} within {device_auth["expires_in"]} seconds and '
+                f'enter code {device_auth["user_code"]}. Or just visit {device_auth["verification_uri_complete"]}')
+
+    entry['token'] = token_expiry(oidc_check_auth(session, config, discovery, device_auth))
+    cli_ui.info('Authenticated')
+    return entry['token']
+
+
+def run(session: requests.Session, config: Dict, cache: Optional[ClientCache] = None) -> int:
+    """Authenticate and call the API
+
+    Args:
+        session: The HTTP session
+        config: The client configuration
+        cache: Optional cache of tokens and discovery
+
+    Returns:
+        Exit code 0 for success
+    """
+    entry = cache.load(config['discovery_url'], config['client_id']) if cache is not None else {}
+    original = json.dumps(entry, sort_keys=True)
+    try:
+        auth = authenticate(session, config, entry)
 
         #
         # We're using requests directly here because requests_oauthlib doesn't support device code flow directly
 
-        resp = requests.get('http://127.0.0.1:5000/api/greeting/v3/',
-                            headers={'Authorization': f'Bearer {auth["id_token"]}'})
+        resp = session.get('http://127.0.0.1:5000/api/greeting/v3/',
+                           headers={'Authorization': f'Bearer {auth["id_token"]}'})
+        if resp.status_code == 401:
+            # The token may have been revoked, it is of no further use
+            entry.pop('token', None)
         cli_ui.info(f'Status Code: {resp.status_code}')
         cli_ui.info(resp.content)
-
         return 0
-    except ClientException as ce:
-        cli_ui.error(ce.msg)
-        return ce.exit_code
+    finally:
+        if cache is not None and json.dumps(entry, sort_keys=True) != original:
+            cache.save(config['discovery_url'], config['client_id'], entry)
+
+
+def load(session: requests.Session, config: Dict, cache: Optional[ClientCache] = None) -> int:
+    """Generate load against a server and report the throughput and latencies by operation
+
+    Resources created while generating load are removed again afterwards, and any which cannot be removed are reported.
+    The load itself is generated on a separate session which does not retry, since retries would hide failed requests
+    and add their backoff to the latency of a single request.
+
+    Args:
+        session: The HTTP session used to authenticate and to remove the resources created
+        config: The client configuration
+        cache: Optional cache of tokens and discovery
+
+    Returns:
+        Exit code 0 if all requests succeeded and all resources created were removed
+    """
+    headers = {}
+    if config.get('token'):
+        headers['Authorization'] = f'Bearer {config["token"]}'
+    elif not config.get('no_auth'):
+        entry = cache.load(config['discovery_url'], config['client_id']) if cache is not None else {}
+        headers['Authorization'] = f'Bearer {authenticate(session, config, entry)["id_token"]}'
+        if cache is not None:
+            cache.save(config['discovery_url'], config['client_id'], entry)
+    try:
+        mix = parse_mix(config.get('mix') or (DEFAULT_MIX if headers else DEFAULT_MIX_WITHOUT_TOKEN))
+    except ValueError as ve:
+        raise ClientException(msg=str(ve)) from ve
+    unauthorised = [name for name in mix.keys() if OPERATIONS[name].needs_token and not headers]
+    if unauthorised:
+        raise ClientException(msg=f'Without a token, {", ".join(unauthorised)} cannot be issued')
+
+    url = config['url'].rstrip('/')
+    plan = LoadPlan(mix, concurrency=config['concurrency'], rate=config['rate'], duration=config['duration'])
+    created = []
+    load_config = dict(config, retries=0, pool_size=max(config.get('pool_size', 10), plan.concurrency))
+    try:
+        with make_session(load_config) as load_session:
+            if 'resource_get' in mix:
+                resp = load_session.post(f'{url}/api/resource/v1/', json={'name': f'load-seed-{uuid.uuid4().hex}'},
+                                         headers=headers)
+                if resp.status_code != 201:
+                    raise ClientException(msg=f'Unexpected response {resp.status_code} creating a resource to read')
+                plan.resource_id = resp.json()['id']
+                created.append(plan.resource_id)
+            cli_ui.info(f'Generating load against {url} for {plan.duration}s with {plan.concurrency} '
+                        f'{config["model"]}')
+            if config['model'] == 'asyncio':
+                result = run_asyncio(url, plan, headers, timeout=(config.get('connect_timeout', 5),
+                                                                  config.get('read_timeout', 30)))
+            else:
+                result = run_threads(url, plan, load_session, headers)
+            created.extend(result.created)
+    finally:
+        leftover = []
+        for idx in range(0, len(created), 1000):
+            chunk = created[idx:idx + 1000]
+            try:
+                resp = session.delete(f'{url}/api/resource/v1/batch', json=chunk, headers=headers)
+                gone = set(resp.json()['removed'] + resp.json()['missing']) if resp.status_code == 200 else set()
+            except (requests.RequestException, ValueError, KeyError):
+                gone = set()
+            leftover.extend(resource_id for resource_id in chunk if resource_id not in gone)
+        if leftover:
+            cli_ui.warning(f'Unable to remove {len(leftover)} resources created while generating load, ids: '
+                           f'{", ".join(str(resource_id) for resource_id in leftover)}')
+
+    summary = result.summary()
+    # cli_ui expects every cell to be a sequence of tokens
+    cli_ui.info_table([[[row['operation']], [str(row['requests'])], [str(row['errors'])],
+                        [f'{row["throughput"]:.1f}'], [f'{row["p50"] * 1e3:.1f}'], [f'{row["p95"] * 1e3:.1f}'],
+                        [f'{row["p99"] * 1e3:.1f}']]
+                       for row in summary],
+                      headers=['operation', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'])
+    return 0 if summary[-1]['errors'] == 0 and not leftover else 1
 
 
 if __name__ == '__main__':
@@ -0,0 +1,209 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""On-disk cache of the client for tokens and the discovery document
+
+Tokens are credentials, so a cache directory created by the client is only accessible by its owner, every entry is
+written with mode 0600 and entries which are accessible by anybody else are ignored.
+"""
+
+import os
+import re
+import json
+import time
+import stat
+import hashlib
+import tempfile
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Mapping
+
+import cli_ui
+
+#: Seconds before its expiry at which a token is no longer used
+EXPIRY_LEEWAY = 30
+
+#: Upper bound of the heuristic freshness of a response without explicit expiry
+HEURISTIC_FRESHNESS_MAX = 24 * 3600
+
+
+def default_cache_dir() -> str:
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                        'mrmat-python-api-flask-client')
+
+
+class ClientCache:
+    """A directory of cache entries, one JSON file per discovery URL and client_id
+
+    An entry holds the discovery document under 'discovery' and the last token response under 'token'. Entries are
+    written to a temporary file first and then renamed, so that concurrent invocations never read a partial entry.
+
+    The directory is only created once the first entry is saved, and permissions of an existing directory are left
+    alone. If the cache cannot be read or written, a warning is shown once and the client carries on without it.
+    """
+    directory: str
+    disabled: bool
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.disabled = False
+
+    def _disable(self, error: OSError):
+        if not self.disabled:
+            cli_ui.warning(f'Continuing without the cache in {self.directory}: {error}')
+        self.disabled = True
+
+    def _make_directory(self):
+        try:
+            os.makedirs(self.directory, mode=0o700)
+        except FileExistsError:
+            return
+        # The mode passed to makedirs is subject to the umask
+        os.chmod(self.directory, 0o700)
+
+    def _path(self, discovery_url: str, client_id: str) -> str:
+        key = hashlib.sha256(f'{discovery_url}\0{client_id}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{key}.json')
+
+    def load(self, discovery_url: str, client_id: str) -> Dict:
+        """Return the entry for a discovery URL and client_id
+
+        Args:
+            discovery_url: The discovery URL of the identity provider
+            client_id: The client_id of the client
+
+        Returns:
+            The entry, empty if there is none or it cannot be trusted
+        """
+        if self.disabled:
+            return {}
+        path = self._path(discovery_url, client_id)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                st = os.fstat(f.fileno())
+                if st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077:
+                    return {}
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        except OSError as oe:
+            self._disable(oe)
+            return {}
+
+    def save(self, discovery_url: str, client_id: str, entry: Dict):
+        if self.disabled:
+            return
+        path = self._path(discovery_url, client_id)
+        try:
+            self._make_directory()
+            (fd, tmp) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        except OSError as oe:
+            self._disable(oe)
+            return
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)
+        except OSError as oe:
+            os.remove(tmp)
+            self._disable(oe)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+
+def freshness(headers: Mapping[str, str], now: Optional[float] = None) -> Optional[float]:
+    """Return until when a response may be used without revalidation, following HTTP caching semantics
+
+    Explicit expiry from Cache-Control max-age or Expires takes precedence. Without it, a response with a Last-Modified
+    header is considered fresh for a tenth of its age, capped at a day.
+
+    Args:
+        headers: The headers of the response
+        now: Optional epoch timestamp of the response, defaults to the current time
+
+    Returns:
+        The epoch timestamp until which the response is fresh, or None if it must not be stored at all
+    """
+    now = now if now is not None else time.time()
+    cache_control = {}
+    for directive in headers.get('Cache-Control', '').split(','):
+        (name, _, value) = directive.strip().partition('=')
+        if name:
+            cache_control[name.lower()] = value.strip('"')
+    if 'no-store' in cache_control:
+        return None
+    if 'no-cache' in cache_control:
+        return now
+    age = int(headers['Age']) if re.fullmatch(r'\d+', headers.get('Age', '')) else 0
+    if re.fullmatch(r'\d+', cache_control.get('max-age', '')):
+        return now + int(cache_control['max-age']) - age
+    date = _parse_date(headers.get('Date')) or now
+    if 'Expires' in headers:
+        expires = _parse_date(headers['Expires'])
+        return now + expires - date - age if expires is not None else now
+    last_modified = _parse_date(headers.get('Last-Modified'))
+    if last_modified is not None and last_modified < date:
+        return now + min((date - last_modified) / 10, HEURISTIC_FRESHNESS_MAX) - age
+    return now
+
+
+def token_expiry(token: Dict, now: Optional[float] = None) -> Dict:
+    """Return a token response with the epoch timestamps at which its tokens expire added
+
+    Args:
+        token: The token response
+        now: Optional epoch timestamp of the response, defaults to the current time
+
+    Returns:
+        The token response with expires_at and, if known, refresh_expires_at
+    """
+    now = now if now is not None else time.time()
+    token = dict(token)
+    token['expires_at'] = now + int(token.get('expires_in', 0))
+    if token.get('refresh_expires_in'):
+        token['refresh_expires_at'] = now + int(token['refresh_expires_in'])
+    return token
+
+
+def is_valid(token: Optional[Dict], key: str = 'expires_at', now: Optional[float] = None) -> bool:
+    """Return whether a cached token is valid for a while longer
+
+    Args:
+        token: The cached token response, if any
+        key: The expiry to check, 'expires_at' for the access token or 'refresh_expires_at' for the refresh token
+        now: Optional epoch timestamp to check against, defaults to the current time
+
+    Returns:
+        True if the token does not expire within the next EXPIRY_LEEWAY seconds
+    """
+    if not token or token.get(key) is None:
+        return False
+    return token[key] - EXPIRY_LEEWAY > (now if now is not None else time.time())
+
+
+def _parse_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,302 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Load generation against a running server
+
+A number of workers, either threads sharing a pooled requests session or asyncio tasks sharing an aiohttp session,
+issue a weighted mix of requests for a given duration. If a rate is given, requests are issued on a fixed schedule
+regardless of how quickly the server responds, and latencies are measured from the time a request was scheduled
+rather than the time it was sent. A server falling behind then shows in the latencies instead of silently lowering the
+rate of requests.
+"""
+
+import math
+import time
+import uuid
+import random
+import asyncio
+import itertools
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+
+class Operation:
+    """A kind of request issued by the load generator"""
+    name: str
+    method: str
+    path: str
+    needs_token: bool
+
+    def __init__(self, name: str, method: str, path: str, needs_token: bool = False):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.needs_token = needs_token
+
+    def request(self, plan: 'LoadPlan') -> Tuple[str, str, Optional[Dict]]:
+        """Return the method, path and body of a request
+
+        Args:
+            plan: The load plan, which holds the resource read by resource_get
+
+        Returns:
+            A tuple of the method, path and JSON body, if any
+        """
+        body = {'name': f'load-{uuid.uuid4().hex}'} if self.method == 'POST' else None
+        return self.method, self.path.format(resource_id=plan.resource_id), body
+
+
+OPERATIONS: Dict[str, Operation] = {op.name: op for op in [
+    Operation('greeting_v1', 'GET', '/api/greeting/v1/'),
+    Operation('greeting_v2', 'GET', '/api/greeting/v2/?name=load'),
+    Operation('greeting_v3', 'GET', '/api/greeting/v3/', needs_token=True),
+    Operation('resource_list', 'GET', '/api/resource/v1/?limit=100', needs_token=True),
+    Operation('resource_get', 'GET', '/api/resource/v1/{resource_id}', needs_token=True),
+    Operation('resource_create', 'POST', '/api/resource/v1/', needs_token=True)
+]}
+
+#: The mix issued unless configured otherwise, depending on whether a token is available
+DEFAULT_MIX = 'greeting_v1=1,greeting_v2=1,greeting_v3=1,resource_list=1,resource_get=1'
+DEFAULT_MIX_WITHOUT_TOKEN = 'greeting_v1=1,greeting_v2=1'
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse a request mix of the form 'greeting_v1=3,resource_get=1'
+
+    Args:
+        spec: Comma-separated operations with an optional weight, which defaults to 1
+
+    Returns:
+        A dictionary of operation names and their weights
+
+    Raises:
+        ValueError: If an operation is unknown or a weight is not a positive number
+    """
+    mix = {}
+    for item in spec.split(','):
+        (name, _, weight) = item.strip().partition('=')
+        if name not in OPERATIONS:
+            raise ValueError(f'Unknown operation {name}, expected one of {", ".join(OPERATIONS.keys())}')
+        mix[name] = float(weight) if weight else 1.0
+        if mix[name] <= 0:
+            raise ValueError(f'The weight of {name} must be positive')
+    return mix
+
+
+class LoadPlan:
+    """What the workers issue, for how long and at which rate"""
+    mix: Dict[str, float]
+    concurrency: int
+    rate: float
+    duration: float
+    resource_id: Optional[int]
+
+    def __init__(self, mix: Dict[str, float], concurrency: int, rate: float, duration: float):
+        self.mix = mix
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.resource_id = None
+        self._operations = [OPERATIONS[name] for name in mix.keys()]
+        self._weights = list(mix.values())
+        self._slots = itertools.count()
+        self.start = self.end = 0.0
+
+    def begin(self):
+        self.start = time.monotonic()
+        self.end = self.start + self.duration
+        self._slots = itertools.count()
+
+    def next_slot(self) -> Optional[float]:
+        """Return the time at which the next request is due, None once the duration is over
+
+        Safe to call from several threads, since taking the next value of an itertools.count holds the GIL.
+        """
+        due = self.start + next(self._slots) / self.rate if self.rate > 0 else time.monotonic()
+        return due if due < self.end else None
+
+    def choose(self, rng: random.Random) -> Operation:
+        return rng.choices(self._operations, weights=self._weights)[0]
+
+
+class LoadResult:
+    """Latencies and outcomes of the requests issued, by operation
+
+    Every worker records into its own result, which are merged once all workers finished.
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.created: List[int] = []
+        self.elapsed = 0.0
+
+    def record(self, operation: str, status: Optional[int], latency: float):
+        self.latencies[operation].append(latency)
+        self.statuses[operation][status] += 1
+
+    def merge(self, other: 'LoadResult'):
+        for (operation, latencies) in other.latencies.items():
+            self.latencies[operation].extend(latencies)
+        for (operation, statuses) in other.statuses.items():
+            self.statuses[operation].update(statuses)
+        self.created.extend(other.created)
+
+    def summary(self) -> List[Dict]:
+        """Summarise the result by operation and in total
+
+        Requests which failed to complete or completed with a status of 400 or above count as errors.
+
+        Returns:
+            A list of dictionaries with the operation, the number of requests and errors, the throughput in requests
+            per second and the p50, p95 and p99 latencies in seconds
+        """
+        rows = []
+        for operation in sorted(self.latencies.keys()):
+            rows.append(self._row(operation, self.latencies[operation], self.statuses[operation]))
+        rows.append(self._row('total',
+                              list(itertools.chain.from_iterable(self.latencies.values())),
+                              sum(self.statuses.values(), Counter())))
+        return rows
+
+    def _row(self, operation: str, latencies: List[float], statuses: Counter) -> Dict:
+        latencies = sorted(latencies)
+        return {'operation': operation,
+                'requests': len(latencies),
+                'errors': sum(count for (status, count) in statuses.items() if status is None or status >= 400),
+                'throughput': len(latencies) / self.elapsed if self.elapsed > 0 else 0.0,
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99)}
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Return the p-th percentile of sorted values using the nearest-rank method"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def run_threads(base_url: str, plan: LoadPlan, session: requests.Session, headers: Dict) -> LoadResult:
+    """Issue the planned load from a pool of threads sharing a session
+
+    Args:
+        base_url: The URL of the server, without a trailing slash
+        plan: The load plan
+        session: A session whose connection pool holds at least as many connections as there are workers
+        headers: Headers to send along with every request
+
+    Returns:
+        The merged result of all workers
+    """
+    def worker(result: LoadResult, seed: int):
+        rng = random.Random(seed)
+        while True:
+            due = plan.next_slot()
+            if due is None:
+                return
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            operation = plan.choose(rng)
+            (method, path, body) = operation.request(plan)
+            status = None
+            try:
+                resp = session.request(method, base_url + path, json=body, headers=headers)
+                status = resp.status_code
+                if method == 'POST' and status == 201:
+                    result.created.append(resp.json()['id'])
+            except (requests.RequestException, ValueError):
+                pass
+            result.record(operation.name, status, time.monotonic() - due)
+
+    results = [LoadResult() for _ in range(0, plan.concurrency)]
+    threads = [threading.Thread(target=worker, args=(result, seed), daemon=True)
+               for (seed, result) in enumerate(results)]
+    plan.begin()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return _merge(plan, results)
+
+
+def run_asyncio(base_url: str, plan: LoadPlan, headers: Dict, timeout: Tuple[float, float] = (5, 30)) -> LoadResult:
+    """Issue the planned load from asyncio tasks sharing an aiohttp session
+
+    Args:
+        base_url: The URL of the server, without a trailing slash
+        plan: The load plan
+        headers: Headers to send along with every request
+        timeout: The connect and read timeouts in seconds
+
+    Returns:
+        The merged result of all workers
+    """
+    return asyncio.run(_run_asyncio(base_url, plan, headers, timeout))
+
+
+async def _run_asyncio(base_url: str, plan: LoadPlan, headers: Dict, timeout: Tuple[float, float]) -> LoadResult:
+    # aiohttp is only needed for this concurrency model and is slow to import
+    import aiohttp  # pylint: disable=import-outside-toplevel
+
+    async def worker(session: aiohttp.ClientSession, result: LoadResult, seed: int):
+        rng = random.Random(seed)
+        while True:
+            due = plan.next_slot()
+            if due is None:
+                return
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            operation = plan.choose(rng)
+            (method, path, body) = operation.request(plan)
+            status = None
+            try:
+                async with session.request(method, base_url + path, json=body) as resp:
+                    status = resp.status
+                    if method == 'POST' and status == 201:
+                        result.created.append((await resp.json())['id'])
+                    else:
+                        await resp.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                pass
+            result.record(operation.name, status, time.monotonic() - due)
+
+    results = [LoadResult() for _ in range(0, plan.concurrency)]
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=plan.concurrency),
+                                     timeout=aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1]),
+                                     headers=headers) as session:
+        plan.begin()
+        await asyncio.gather(*[worker(session, result, seed) for (seed, result) in enumerate(results)])
+    return _merge(plan, results)
+
+
+def _merge(plan: LoadPlan, results: List[LoadResult]) -> LoadResult:
+    merged = LoadResult()
+    merged.elapsed = time.monotonic() - plan.start
+    for result in results:
+        merged.merge(result)
+    return merged
@@ -0,0 +1,254 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Asyncio client library of the Resource API v1
+
+All requests of a client share one aiohttp session, so connections are kept alive and reused. No more than
+`concurrency` requests are in flight at any time, no matter how many coroutines are awaiting the client, which lets
+callers fan out with asyncio.gather without overwhelming the server or running out of sockets:
+
+    async with AsyncResourceClient('http://127.0.0.1:5000', token=token, concurrency=64) as client:
+        resources = await asyncio.gather(*[client.get_one(i) for i in ids])
+        async for resource in client.get_all():
+            ...
+"""
+
+import random
+import asyncio
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
+
+import aiohttp
+
+#: Statuses which indicate a transient failure worth retrying
+RETRY_STATUSES = (429, 502, 503, 504)
+
+#: Methods which may be retried without changing their outcome
+IDEMPOTENT_METHODS = ('GET', 'PUT', 'DELETE')
+
+
+class ResourceAPIError(Exception):
+    """An unexpected response of the Resource API"""
+    status: int
+    message: str
+
+    def __init__(self, status: int, message: str):
+        Exception.__init__(self, f'{status}: {message}')
+        self.status = status
+        self.message = message
+
+
+class AsyncResourceClient:
+    """An asyncio client of the Resource API v1
+
+    Idempotent requests which fail to connect or receive a transient error status are retried with exponential
+    backoff and full jitter. Creating resources is not retried, since a retry may collide with the resource the first
+    attempt created. The batch variants split their input into chunks of at most batch_size items, which are sent
+    concurrently.
+    """
+    base_url: str
+    concurrency: int
+    batch_size: int
+    retries: int
+    backoff: float
+
+    def __init__(self,
+                 base_url: str,
+                 token: Optional[str] = None,
+                 concurrency: int = 100,
+                 batch_size: int = 1000,
+                 timeout: Tuple[float, float] = (5, 30),
+                 retries: int = 3,
+                 backoff: float = 0.5):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self._headers = {'Authorization': f'Bearer {token}'} if token is not None else {}
+        self._timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> 'AsyncResourceClient':
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrency),
+                                              timeout=self._timeout,
+                                              headers=self._headers)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get_all(self, limit: Optional[int] = None) -> AsyncIterator[Dict]:
+        """Iterate over all resources, following the cursor from page to page
+
+        Args:
+            limit: Optional number of resources per page, defaults to the page size of the server
+
+        Yields:
+            The resources in the order of their identifiers
+        """
+        after = None
+        while True:
+            params = {}
+            if limit is not None:
+                params['limit'] = limit
+            if after is not None:
+                params['after'] = after
+            page = await self._request('GET', '/', params=params)
+            for resource in page['resources']:
+                yield resource
+            after = page['next']
+            if after is None:
+                return
+
+    async def get_one(self, i: int) -> Dict:
+        return await self._request('GET', f'/{i}')
+
+    async def create(self, name: str) -> Dict:
+        return await self._request('POST', '/', json={'name': name}, expected=(201,))
+
+    async def modify(self, i: int, name: str) -> Dict:
+        return await self._request('PUT', f'/{i}', json={'name': name})
+
+    async def remove(self, i: int):
+        await self._request('DELETE', f'/{i}', expected=(204,))
+
+    async def create_batch(self, names: Iterable[str]) -> List[Dict]:
+        """Create many resources
+
+        Names repeated within the input are only sent once, since the chunks are created concurrently and would
+        otherwise race each other. A chunk which fails does not affect the results of the chunks which succeeded.
+
+        Args:
+            names: The names of the resources to create
+
+        Returns:
+            A result per name in the same order, either {'status': 201, 'resource': ...} or the status and message of
+            the failure. The status is None if no response was received, in which case the resource may or may not
+            have been created
+        """
+        names = list(names)
+        results: List[Optional[Dict]] = [None] * len(names)
+        pending = {}
+        for (idx, name) in enumerate(names):
+            if name in pending:
+                results[idx] = {'status': 409, 'message': 'A resource with the same name is already part of this batch'}
+            else:
+                pending[name] = idx
+        indexes = list(pending.values())
+        chunks = await self._batched('POST', [{'name': name} for name in pending], expected=(207,))
+        for (chunk_idx, chunk) in enumerate(chunks):
+            chunk_indexes = indexes[chunk_idx * self.batch_size:(chunk_idx + 1) * self.batch_size]
+            if isinstance(chunk, ResourceAPIError):
+                chunk_results = [{'status': chunk.status, 'message': chunk.message} for _ in chunk_indexes]
+            elif isinstance(chunk, BaseException):
+                chunk_results = [{'status': None, 'message': str(chunk) or type(chunk).__name__} for _ in chunk_indexes]
+            else:
+                chunk_results = chunk['results']
+            for (idx, result) in zip(chunk_indexes, chunk_results):
+                results[idx] = result
+        return results
+
+    async def modify_batch(self, names: Dict[int, str]) -> Dict:
+        """Rename many resources
+
+        Args:
+            names: The new names by resource identifier
+
+        Returns:
+            A dictionary of the resources 'modified' and the identifiers 'missing' or 'not_owned'
+        """
+        results = await self._batched('PUT', [{'id': i, 'name': name} for (i, name) in names.items()])
+        results = self._raise_failed(results)
+        return self._merge(results, ('modified', 'missing', 'not_owned'))
+
+    async def remove_batch(self, ids: Iterable[int]) -> Dict:
+        """Remove many resources
+
+        Args:
+            ids: The identifiers of the resources to remove
+
+        Returns:
+            A dictionary of the identifiers 'removed', 'missing' or 'not_owned'
+        """
+        results = self._raise_failed(await self._batched('DELETE', list(ids)))
+        return self._merge(results, ('removed', 'missing', 'not_owned'))
+
+    async def _batched(self,
+                       method: str,
+                       items: List,
+                       expected: Tuple[int, ...] = (200,)) -> List[Union[Dict, BaseException]]:
+        """Send the items in chunks concurrently, returning the response body or the exception of each chunk in order
+
+        Every chunk runs to completion even if another one fails, so no request is left running unobserved.
+        """
+        chunks = [items[idx:idx + self.batch_size] for idx in range(0, len(items), self.batch_size)]
+        return await asyncio.gather(*[self._request(method, '/batch', json=chunk, expected=expected)
+                                      for chunk in chunks], return_exceptions=True)
+
+    @staticmethod
+    def _raise_failed(results: List[Union[Dict, BaseException]]) -> List[Dict]:
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    @staticmethod
+    def _merge(results: List[Dict], keys: Tuple[str, ...]) -> Dict:
+        return {key: [item for result in results for item in result[key]] for key in keys}
+
+    async def _request(self,
+                       method: str,
+                       path: str,
+                       params: Optional[Dict] = None,
+                       json: Optional[object] = None,
+                       expected: Tuple[int, ...] = (200,)) -> Optional[Dict]:
+        if self._session is None:
+            raise RuntimeError('The client must be used as an async context manager')
+        attempts = self.retries + 1 if method in IDEMPOTENT_METHODS else 1
+        for attempt in range(0, attempts):
+            if attempt > 0:
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+            try:
+                async with self._semaphore:
+                    async with self._session.request(method, f'{self.base_url}/api/resource/v1{path}',
+                                                     params=params, json=json) as resp:
+                        if resp.status in RETRY_STATUSES and attempt < attempts - 1:
+                            continue
+                        try:
+                            body = await resp.json(content_type=None) if resp.status != 204 else None
+                        except ValueError:
+                            body = None
+                        if resp.status not in expected:
+                            message = body.get('message', resp.reason) if isinstance(body, dict) else resp.reason
+                            raise ResourceAPIError(resp.status, message)
+                        return body
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == attempts - 1:
+                    raise
+        return None
@@ -0,0 +1,129 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Migration of the database
+
+Migrating requires Alembic to scan all revisions, which is not worth paying for on every start of a process when the
+database is almost always migrated already. The head revision is therefore recorded here and compared with the
+revision stored in the database using a single query. Only if they differ is Alembic run, by one process at a time.
+"""
+
+import os
+import zlib
+import fcntl
+from contextlib import contextmanager
+from typing import Set
+
+from flask import Flask, current_app
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from mrmat_python_api_flask import db
+
+#: The head revision of the migrations. Update it whenever a migration is added
+HEAD_REVISION = 'b58f0e6c1d27'
+
+#: The key of the PostgreSQL advisory lock held while migrating
+LOCK_KEY = zlib.crc32(b'mrmat-python-api-flask.migrations')
+
+
+def upgrade():
+    """Upgrade the database to the head revision using Flask-Migrate
+
+    Flask-Migrate is only imported here because it pulls in Alembic, which is slow to import and only needed in the
+    rare case that the database is not migrated yet.
+    """
+    from flask_migrate import Migrate, upgrade as migrate_upgrade  # pylint: disable=import-outside-toplevel
+    if 'migrate' not in current_app.extensions:
+        Migrate(current_app, db)
+    migrate_upgrade()
+
+
+def current_revisions() -> Set[str]:
+    """Return the revisions the database is migrated to, using a single query
+
+    Returns:
+        The set of revisions, empty if the database has never been migrated
+
+    Raises:
+        SQLAlchemyError: If the database cannot be queried for any other reason than a missing version table
+    """
+    try:
+        with db.engine.connect() as connection:
+            return {row[0] for row in connection.execute(text('SELECT version_num FROM alembic_version'))}
+    except (OperationalError, ProgrammingError):
+        # The failed query may have aborted the transaction of its connection, so the table is looked up on another
+        if inspect(db.engine).has_table('alembic_version'):
+            raise
+        return set()
+
+
+def is_current() -> bool:
+    return current_revisions() == {HEAD_REVISION}
+
+
+@contextmanager
+def migration_lock(app: Flask):
+    """Hold a lock so that only one of several processes starting concurrently migrates
+
+    PostgreSQL provides advisory locks which work across hosts. Other databases fall back to a lock file in the
+    instance directory, which is sufficient for SQLite since all its users share the host.
+
+    Args:
+        app: The Flask app
+    """
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': LOCK_KEY})
+            try:
+                yield
+            finally:
+                connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': LOCK_KEY})
+    else:
+        with open(os.path.join(app.instance_path, 'migrations.lock'), 'w', encoding='utf-8') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def migrate(app: Flask) -> bool:
+    """Migrate the database to the head revision unless it already is
+
+    Args:
+        app: The Flask app
+
+    Returns:
+        True if this process migrated the database, False if it was migrated already
+    """
+    with app.app_context():
+        if is_current():
+            return False
+        with migration_lock(app):
+            # Another process may have migrated while we were waiting for the lock
+            if is_current():
+                return False
+            app.logger.info('Migrating the database from %s to %s',
+                            ', '.join(sorted(current_revisions())) or 'scratch', HEAD_REVISION)
+            upgrade()
+            return True
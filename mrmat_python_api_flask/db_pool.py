@@ -0,0 +1,131 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Configuration and instrumentation of the database connection pool
+"""
+
+import time
+import threading
+from typing import Dict
+
+from flask import Flask
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import Pool, QueuePool
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool which measures how long callers wait to check out a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _record(self, start: float, timed_out: bool = False):
+        waited = time.perf_counter() - start
+        with self._stats_lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self._record(start, timed_out=True)
+            raise
+        self._record(start)
+        return connection
+
+
+def configure_pool(app: Flask):
+    """Translate the DB_POOL_* configuration into SQLAlchemy engine options
+
+    Options explicitly set in SQLALCHEMY_ENGINE_OPTIONS take precedence. SQLite does not use a queue pool, so only
+    pre-ping applies to it.
+
+    Args:
+        app: The Flask app, whose configuration is updated in place
+    """
+    app.config.setdefault('DB_POOL_SIZE', 5)
+    app.config.setdefault('DB_MAX_OVERFLOW', 10)
+    app.config.setdefault('DB_POOL_TIMEOUT', 30)
+    app.config.setdefault('DB_POOL_RECYCLE', 1800)
+    app.config.setdefault('DB_POOL_PRE_PING', True)
+
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options.setdefault('pool_pre_ping', app.config['DB_POOL_PRE_PING'])
+    if make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name() != 'sqlite':
+        options.setdefault('poolclass', InstrumentedQueuePool)
+        options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+        options.setdefault('max_overflow', app.config['DB_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', app.config['DB_POOL_TIMEOUT'])
+        options.setdefault('pool_recycle', app.config['DB_POOL_RECYCLE'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def pool_statistics(pool: Pool) -> Dict:
+    """Return the live statistics of a connection pool
+
+    Args:
+        pool: The pool of the engine
+
+    Returns:
+        A dict of statistics. Only the pool class and status are available for pools other than a QueuePool
+    """
+    stats = {'pool': type(pool).__name__, 'status': pool.status()}
+    if isinstance(pool, QueuePool):
+        stats.update({'size': pool.size(),
+                      'checked_in': pool.checkedin(),
+                      'checked_out': pool.checkedout(),
+                      'overflow': pool.overflow(),
+                      'timeout': pool.timeout()})
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._stats_lock:     # pylint: disable=protected-access
+            stats.update({'checkouts': pool.checkouts,
+                          'timeouts': pool.timeouts,
+                          'wait_time_total': pool.wait_time_total,
+                          'wait_time_max': pool.wait_time_max})
+    return stats
+
+
+def pool_exhausted(pool: Pool) -> bool:
+    """Find out whether a checkout from a connection pool would have to wait
+
+    Args:
+        pool: The pool of the engine
+
+    Returns:
+        True if the pool is a QueuePool without idle connections and without room to overflow
+    """
+    if not isinstance(pool, QueuePool):
+        return False
+    max_overflow = pool._max_overflow     # pylint: disable=protected-access
+    return pool.checkedin() == 0 and max_overflow > -1 and pool.overflow() >= max_overflow
@@ -0,0 +1,190 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Routing of read-only requests to database replicas
+"""
+
+import time
+import threading
+import itertools
+from functools import wraps
+from typing import Dict, List, Optional
+
+from flask import Flask, Response, current_app, g, request, has_app_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from mrmat_python_api_flask.cache import TTLCache
+from mrmat_python_api_flask.db_sqlite import sqlite_pragmas, sqlite_profile_applies, sqlite_pool_options, \
+    install_pragmas
+
+
+class ReplicaSet:
+    """The replicas configured for an app and what is known about their health
+
+    Replicas are handed out round-robin. A replica which failed is skipped for DB_REPLICA_RETRY_INTERVAL seconds.
+    Callers which recently wrote are kept on the primary for DB_REPLICA_STICKINESS seconds so that they read their own
+    writes despite replication lag.
+    """
+    bind_keys: List[str]
+    retry_interval: float
+
+    def __init__(self, bind_keys: List[str], retry_interval: float, stickiness: int):
+        self.bind_keys = bind_keys
+        self.retry_interval = retry_interval
+        self.sticky = TTLCache(max_size=4096, ttl=stickiness) if stickiness > 0 else None
+        self._down_until: Dict[str, float] = {}
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+    def choose(self, caller: Optional[str] = None) -> Optional[str]:
+        """Choose a healthy replica
+
+        Args:
+            caller: The identity of the caller, if known
+
+        Returns:
+            The bind key of a replica or None if the primary must be used
+        """
+        if caller is not None and self.sticky is not None and self.sticky.get(caller) is not None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            start = next(self._next)
+            for offset in range(len(self.bind_keys)):
+                bind_key = self.bind_keys[(start + offset) % len(self.bind_keys)]
+                if self._down_until.get(bind_key, 0) <= now:
+                    return bind_key
+        return None
+
+    def mark_down(self, bind_key: str):
+        with self._lock:
+            self._down_until[bind_key] = time.monotonic() + self.retry_interval
+
+    def mark_written(self, caller: str):
+        if self.sticky is not None:
+            self.sticky.put(caller, True)
+
+    def health(self) -> Dict[str, bool]:
+        now = time.monotonic()
+        with self._lock:
+            return {bind_key: self._down_until.get(bind_key, 0) <= now for bind_key in self.bind_keys}
+
+
+class RoutingSession(SignallingSession):
+    """A session which executes on the replica chosen for the current request, if any
+
+    Anything flushed always goes to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_app_context() and not self._flushing:
+            bind_key = g.get('db_replica')
+            if bind_key is not None:
+                return self.app.extensions['sqlalchemy'].db.get_engine(self.app, bind=bind_key)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with read-only views routed to replicas
+
+    Replicas are configured as a list of URIs in DB_REPLICA_URIS and become the binds 'replica_0', 'replica_1' and so
+    on. Only views decorated with `reads_from_replica` are routed, everything else stays on the primary. Engines for
+    file-based SQLite databases additionally get the connection pool and pragmas of the SQLite profile.
+    """
+
+    def init_app(self, app: Flask):
+        app.config.setdefault('DB_REPLICA_URIS', [])
+        app.config.setdefault('DB_REPLICA_STICKINESS', 5)
+        app.config.setdefault('DB_REPLICA_RETRY_INTERVAL', 30)
+
+        replicas = {f'replica_{idx}': uri for (idx, uri) in enumerate(app.config['DB_REPLICA_URIS'])}
+        if replicas:
+            app.config['SQLALCHEMY_BINDS'] = {**(app.config.get('SQLALCHEMY_BINDS') or {}), **replicas}
+        app.extensions['db_replicas'] = ReplicaSet(bind_keys=list(replicas.keys()),
+                                                   retry_interval=app.config['DB_REPLICA_RETRY_INTERVAL'],
+                                                   stickiness=app.config['DB_REPLICA_STICKINESS'])
+        app.after_request(_remember_writer)
+        super().init_app(app)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+        pragmas = sqlite_pragmas(app, sa_url)
+        # SQLALCHEMY_ENGINE_OPTIONS are applied after this method and win, but must not be combined with pool options
+        # that do not fit a poolclass chosen there
+        if sqlite_profile_applies(app, sa_url) and 'poolclass' not in app.config['SQLALCHEMY_ENGINE_OPTIONS']:
+            options.update(sqlite_pool_options(app))
+        options['sqlite_pragmas'] = pragmas
+        return sa_url, options
+
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop('sqlite_pragmas', {})
+        engine = super().create_engine(sa_url, engine_opts)
+        install_pragmas(engine, pragmas)
+        return engine
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def reads_from_replica(self, view):
+        """Decorate a read-only view to execute its queries on a replica
+
+        If the replica fails, it is marked as down and the view is executed again on the primary. Responses streamed
+        after the view returned keep reading from the replica but cannot fall back.
+
+        Args:
+            view: The view function, which must not write
+
+        Returns:
+            The decorated view
+        """
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            replicas: ReplicaSet = current_app.extensions['db_replicas']
+            bind_key = replicas.choose(_caller()) if replicas.bind_keys else None
+            if bind_key is None:
+                return view(*args, **kwargs)
+            g.db_replica = bind_key
+            try:
+                return view(*args, **kwargs)
+            except (OperationalError, InterfaceError) as oe:
+                current_app.logger.warning('Replica %s failed, falling back to the primary: %s', bind_key, oe)
+                replicas.mark_down(bind_key)
+                g.db_replica = None
+                self.session.rollback()
+                return view(*args, **kwargs)
+        return decorated
+
+
+def _caller() -> Optional[str]:
+    token_info = g.get('oidc_token_info')
+    return token_info.get('client_id') if token_info is not None else None
+
+
+def _remember_writer(response: Response) -> Response:
+    """Keep callers who successfully modified something on the primary for a while"""
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+        caller = _caller()
+        if caller is not None:
+            current_app.extensions['db_replicas'].mark_written(caller)
+    return response
@@ -0,0 +1,130 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Performance profile for file-based SQLite databases
+
+Independent of the profile, foreign keys are enforced on every SQLite connection, which SQLite does not do by default.
+"""
+
+from typing import Dict
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, URL
+
+from mrmat_python_api_flask.db_pool import InstrumentedQueuePool
+
+
+def configure_sqlite(app: Flask):
+    """Set the defaults of the DB_SQLITE_* configuration
+
+    Args:
+        app: The Flask app, whose configuration is updated in place
+    """
+    app.config.setdefault('DB_SQLITE_PROFILE', True)
+    app.config.setdefault('DB_SQLITE_JOURNAL_MODE', 'wal')
+    app.config.setdefault('DB_SQLITE_SYNCHRONOUS', 'normal')
+    app.config.setdefault('DB_SQLITE_BUSY_TIMEOUT', 5000)
+    app.config.setdefault('DB_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+    app.config.setdefault('DB_SQLITE_CACHE_SIZE', -64 * 1024)
+
+
+def sqlite_profile_applies(app: Flask, sa_url: URL) -> bool:
+    """Return whether the profile applies to a database
+
+    In-memory databases are private to a single connection and do not journal to disk, so they are left alone.
+
+    Args:
+        app: The Flask app
+        sa_url: The URL of the database
+
+    Returns:
+        True if the database is a file-based SQLite database and the profile is enabled
+    """
+    return sa_url.get_backend_name() == 'sqlite' and sa_url.database not in (None, '', ':memory:') and \
+        app.config['DB_SQLITE_PROFILE']
+
+
+def sqlite_pragmas(app: Flask, sa_url: URL) -> Dict:
+    """Return the pragmas to set on every connection to a database
+
+    Args:
+        app: The Flask app
+        sa_url: The URL of the database
+
+    Returns:
+        A dictionary of pragmas and their values, empty if the database is not a SQLite database
+    """
+    if sa_url.get_backend_name() != 'sqlite':
+        return {}
+    pragmas = {}
+    if sqlite_profile_applies(app, sa_url):
+        pragmas.update({'journal_mode': app.config['DB_SQLITE_JOURNAL_MODE'],
+                        'synchronous': app.config['DB_SQLITE_SYNCHRONOUS'],
+                        'busy_timeout': int(app.config['DB_SQLITE_BUSY_TIMEOUT']),
+                        'mmap_size': int(app.config['DB_SQLITE_MMAP_SIZE']),
+                        'cache_size': int(app.config['DB_SQLITE_CACHE_SIZE'])})
+    pragmas['foreign_keys'] = 'ON'
+    return pragmas
+
+
+def sqlite_pool_options(app: Flask) -> Dict:
+    """Return the engine options to pool connections to a file-based SQLite database
+
+    Flask-SQLAlchemy otherwise opens a new connection for every checkout, which re-reads the schema and re-applies all
+    pragmas each time. The pool hands a connection to one thread at a time, so the pysqlite thread check is not needed.
+    Like the pools of other databases, it keeps the statistics reported at /internal/pool.
+
+    Args:
+        app: The Flask app
+
+    Returns:
+        A dictionary of engine options
+    """
+    return {'poolclass': InstrumentedQueuePool,
+            'pool_size': app.config['DB_POOL_SIZE'],
+            'max_overflow': app.config['DB_MAX_OVERFLOW'],
+            'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+            'connect_args': {'check_same_thread': False}}
+
+
+def install_pragmas(engine: Engine, pragmas: Dict):
+    """Set pragmas on every new connection of an engine
+
+    The journal mode is set first, because it is a property of the database file and requires that no transaction is
+    open yet.
+
+    Args:
+        engine: The engine
+        pragmas: A dictionary of pragmas and their values
+    """
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):     # pylint: disable=unused-argument
+        cursor = dbapi_connection.cursor()
+        try:
+            for (pragma, value) in pragmas.items():
+                cursor.execute(f'PRAGMA {pragma}={value}')
+        finally:
+            cursor.close()
@@ -0,0 +1,158 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""The app factory and the extensions it initialises
+
+The package imports this module on first access to any of its names, so that importing the package is cheap
+"""
+
+import sys
+import os
+from logging.config import dictConfig
+
+from flask import Flask
+from flask_marshmallow import Marshmallow
+
+from mrmat_python_api_flask.security import TokenValidator
+from mrmat_python_api_flask.metrics import Metrics
+from mrmat_python_api_flask.profiling import Profiler
+from mrmat_python_api_flask.logs import configure_logging
+from mrmat_python_api_flask.db_pool import configure_pool
+from mrmat_python_api_flask.db_routing import RoutingSQLAlchemy
+from mrmat_python_api_flask.db_sqlite import configure_sqlite
+
+db = RoutingSQLAlchemy()
+ma = Marshmallow()
+auth = TokenValidator()
+metrics = Metrics()
+profiler = Profiler()
+
+dictConfig({
+    'version': 1,
+    'formatters': {'default': {
+        'format': '[%(asctime)s] %(levelname)s: %(message)s',
+    }},
+    'handlers': {
+        'wsgi': {
+            'class': 'logging.StreamHandler',
+            'stream': 'ext://flask.logging.wsgi_errors_stream',
+            'formatter': 'default'
+        }
+    },
+    'root': {
+        'level': 'INFO',
+        'handlers': ['wsgi']
+    },
+    'mrmat_python_api_flask': {
+        'level': 'INFO',
+        'handlers': ['wsgi']
+    }
+})
+
+
+def create_app(config_override=None, instance_path=None):
+    """Factory method to create a Flask app.
+
+    Allows configuration overrides by providing the optional test_config dict as well as a `config.py`
+    within the instance_path. Will create the instance_path if it does not exist. instance_path is meant
+    to be outside the package directory.
+
+    Args:
+        config_override: Optional dict to override configuration
+        instance_path: Optional fully qualified path to instance directory (for configuration etc)
+
+    Returns: an initialised Flask app object
+
+    """
+    # Named after the package rather than this module, since the name determines the default instance path
+    app = Flask('mrmat_python_api_flask', instance_relative_config=True, instance_path=instance_path)
+
+    #
+    # Set configuration defaults. If a config file is present then load it. If we have overrides, apply them
+
+    app.config.setdefault('SECRET_KEY', os.urandom(16))
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI',
+                          'sqlite+pysqlite:///' + os.path.join(app.instance_path, 'mrmat-python-api-flask.sqlite'))
+    app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+    app.config.setdefault('OIDC_USER_INFO_ENABLED', True)
+    app.config.setdefault('OIDC_RESOURCE_SERVER_ONLY', True)
+    app.config.setdefault('RESOURCE_PAGE_SIZE_DEFAULT', 100)
+    app.config.setdefault('RESOURCE_PAGE_SIZE_MAX', 1000)
+    app.config.setdefault('RESOURCE_BATCH_SIZE_MAX', 1000)
+    app.config.setdefault('RESOURCE_EXPORT_BATCH_SIZE', 1000)
+    if 'FLASK_CONFIG' in os.environ and os.path.exists(os.path.expanduser(os.environ['FLASK_CONFIG'])):
+        app.config.from_json(os.path.expanduser(os.environ['FLASK_CONFIG']))
+    if config_override is not None:
+        app.config.from_mapping(config_override)
+    configure_logging(app)
+    configure_pool(app)
+    configure_sqlite(app)
+
+    #
+    # Create the instance folder if it does not exist
+
+    try:
+        if not os.path.exists(app.instance_path):
+            app.logger.info('Creating new instance path at %s', app.instance_path)
+            os.makedirs(app.instance_path)
+        else:
+            app.logger.info('Using existing instance path at %s', app.instance_path)
+    except OSError:
+        app.logger.error('Failed to create new instance path at %s', app.instance_path)
+        sys.exit(1)
+
+    # When using Flask-SQLAlchemy, there is no need to explicitly import DAO classes because they themselves
+    # inherit from the SQLAlchemy model
+
+    db.init_app(app)
+    ma.init_app(app)
+    auth.init_app(app)
+    metrics.init_app(app)
+    profiler.init_app(app)
+    if app.config['OIDC_TOKEN_VALIDATION'] == 'local':
+        app.logger.info('Validating tokens locally against %s', app.config['OIDC_JWKS_URI'])
+    elif 'OIDC_CLIENT_SECRETS' not in app.config:
+        app.logger.warning('Running without any authentication/authorisation')
+
+    # Flask-Migrate pulls in Alembic, which takes longer to import than everything else together. The flask CLI has
+    # already imported it to provide its 'db' commands, otherwise it is registered once the database is migrated
+    if 'flask_migrate' in sys.modules:
+        from flask_migrate import Migrate  # pylint: disable=import-outside-toplevel
+        Migrate(app, db)
+
+    #
+    # Import and register our APIs here
+
+    from mrmat_python_api_flask.apis.healthz import bp as api_healthz  # pylint: disable=import-outside-toplevel
+    from mrmat_python_api_flask.apis.internal import bp as api_internal  # pylint: disable=import-outside-toplevel
+    from mrmat_python_api_flask.apis.greeting.v1 import api_greeting_v1  # pylint: disable=import-outside-toplevel
+    from mrmat_python_api_flask.apis.greeting.v2 import api_greeting_v2  # pylint: disable=import-outside-toplevel
+    from mrmat_python_api_flask.apis.greeting.v3 import api_greeting_v3  # pylint: disable=import-outside-toplevel
+    from mrmat_python_api_flask.apis.resource.v1 import api_resource_v1  # pylint: disable=import-outside-toplevel
+    app.register_blueprint(api_healthz, url_prefix='/healthz')
+    app.register_blueprint(api_internal, url_prefix='/internal')
+    app.register_blueprint(api_greeting_v1, url_prefix='/api/greeting/v1')
+    app.register_blueprint(api_greeting_v2, url_prefix='/api/greeting/v2')
+    app.register_blueprint(api_greeting_v3, url_prefix='/api/greeting/v3')
+    app.register_blueprint(api_resource_v1, url_prefix='/api/resource/v1')
+
+    return app
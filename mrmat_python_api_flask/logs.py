@@ -0,0 +1,152 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Logging pipeline of the app
+
+By default, log records are formatted and written by the thread that emits them. With LOG_QUEUE, the handlers are
+moved behind a bounded in-process queue which is drained by a background thread, so that a slow log destination cannot
+stall request threads. Records which do not fit into the queue are dropped and counted. LOG_JSON switches to one JSON
+object per record. Access log lines, one per API call, can be sampled with LOG_ACCESS_SAMPLE_RATE.
+"""
+
+import json
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+from typing import Dict, Optional
+
+from flask import Flask
+
+access_log = logging.getLogger('mrmat_python_api_flask.access')
+
+# Attributes every LogRecord has. Anything else was passed as extra and is added to the JSON output
+_RECORD_ATTRIBUTES = set(logging.LogRecord('', logging.INFO, '', 0, '', None, None).__dict__.keys()) | {'message'}
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats a record as a single-line JSON object, including whatever was passed as extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {'time': self.formatTime(record),
+                 'level': record.levelname,
+                 'logger': record.name,
+                 'message': record.getMessage()}
+        entry.update({k: v for (k, v) in record.__dict__.items() if k not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through a random sample of the records"""
+    rate: float
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """A QueueHandler which drops records instead of blocking or failing when the queue is full
+
+    The queue is in-process, so records are passed on as they are and formatted by the thread of the listener rather
+    than the thread that emitted them. Arguments passed for formatting must therefore not be modified afterwards.
+    """
+    dropped: int = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+#: The formatters the root handlers had before LOG_JSON replaced them
+_formatters: Dict[logging.Handler, Optional[logging.Formatter]] = {}
+
+
+def _stop_listener():
+    """Stop the running listener, if any, and give its handlers back to the root logger"""
+    global _listener     # pylint: disable=global-statement
+    if _listener is not None:
+        _listener.stop()
+        logging.getLogger().handlers = list(_listener.handlers)
+        _listener = None
+
+
+atexit.register(_stop_listener)
+
+
+def reset_after_fork():
+    """Forget the listener inherited from the parent process, which must be called in a forked child
+
+    The thread of the listener does not survive the fork, and its queue may be full or have its lock held by a thread
+    of the parent, so stopping the listener could fail or block forever. The handlers are given back to the root logger
+    without touching the queue, so that configure_logging can build a fresh queue and listener.
+    """
+    global _listener     # pylint: disable=global-statement
+    if _listener is not None:
+        logging.getLogger().handlers = list(_listener.handlers)
+        _listener = None
+
+
+def configure_logging(app: Flask):
+    """Configure the logging pipeline from the LOG_* configuration
+
+    Args:
+        app: The Flask app
+    """
+    global _listener     # pylint: disable=global-statement
+    app.config.setdefault('LOG_QUEUE', False)
+    app.config.setdefault('LOG_QUEUE_SIZE', 10000)
+    app.config.setdefault('LOG_JSON', False)
+    app.config.setdefault('LOG_ACCESS_SAMPLE_RATE', 1.0)
+
+    for existing in [f for f in access_log.filters if isinstance(f, SamplingFilter)]:
+        access_log.removeFilter(existing)
+    if app.config['LOG_ACCESS_SAMPLE_RATE'] < 1.0:
+        access_log.addFilter(SamplingFilter(app.config['LOG_ACCESS_SAMPLE_RATE']))
+
+    _stop_listener()
+    for (handler, formatter) in _formatters.items():
+        handler.setFormatter(formatter)
+    _formatters.clear()
+    root = logging.getLogger()
+    if app.config['LOG_JSON']:
+        for handler in root.handlers:
+            _formatters[handler] = handler.formatter
+            handler.setFormatter(JSONFormatter())
+    if app.config['LOG_QUEUE']:
+        handler = DroppingQueueHandler(queue.Queue(maxsize=app.config['LOG_QUEUE_SIZE']))
+        _listener = logging.handlers.QueueListener(handler.queue, *root.handlers, respect_handler_level=True)
+        _listener.start()
+        root.handlers = [handler]
@@ -0,0 +1,172 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Prometheus metrics of the app
+
+Metrics are exposed in the Prometheus text exposition format at /metrics. When the app runs in several worker processes
+(e.g. under gunicorn), the PROMETHEUS_MULTIPROC_DIR environment variable must point to a directory shared by all
+workers and emptied before they start. Every worker then writes its metrics into that directory and the metrics of all
+workers are aggregated when any of them is scraped.
+"""
+
+import os
+import time
+from typing import Dict, Tuple
+
+from flask import Flask, Response, g, request, _app_ctx_stack
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from prometheus_client import Counter, Histogram, Gauge, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, \
+    generate_latest
+from prometheus_client import multiprocess
+
+REQUESTS = Counter('http_requests_total',
+                   'Number of requests',
+                   ['endpoint', 'method', 'status'])
+REQUEST_LATENCY = Histogram('http_request_duration_seconds',
+                            'Time until the response is returned to the WSGI server',
+                            ['endpoint', 'method', 'status'])
+REQUESTS_IN_PROGRESS = Gauge('http_requests_in_progress',
+                             'Number of requests currently being processed',
+                             ['endpoint'],
+                             multiprocess_mode='livesum')
+DB_QUERIES = Histogram('http_request_db_queries',
+                       'Number of database statements executed per request',
+                       ['endpoint'],
+                       buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500))
+DB_LATENCY = Histogram('http_request_db_duration_seconds',
+                       'Time spent executing database statements per request',
+                       ['endpoint'])
+TOKEN_VALIDATION_LATENCY = Histogram('token_validation_duration_seconds',
+                                     'Time spent validating bearer tokens',
+                                     ['method', 'result'],
+                                     buckets=(.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5,
+                                              1.0, 2.5))
+
+
+class Metrics:
+    """Flask extension which measures every request
+
+    Measuring can be switched off using METRICS_ENABLED, which also removes the /metrics endpoint.
+    """
+
+    def init_app(self, app: Flask):
+        app.config.setdefault('METRICS_ENABLED', True)
+        if not app.config['METRICS_ENABLED']:
+            return
+        app.before_request(_before_request)
+        app.after_request(_after_request)
+        app.teardown_request(_teardown_request)
+        app.add_url_rule('/metrics', 'metrics', exposition, methods=['GET'])
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+class _RequestMetrics:
+    """What is measured about the request currently being processed"""
+    __slots__ = ('start', 'endpoint', 'method', 'db_queries', 'db_time')
+
+    def __init__(self, endpoint: str, method: str):
+        self.start = time.perf_counter()
+        self.endpoint = endpoint
+        self.method = method
+        self.db_queries = 0
+        self.db_time = 0.0
+
+
+# Looking up labelled metrics is comparatively slow, so they are looked up once per set of labels
+_children: Dict[Tuple, Tuple] = {}
+
+
+def _endpoint_children(endpoint: str) -> Tuple:
+    children = _children.get(endpoint)
+    if children is None:
+        children = _children.setdefault(endpoint, (REQUESTS_IN_PROGRESS.labels(endpoint),
+                                                   DB_QUERIES.labels(endpoint),
+                                                   DB_LATENCY.labels(endpoint)))
+    return children
+
+
+def _response_children(endpoint: str, method: str, status: int) -> Tuple:
+    key = (endpoint, method, status)
+    children = _children.get(key)
+    if children is None:
+        children = _children.setdefault(key, (REQUESTS.labels(endpoint, method, str(status)),
+                                              REQUEST_LATENCY.labels(endpoint, method, str(status))))
+    return children
+
+
+# Every access to request or g resolves the current context, so each hook does so at most once
+
+def _before_request():
+    req = request._get_current_object()     # pylint: disable=protected-access
+    metrics = _RequestMetrics(req.endpoint or 'none', req.method)
+    g.metrics = metrics
+    _endpoint_children(metrics.endpoint)[0].inc()
+
+
+def _after_request(response: Response) -> Response:
+    metrics = g.get('metrics')
+    if metrics is None:
+        return response
+    (requests_total, request_latency) = _response_children(metrics.endpoint, metrics.method, response.status_code)
+    requests_total.inc()
+    request_latency.observe(time.perf_counter() - metrics.start)
+    (_, db_queries, db_latency) = _endpoint_children(metrics.endpoint)
+    db_queries.observe(metrics.db_queries)
+    db_latency.observe(metrics.db_time)
+    return response
+
+
+def _teardown_request(exc):     # pylint: disable=unused-argument
+    metrics = g.pop('metrics', None)
+    if metrics is not None:
+        _endpoint_children(metrics.endpoint)[0].dec()
+
+
+def _before_cursor_execute(conn, *args):     # pylint: disable=unused-argument
+    conn.info['metrics_query_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, *args):     # pylint: disable=unused-argument
+    start = conn.info.pop('metrics_query_start', None)
+    ctx = _app_ctx_stack.top
+    metrics = getattr(ctx.g, 'metrics', None) if ctx is not None else None
+    if start is not None and metrics is not None:
+        metrics.db_queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def exposition() -> Response:
+    """Render the metrics of this process, or of all worker processes, in the text exposition format"""
+    registry = REGISTRY
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ or 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def mark_worker_dead(pid: int):
+    """Drop the live gauges of a worker process which exited, to be called by the process manager"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ or 'prometheus_multiproc_dir' in os.environ:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,269 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Profiling of individual requests
+
+A request is profiled if it carries an X-Profile header signed with PROFILING_SECRET, or at random with a probability
+of PROFILING_SAMPLE_RATE. Its report contains a cProfile of the request, including the streaming of the response, and
+the SQL statements it executed with their timings. Reports are kept in a bounded ring buffer on disk so that they can
+be retrieved from any worker later.
+"""
+
+import io
+import os
+import glob
+import json
+import time
+import random
+import pstats
+import cProfile
+from typing import Dict, List, Optional, Iterable
+
+import click
+from flask import Flask, current_app, request, has_request_context
+from itsdangerous import TimestampSigner, BadSignature
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_HEADER = 'X-Profile'
+ENVIRON_KEY = 'mrmat_python_api_flask.profile'
+
+
+class ReportStore:
+    """A ring buffer of profiling reports, one JSON file each
+
+    Several worker processes may write into the same directory. Reports are written to a temporary file first and then
+    renamed, so that a report is never read while it is being written.
+    """
+    directory: str
+    max_reports: int
+
+    def __init__(self, directory: str, max_reports: int = 100):
+        self.directory = directory
+        self.max_reports = max_reports
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, '*.json')))
+
+    def write(self, report: Dict):
+        path = os.path.join(self.directory, f'{report["id"]}.json')
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(report, f)
+        os.replace(f'{path}.tmp', path)
+        for stale in self._paths()[:-self.max_reports]:
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+    def list(self) -> List[Dict]:
+        """Return the summaries of all reports, the most recent first"""
+        summaries = []
+        for path in reversed(self._paths()):
+            report = self._read(path)
+            if report is not None:
+                summaries.append({k: v for (k, v) in report.items() if k not in ('sql', 'profile')})
+        return summaries
+
+    def get(self, report_id: str) -> Optional[Dict]:
+        if os.path.basename(report_id) != report_id:
+            return None
+        return self._read(os.path.join(self.directory, f'{report_id}.json'))
+
+    @staticmethod
+    def _read(path: str) -> Optional[Dict]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+
+class _Profile:
+    """A request being profiled"""
+
+    def __init__(self, environ: Dict):
+        self.method = environ.get('REQUEST_METHOD')
+        self.path = environ.get('PATH_INFO')
+        self.status = None
+        self.statements: List[Dict] = []
+        self.profile = cProfile.Profile()
+        self.started = time.time()
+        self.elapsed = 0.0
+
+    def run(self, fn, *args):
+        start = time.perf_counter()
+        self.profile.enable()
+        try:
+            return fn(*args)
+        finally:
+            self.profile.disable()
+            self.elapsed += time.perf_counter() - start
+
+    def report(self, top: int) -> Dict:
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats('cumulative').print_stats(top)
+        return {'id': f'{time.time_ns()}-{os.getpid()}',
+                'method': self.method,
+                'path': self.path,
+                'status': self.status,
+                'started': self.started,
+                'duration': self.elapsed,
+                'sql_count': len(self.statements),
+                'sql_duration': sum(s['duration'] for s in self.statements),
+                'sql': self.statements,
+                'profile': stream.getvalue()}
+
+
+class _ProfiledResponse:
+    """Profiles the iteration of a response and writes the report once the WSGI server closes it"""
+
+    def __init__(self, profile: _Profile, response: Iterable, finish):
+        self._profile = profile
+        self._response = response
+        self._iterator = iter(response)
+        self._finish = finish
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._profile.run(next, self._iterator)
+
+    def close(self):
+        try:
+            if hasattr(self._response, 'close'):
+                self._profile.run(self._response.close)
+        finally:
+            self._finish(self._profile)
+
+
+class ProfilingMiddleware:
+    """WSGI middleware which profiles selected requests and stores their reports"""
+    secret: Optional[str]
+    sample_rate: float
+    max_age: int
+    top: int
+    store: ReportStore
+
+    def __init__(self, wsgi_app, store: ReportStore, secret: Optional[str] = None, sample_rate: float = 0.0,
+                 max_age: int = 3600, top: int = 50):
+        self.wsgi_app = wsgi_app
+        self.store = store
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.max_age = max_age
+        self.top = top
+
+    def selects(self, environ: Dict) -> bool:
+        header = environ.get('HTTP_X_PROFILE')
+        if header is not None and self.secret is not None:
+            try:
+                TimestampSigner(self.secret, salt=PROFILE_HEADER).unsign(header, max_age=self.max_age)
+                return True
+            except BadSignature:
+                pass
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def finish(self, profile: _Profile):
+        self.store.write(profile.report(self.top))
+
+    def __call__(self, environ, start_response):
+        if not self.selects(environ):
+            return self.wsgi_app(environ, start_response)
+        profile = _Profile(environ)
+        environ[ENVIRON_KEY] = profile
+
+        def profiled_start_response(status, headers, exc_info=None):
+            profile.status = int(status.split(' ', 1)[0])
+            return start_response(status, headers, exc_info)
+
+        response = profile.run(self.wsgi_app, environ, profiled_start_response)
+        return _ProfiledResponse(profile, response, self.finish)
+
+
+class Profiler:
+    """Flask extension which profiles selected requests
+
+    Nothing is installed unless PROFILING_SECRET or PROFILING_SAMPLE_RATE is configured, so that requests are not
+    slowed down when profiling is not wanted. The middleware is available as app.extensions['profiler'].
+    """
+
+    def init_app(self, app: Flask):
+        app.config.setdefault('PROFILING_SECRET', None)
+        app.config.setdefault('PROFILING_SAMPLE_RATE', 0.0)
+        app.config.setdefault('PROFILING_TOKEN_MAX_AGE', 3600)
+        app.config.setdefault('PROFILING_MAX_REPORTS', 100)
+        app.config.setdefault('PROFILING_TOP', 50)
+        app.config.setdefault('PROFILING_DIRECTORY', os.path.join(app.instance_path, 'profiles'))
+        app.cli.command('profile-token')(_profile_token)
+        if app.config['PROFILING_SECRET'] is None and float(app.config['PROFILING_SAMPLE_RATE']) <= 0:
+            return
+        middleware = ProfilingMiddleware(app.wsgi_app,
+                                         store=ReportStore(app.config['PROFILING_DIRECTORY'],
+                                                           app.config['PROFILING_MAX_REPORTS']),
+                                         secret=app.config['PROFILING_SECRET'],
+                                         sample_rate=float(app.config['PROFILING_SAMPLE_RATE']),
+                                         max_age=app.config['PROFILING_TOKEN_MAX_AGE'],
+                                         top=app.config['PROFILING_TOP'])
+        app.extensions['profiler'] = middleware
+        app.wsgi_app = middleware
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @staticmethod
+    def sign(secret: str) -> str:
+        """Create a value for the X-Profile header
+
+        Args:
+            secret: The PROFILING_SECRET
+
+        Returns:
+            The header value, valid for PROFILING_TOKEN_MAX_AGE seconds
+        """
+        return TimestampSigner(secret, salt=PROFILE_HEADER).sign('profile').decode('ascii')
+
+
+def _profile_token():
+    """Print a value for the X-Profile header that requests profiling"""
+    if current_app.config['PROFILING_SECRET'] is None:
+        raise click.ClickException('PROFILING_SECRET is not configured')
+    click.echo(Profiler.sign(current_app.config['PROFILING_SECRET']))
+
+
+def _current_profile() -> Optional[_Profile]:
+    return request.environ.get(ENVIRON_KEY) if has_request_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, *args):     # pylint: disable=unused-argument
+    if _current_profile() is not None:
+        conn.info['profile_query_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, *args):     # pylint: disable=unused-argument
+    start = conn.info.pop('profile_query_start', None)
+    if start is not None:
+        profile = _current_profile()
+        if profile is not None:
+            profile.statements.append({'statement': statement, 'duration': time.perf_counter() - start})
@@ -0,0 +1,284 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Validation of OIDC bearer tokens
+
+Tokens are either validated by the identity provider via the token introspection endpoint (the Flask-OIDC default)
+or locally, by verifying their signature, expiry, issuer and audience against the signing keys the identity provider
+publishes in its JWKS. Local validation saves a network round trip to the identity provider on every request.
+"""
+
+import time
+import hashlib
+import threading
+from functools import wraps
+from typing import Optional, Dict, List, Union, TYPE_CHECKING
+
+import jwt
+import requests
+from flask import Flask, request, g, current_app
+
+from mrmat_python_api_flask.cache import TTLCache
+from mrmat_python_api_flask.metrics import TOKEN_VALIDATION_LATENCY
+
+if TYPE_CHECKING:
+    from flask_oidc import OpenIDConnect
+
+
+class JWKSCache:
+    """A thread-safe cache of the signing keys published by the identity provider
+
+    The key set is fetched on first use and then kept for the configured time-to-live. A token signed by a key we do
+    not know yet causes an early refresh so that key rotation at the identity provider is picked up, but no more often
+    than every min_refresh_interval seconds so that tokens with bogus key identifiers cannot be used to flood the
+    identity provider. Should a refresh fail then the previously fetched keys remain in use.
+    """
+    uri: str
+    ttl: int
+    min_refresh_interval: int
+    timeout: int
+
+    def __init__(self, uri: str, ttl: int = 3600, min_refresh_interval: int = 30, timeout: int = 5):
+        self.uri = uri
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._fetched_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get_key(self, kid: Optional[str]) -> jwt.PyJWK:
+        """Return the signing key with the provided key identifier
+
+        Args:
+            kid: The key identifier from the header of the token
+
+        Returns:
+            The signing key
+
+        Raises:
+            jwt.InvalidTokenError: If no key with the provided identifier is published by the identity provider
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._fetched_at is None or now - self._fetched_at >= self.ttl:
+                self._refresh(now)
+            elif kid not in self._keys and now - self._fetched_at >= self.min_refresh_interval:
+                self._refresh(now)
+            key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f'Token is signed with unknown key {kid}')
+        return key
+
+    def _refresh(self, now: float):
+        try:
+            resp = requests.get(self.uri, timeout=self.timeout)
+            resp.raise_for_status()
+            keys = {}
+            for jwk in resp.json()['keys']:
+                if jwk.get('use', 'sig') != 'sig':
+                    continue
+                try:
+                    keys[jwk.get('kid')] = jwt.PyJWK(jwk)
+                except jwt.PyJWTError:
+                    continue
+            self._keys = keys
+        except (requests.RequestException, ValueError, KeyError) as e:
+            if self._fetched_at is None:
+                raise jwt.InvalidTokenError('Unable to fetch the signing keys of the identity provider') from e
+            current_app.logger.warning('Unable to refresh signing keys from %s, continuing with cached keys', self.uri)
+        self._fetched_at = now
+
+
+class TokenCache(TTLCache):
+    """A thread-safe, size-bounded LRU cache of validated token claims
+
+    Clients typically reuse the same access token for minutes, so remembering the claims of a validated token saves
+    repeating the validation work. Entries are keyed by a digest of the token, so the cache never holds the tokens
+    themselves. An entry expires at the 'exp' claim of its token, but no later than ttl seconds after it was added.
+    The least recently used entry is evicted once max_size entries are held.
+    """
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token: str) -> Optional[Dict]:
+        """Return the cached claims of a token
+
+        Args:
+            token: The bearer token
+
+        Returns:
+            The claims of the token or None if the token is not cached or its entry has expired
+        """
+        return super().get(self._digest(token))
+
+    def put(self, token: str, claims: Dict, expires_at: Optional[float] = None):
+        """Remember the claims of a validated token
+
+        Args:
+            token: The bearer token
+            claims: The claims of the token
+            expires_at: Optional epoch timestamp at which the entry expires, defaults to the 'exp' claim
+        """
+        if expires_at is None and isinstance(claims.get('exp'), (int, float)):
+            expires_at = claims['exp']
+        super().put(self._digest(token), claims, expires_at)
+
+
+class TokenValidator:
+    """Flask extension validating the bearer tokens of protected view functions
+
+    This is a drop-in replacement for the accept_token decorator of Flask-OIDC. Validation is performed locally
+    against a cached JWKS if OIDC_TOKEN_VALIDATION is set to 'local', otherwise by Flask-OIDC via the token
+    introspection endpoint. Either way, the claims of a valid token end up in g.oidc_token_info. The claims of
+    validated tokens are cached unless OIDC_TOKEN_CACHE_SIZE is set to 0. Flask-OIDC is only set up if
+    OIDC_CLIENT_SECRETS is configured, since it pulls in oauth2client, which is slow to import.
+    """
+    oidc: Optional['OpenIDConnect']
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.oidc = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault('OIDC_TOKEN_VALIDATION', 'introspection')
+        app.config.setdefault('OIDC_JWKS_TTL', 3600)
+        app.config.setdefault('OIDC_JWKS_MIN_REFRESH_INTERVAL', 30)
+        app.config.setdefault('OIDC_JWT_ALGORITHMS', ['RS256'])
+        app.config.setdefault('OIDC_JWT_LEEWAY', 0)
+        app.config.setdefault('OIDC_ISSUER', None)
+        app.config.setdefault('OIDC_AUDIENCE', None)
+        app.config.setdefault('OIDC_TOKEN_CACHE_SIZE', 1024)
+        app.config.setdefault('OIDC_TOKEN_CACHE_TTL', 300)
+        if app.config['OIDC_TOKEN_CACHE_SIZE'] > 0:
+            app.extensions['token_cache'] = TokenCache(max_size=app.config['OIDC_TOKEN_CACHE_SIZE'],
+                                                       ttl=app.config['OIDC_TOKEN_CACHE_TTL'])
+        if app.config['OIDC_TOKEN_VALIDATION'] == 'local':
+            if 'OIDC_JWKS_URI' not in app.config:
+                raise ValueError('OIDC_JWKS_URI must be configured for local token validation')
+            app.extensions['jwks'] = JWKSCache(uri=app.config['OIDC_JWKS_URI'],
+                                               ttl=app.config['OIDC_JWKS_TTL'],
+                                               min_refresh_interval=app.config['OIDC_JWKS_MIN_REFRESH_INTERVAL'])
+        if 'OIDC_CLIENT_SECRETS' in app.config:
+            from flask_oidc import OpenIDConnect  # pylint: disable=import-outside-toplevel
+            if self.oidc is None:
+                self.oidc = OpenIDConnect()
+            self.oidc.init_app(app)
+
+    @staticmethod
+    def _extract_token() -> Optional[str]:
+        token = None
+        if 'Authorization' in request.headers and request.headers['Authorization'].startswith('Bearer '):
+            token = request.headers['Authorization'].split(None, 1)[1].strip()
+        if 'access_token' in request.form:
+            token = request.form['access_token']
+        elif 'access_token' in request.args:
+            token = request.args['access_token']
+        return token
+
+    @staticmethod
+    def _decode_locally(token: str) -> Dict:
+        config = current_app.config
+        header = jwt.get_unverified_header(token)
+        key = current_app.extensions['jwks'].get_key(header.get('kid'))
+        claims = jwt.decode(token,
+                            key=key.key,
+                            algorithms=config['OIDC_JWT_ALGORITHMS'],
+                            audience=config['OIDC_AUDIENCE'],
+                            issuer=config['OIDC_ISSUER'],
+                            leeway=config['OIDC_JWT_LEEWAY'],
+                            options={'require': ['exp'],
+                                     'verify_aud': config['OIDC_AUDIENCE'] is not None,
+                                     'verify_iss': config['OIDC_ISSUER'] is not None})
+
+        # Introspection returns the client_id, a JWT carries it as the authorized party
+        claims.setdefault('client_id', claims.get('azp'))
+        claims['active'] = True
+        return claims
+
+    @staticmethod
+    def _scopes(claims: Dict) -> List[str]:
+        scopes = claims.get('scope', claims.get('scp', ''))
+        return scopes.split(' ') if isinstance(scopes, str) else list(scopes)
+
+    def _validate(self, token: str) -> Union[Dict, str]:
+        if current_app.config['OIDC_TOKEN_VALIDATION'] == 'local':
+            try:
+                return self._decode_locally(token)
+            except jwt.PyJWTError as e:
+                current_app.logger.info('Refused token: %s', e)
+                return 'Token required but invalid'
+        if 'OIDC_CLIENT_SECRETS' not in current_app.config:
+            return 'Token validation is not configured'
+        validity = self.oidc.validate_token(token)
+        return g.oidc_token_info if validity is True else validity
+
+    def validate_token(self, token: Optional[str], scopes_required: Optional[List[str]] = None) -> Union[bool, str]:
+        """Validate a token and populate g.oidc_token_info with its claims
+
+        Args:
+            token: The bearer token
+            scopes_required: Optional list of scopes the token must have been granted
+
+        Returns:
+            True if the token is valid and has been granted all required scopes, an error message otherwise
+        """
+        if not token:
+            return 'Token required but invalid'
+        start = time.perf_counter()
+        cache = current_app.extensions.get('token_cache')
+        claims = cache.get(token) if cache is not None else None
+        if claims is None:
+            claims = self._validate(token)
+            TOKEN_VALIDATION_LATENCY.labels(current_app.config['OIDC_TOKEN_VALIDATION'],
+                                            'invalid' if isinstance(claims, str) else 'valid')\
+                .observe(time.perf_counter() - start)
+            if isinstance(claims, str):
+                return claims
+            if cache is not None:
+                cache.put(token, claims)
+        else:
+            TOKEN_VALIDATION_LATENCY.labels('cache', 'valid').observe(time.perf_counter() - start)
+        if not set(scopes_required or []).issubset(self._scopes(claims)):
+            return 'Token does not have required scopes'
+        g.oidc_token_info = claims
+        return True
+
+    def accept_token(self, require_token: bool = False, scopes_required: Optional[List[str]] = None):
+        """Decorate a view function that requires a valid bearer token
+
+        Args:
+            require_token: Whether the request is refused if no valid token is provided
+            scopes_required: Optional list of scopes the token must have been granted
+        """
+        def wrapper(view_func):
+            @wraps(view_func)
+            def decorated(*args, **kwargs):
+                validity = self.validate_token(self._extract_token(), scopes_required)
+                if validity is True or not require_token:
+                    return view_func(*args, **kwargs)
+                return {'error': 'invalid_token', 'error_description': validity}, 401, {'WWW-Authenticate': 'Bearer'}
+            return decorated
+        return wrapper
@@ -0,0 +1,98 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Production server for the app
+
+Embeds gunicorn: The app is created and its database prepared once in the master process, which then forks the
+workers. SIGHUP gracefully replaces all workers, SIGTERM gracefully stops them, waiting up to graceful_timeout seconds
+for requests in flight.
+"""
+
+import os
+import glob
+import multiprocessing
+from typing import Dict, Optional
+
+from flask import Flask
+from gunicorn.app.base import BaseApplication
+
+from mrmat_python_api_flask import db
+from mrmat_python_api_flask.logs import configure_logging, reset_after_fork
+from mrmat_python_api_flask.metrics import mark_worker_dead
+
+
+def default_workers() -> int:
+    """One worker process per core"""
+    return multiprocessing.cpu_count()
+
+
+class Server(BaseApplication):
+    """Serves a preloaded Flask app from several pre-forked worker processes
+
+    Args:
+        app: The Flask app, fully initialised
+        options: gunicorn settings, e.g. bind, workers, threads, keepalive
+    """
+    app: Flask
+    options: Dict
+
+    def __init__(self, app: Flask, options: Optional[Dict] = None):
+        self.app = app
+        self.options = {'workers': default_workers(),
+                        'preload_app': True,
+                        'on_starting': _on_starting,
+                        'post_fork': _post_fork,
+                        'child_exit': _child_exit}
+        self.options.update(options or {})
+        super().__init__()
+
+    def load_config(self):
+        for (key, value) in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self) -> Flask:
+        # Connections opened in the master, e.g. by the migrations, must not be shared with the workers
+        with self.app.app_context():
+            for bind in [None] + list((self.app.config.get('SQLALCHEMY_BINDS') or {}).keys()):
+                db.get_engine(self.app, bind=bind).dispose()
+        return self.app
+
+
+def _on_starting(server):
+    """Remove the metrics a previous run left behind"""
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR', os.environ.get('prometheus_multiproc_dir'))
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            os.remove(path)
+    server.log.info('Serving with %s workers of %s threads each', server.cfg.workers, server.cfg.threads)
+
+
+def _post_fork(server, worker):     # pylint: disable=unused-argument
+    """Threads do not survive the fork, so the thread writing queued log records is started again"""
+    reset_after_fork()
+    configure_logging(server.app.app)
+
+
+def _child_exit(server, worker):     # pylint: disable=unused-argument
+    mark_worker_dead(worker.pid)
@@ -21,15 +21,22 @@
 #  SOFTWARE.
 
 import os
+import time
 import logging
 import json
+import threading
 import pytest
 
 from typing import Optional, List, Dict
+from http.server import HTTPServer, BaseHTTPRequestHandler
 
 import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
 import oauthlib.oauth2
 import requests_oauthlib
+from sqlalchemy import event
+from flask.testing import FlaskClient
+from werkzeug.serving import make_server, WSGIRequestHandler
 
 from mrmat_python_api_flask import create_app, db
 
@@ -70,24 +77,135 @@ def test_config() -> Optional[Dict]:
         return json.load(C)
 
 
+class LocalIdP:
+    """A stand-in identity provider for testing
+
+    Issues tokens signed by a locally generated key and publishes the corresponding JWKS via HTTP on the loopback
+    interface, so that local token validation can be tested without access to a real identity provider.
+    """
+    issuer: str = 'https://idp.test'
+    audience: str = 'mrmat-python-api-flask'
+    client_id: str = 'mrmat-python-api-flask-test'
+    preferred_name: str = 'service-account-mrmat-python-api-flask-test'
+
+    def __init__(self):
+        self.keys = {}
+        self.kid = None
+        self.jwks_requests = 0
+        self.rotate()
+        idp = self
+
+        class JWKSHandler(BaseHTTPRequestHandler):
+            def do_GET(self):   # noqa: N802
+                idp.jwks_requests += 1
+                body = json.dumps(idp.jwks()).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), JWKSHandler)
+        self.jwks_uri = f'http://127.0.0.1:{self.server.server_port}/jwks'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def rotate(self) -> str:
+        """Generate a new signing key and publish it alongside the previous ones"""
+        self.kid = f'key-{len(self.keys)}'
+        self.keys[self.kid] = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        return self.kid
+
+    def jwks(self) -> Dict:
+        keys = []
+        for kid, key in self.keys.items():
+            jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+            jwk.update({'kid': kid, 'use': 'sig', 'alg': 'RS256'})
+            keys.append(jwk)
+        return {'keys': keys}
+
+    def config(self) -> Dict:
+        return {'OIDC_TOKEN_VALIDATION': 'local',
+                'OIDC_JWKS_URI': self.jwks_uri,
+                'OIDC_ISSUER': self.issuer,
+                'OIDC_AUDIENCE': self.audience}
+
+    def token(self, scope: List[str], expires_in: int = 300, **claims) -> Dict:
+        now = int(time.time())
+        payload = {'iss': self.issuer,
+                   'aud': self.audience,
+                   'azp': self.client_id,
+                   'preferred_username': self.preferred_name,
+                   'iat': now,
+                   'exp': now + expires_in,
+                   'scope': ' '.join(['openid'] + scope)}
+        payload.update(claims)
+        access_token = jwt.encode(payload, self.keys[self.kid], algorithm='RS256', headers={'kid': self.kid})
+        return {'access_token': access_token, 'jwt': payload}
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture(scope='session')
+def local_idp() -> LocalIdP:
+    """A stand-in identity provider, shared by all tests in the session"""
+    idp = LocalIdP()
+    yield idp
+    idp.shutdown()
+
+
 @pytest.fixture
-def client():
+def client(test_config, local_idp):
     """Start and configure the WSGI app.
 
     Configuration honours the FLASK_CONFIG environment variable but will set reasonable defaults if not present. This
     particularly overrides the configuration of an in-memory database rather than the normal persisted database in the
-    instance directory.
+    instance directory. Tokens are validated locally against the stand-in identity provider unless a real identity
+    provider is configured.
 
     Yields:
         A Flask client used for testing
     """
-    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+    config = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'}
+    if test_config is None:
+        config.update(local_idp.config())
+    app = create_app(config)
     with app.app_context():
         db.create_all()
     with app.test_client() as client:
         yield client
 
 
+class QueryCounter:
+    """Counts the SQL statements executed on an engine"""
+    count: int = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+    def reset(self):
+        self.count = 0
+
+
+@pytest.fixture
+def query_counter(client: FlaskClient) -> QueryCounter:
+    """Count the SQL statements the app under test executes
+
+    Yields:
+        A QueryCounter which can be reset before the request of interest and asserted on afterwards
+    """
+    with client.application.app_context():
+        engine = db.engine
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter)
+    yield counter
+    event.remove(engine, 'before_cursor_execute', counter)
+
+
 def oidc_token(config: Dict, scope: Optional[List]):
     """Obtain an OIDC token to be used for client testing.
     Args:
@@ -115,36 +233,82 @@ def oidc_token(config: Dict, scope: Optional[List]):
 
 
 @pytest.fixture
-def oidc_token_read(test_config) -> Optional[Dict]:
+def oidc_token_read(test_config, local_idp) -> Optional[Dict]:
     """ Return an OIDC token with scope 'mrmat-python-api-flask-resource-read'
 
     Args:
         test_config: The test configuration as per the test_config fixture
+        local_idp: The stand-in identity provider issuing tokens if no real identity provider is configured
 
     Returns:
         A Dict containing the desired token structure
     """
     if test_config is None:
-        LOGGER.info('Missing OIDC test client configuration. Tests will be limited')
-        return None
+        return local_idp.token(['mrmat-python-api-flask-resource-read'])
     token = oidc_token(test_config, ['mrmat-python-api-flask-resource-read'])
     token['jwt'] = jwt.decode(token['access_token'], options={"verify_signature": False})
     return token
 
 
 @pytest.fixture
-def oidc_token_write(test_config) -> Optional[Dict]:
+def oidc_token_write(test_config, local_idp) -> Optional[Dict]:
     """ Return an OIDC token with scope 'mrmat-python-api-flask-resource-write'
 
     Args:
         test_config: The test configuration as per the test_config fixture
+        local_idp: The stand-in identity provider issuing tokens if no real identity provider is configured
 
     Returns:
         A Dict containing the desired token structure
     """
     if test_config is None:
-        LOGGER.info('Missing OIDC test client configuration. Tests will be limited')
-        return None
+        return local_idp.token(['mrmat-python-api-flask-resource-write'])
     token = oidc_token(test_config, ['mrmat-python-api-flask-resource-write'])
     token['jwt'] = jwt.decode(token['access_token'], options={"verify_signature": False})
     return token
+
+
+@pytest.fixture
+def oidc_token_admin(test_config, local_idp) -> Optional[Dict]:
+    """ Return an OIDC token with scope 'mrmat-python-api-flask-admin'
+
+    Args:
+        test_config: The test configuration as per the test_config fixture
+        local_idp: The stand-in identity provider issuing tokens if no real identity provider is configured
+
+    Returns:
+        A Dict containing the desired token structure
+    """
+    if test_config is None:
+        return local_idp.token(['mrmat-python-api-flask-admin'])
+    token = oidc_token(test_config, ['mrmat-python-api-flask-admin'])
+    token['jwt'] = jwt.decode(token['access_token'], options={"verify_signature": False})
+    return token
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Does not log every request, which drowns the output of tests issuing many"""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+@pytest.fixture
+def live_server(tmp_path, local_idp) -> str:
+    """Serve the WSGI app over HTTP on the loopback interface
+
+    The app uses a database file, since an in-memory database is private to each of the threads serving requests, and
+    validates tokens locally against the stand-in identity provider.
+
+    Yields:
+        The URL of the server
+    """
+    config = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/live.sqlite', **local_idp.config()}
+    app = create_app(config, instance_path=str(tmp_path))
+    with app.app_context():
+        db.create_all()
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
@@ -20,9 +20,9 @@
 #  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 #  SOFTWARE.
 
-from flask import Response
+from flask import Response, json
 from flask.testing import FlaskClient
-from typing import Tuple, Dict, Optional
+from typing import Tuple, Dict, Optional, List
 
 
 class ResourceAPIClient:
@@ -37,13 +37,26 @@ class ResourceAPIClient:
         if token is not None:
             self._headers = {'Authorization': f'Bearer {token["access_token"]}'}
 
-    def get_all(self) -> Tuple:
-        resp: Response = self.client.get('/api/resource/v1/', headers=self._headers)
+    def get_all(self, limit: Optional[int] = None, after: Optional[str] = None, etag: Optional[str] = None) -> Tuple:
+        query = {}
+        if limit is not None:
+            query['limit'] = limit
+        if after is not None:
+            query['after'] = after
+        resp: Response = self.client.get('/api/resource/v1/', query_string=query,
+                                         headers=self._conditional_headers('If-None-Match', etag))
         resp_body = self._parse_body(resp)
         return resp, resp_body
 
-    def get_one(self, i: Optional[int]) -> Tuple:
-        resp: Response = self.client.get(f'/api/resource/v1/{i}', headers=self._headers)
+    def export(self) -> Tuple:
+        resp: Response = self.client.get('/api/resource/v1/',
+                                         headers=dict(self._headers, Accept='application/x-ndjson'))
+        resp_body = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        return resp, resp_body
+
+    def get_one(self, i: Optional[int], etag: Optional[str] = None) -> Tuple:
+        resp: Response = self.client.get(f'/api/resource/v1/{i}',
+                                         headers=self._conditional_headers('If-None-Match', etag))
         resp_body = self._parse_body(resp)
         return resp, resp_body
 
@@ -53,17 +66,39 @@ class ResourceAPIClient:
         resp_body = self._parse_body(resp)
         return resp, resp_body
 
-    def modify(self, i: Optional[int], name: str) -> Tuple:
+    def create_batch(self, items: List) -> Tuple:
+        resp: Response = self.client.post('/api/resource/v1/batch', json=items, headers=self._headers)
+        resp_body = self._parse_body(resp)
+        return resp, resp_body
+
+    def modify(self, i: Optional[int], name: str, etag: Optional[str] = None) -> Tuple:
         req_body = {'name': name}
-        resp: Response = self.client.put(f'/api/resource/v1/{i}', json=req_body, headers=self._headers)
+        resp: Response = self.client.put(f'/api/resource/v1/{i}', json=req_body,
+                                         headers=self._conditional_headers('If-Match', etag))
+        resp_body = self._parse_body(resp)
+        return resp, resp_body
+
+    def modify_batch(self, items: List) -> Tuple:
+        resp: Response = self.client.put('/api/resource/v1/batch', json=items, headers=self._headers)
+        resp_body = self._parse_body(resp)
+        return resp, resp_body
+
+    def remove_batch(self, ids: List) -> Tuple:
+        resp: Response = self.client.delete('/api/resource/v1/batch', json=ids, headers=self._headers)
         resp_body = self._parse_body(resp)
         return resp, resp_body
 
-    def remove(self, i: Optional[int]) -> Tuple:
-        resp: Response = self.client.delete(f'/api/resource/v1/{i}', headers=self._headers)
+    def remove(self, i: Optional[int], etag: Optional[str] = None) -> Tuple:
+        resp: Response = self.client.delete(f'/api/resource/v1/{i}',
+                                            headers=self._conditional_headers('If-Match', etag))
         resp_body = self._parse_body(resp)
         return resp, resp_body
 
+    def _conditional_headers(self, header: str, etag: Optional[str]) -> Dict:
+        if etag is None:
+            return self._headers
+        return dict(self._headers, **{header: etag})
+
     @staticmethod
     def _parse_body(resp: Optional[Response]) -> Dict:
         # TODO: silent will return None if parsing fails. We may wish to know if the JSON is invalid vs no body/mime
@@ -0,0 +1,203 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import time
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from mrmat_python_api_flask import client
+from mrmat_python_api_flask.client import ClientException, JitteredRetry, make_session, oidc_check_auth, \
+    authenticate
+
+CONFIG = {'discovery_url': 'https://idp/.well-known/openid-configuration',
+          'client_id': 'client',
+          'client_secret': 'secret'}
+DISCOVERY = {'device_authorization_endpoint': 'https://idp/device', 'token_endpoint': 'https://idp/token'}
+
+
+class FakeResponse:
+
+    def __init__(self, status_code: int, body: dict, headers: dict = None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def json(self):
+        return self.body
+
+
+class FakeSession:
+
+    def __init__(self, *responses: FakeResponse):
+        self.responses = list(responses)
+        self.posts = 0
+        self.requests = []
+
+    def get(self, url, headers=None):
+        self.requests.append(('GET', url, headers))
+        return self.responses.pop(0)
+
+    def post(self, url, data):
+        self.posts += 1
+        self.requests.append(('POST', url, data))
+        return self.responses.pop(0)
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Fails every request with 503 until it has been told to succeed, remembering the client ports it saw"""
+    protocol_version = 'HTTP/1.1'
+    failures = 0
+    ports = []
+
+    def do_GET(self):     # pylint: disable=invalid-name
+        FlakyHandler.ports.append(self.client_address[1])
+        status = 503 if FlakyHandler.failures > 0 else 200
+        FlakyHandler.failures -= 1
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):     # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def flaky_server():
+    server = HTTPServer(('127.0.0.1', 0), FlakyHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    FlakyHandler.ports = []
+    yield f'http://127.0.0.1:{server.server_port}/'
+    server.shutdown()
+    server.server_close()
+
+
+def test_check_auth_polls_at_interval(monkeypatch):
+    waits = []
+    monkeypatch.setattr(client, 'sleep', waits.append)
+    session = FakeSession(FakeResponse(400, {'error': 'authorization_pending'}),
+                          FakeResponse(400, {'error': 'slow_down'}),
+                          FakeResponse(400, {'error': 'authorization_pending'}),
+                          FakeResponse(200, {'id_token': 'token'}))
+    token = oidc_check_auth(session,
+                            {'client_id': 'client', 'client_secret': 'secret'},
+                            {'token_endpoint': 'https://idp/token'},
+                            {'device_code': 'code', 'expires_in': 600, 'interval': 2})
+    assert token == {'id_token': 'token'}
+    assert session.posts == 4
+    assert waits == [2, 2, 7, 7]
+
+
+def test_check_auth_denied(monkeypatch):
+    monkeypatch.setattr(client, 'sleep', lambda wait: None)
+    session = FakeSession(FakeResponse(400, {'error': 'access_denied'}))
+    with pytest.raises(ClientException) as ce:
+        oidc_check_auth(session,
+                        {'client_id': 'client', 'client_secret': 'secret'},
+                        {'token_endpoint': 'https://idp/token'},
+                        {'device_code': 'code', 'expires_in': 600})
+    assert ce.value.msg == 'Access denied'
+
+
+def test_backoff_is_jittered():
+    retry = JitteredRetry(total=5, backoff_factor=1).increment(method='GET', url='/').increment(method='GET', url='/')
+    backoffs = {retry.get_backoff_time() for _ in range(0, 50)}
+    assert len(backoffs) > 1
+    assert all(0 <= backoff <= 2 for backoff in backoffs)
+
+
+def test_session_retries_on_one_connection(flaky_server):
+    FlakyHandler.failures = 2
+    with make_session({'retries': 3, 'backoff': 0}) as session:
+        assert session.get(flaky_server).status_code == 200
+        assert session.get(flaky_server).status_code == 200
+    assert len(FlakyHandler.ports) == 4
+    assert len(set(FlakyHandler.ports)) == 1
+
+
+def test_session_gives_up(flaky_server):
+    FlakyHandler.failures = 10
+    with make_session({'retries': 1, 'backoff': 0}) as session:
+        assert session.get(flaky_server).status_code == 503
+    assert len(FlakyHandler.ports) == 2
+
+
+def test_session_timeout(flaky_server):
+    with make_session({'read_timeout': 0.5}) as session:
+        adapter = session.get_adapter(flaky_server)
+        assert adapter.timeout == (5, 0.5)
+    with pytest.raises(requests.ConnectionError):
+        with make_session({'connect_timeout': 0.5, 'retries': 0}) as session:
+            session.get('http://127.0.0.1:1/')
+
+
+def test_authenticate_from_cache():
+    session = FakeSession()
+    entry = {'token': {'id_token': 'cached', 'expires_at': time.time() + 300}}
+    assert authenticate(session, CONFIG, entry)['id_token'] == 'cached'
+    assert session.requests == []
+
+
+def test_authenticate_refreshes(monkeypatch):
+    monkeypatch.setattr(client, 'sleep', lambda wait: None)
+    session = FakeSession(FakeResponse(200, DISCOVERY, {'Cache-Control': 'max-age=3600', 'ETag': '"v1"'}),
+                          FakeResponse(200, {'id_token': 'refreshed', 'expires_in': 300}))
+    entry = {'token': {'id_token': 'expired', 'refresh_token': 'refresh', 'expires_at': time.time() - 1}}
+    token = authenticate(session, CONFIG, entry)
+    assert token['id_token'] == 'refreshed'
+    assert token['refresh_token'] == 'refresh'
+    assert entry['token'] == token
+    assert entry['discovery']['document'] == DISCOVERY
+    assert entry['discovery']['etag'] == '"v1"'
+    assert session.requests[1] == ('POST', 'https://idp/token', {'grant_type': 'refresh_token',
+                                                                 'refresh_token': 'refresh',
+                                                                 'client_id': 'client',
+                                                                 'client_secret': 'secret'})
+
+    # The discovery document is still fresh, so only the token endpoint is asked
+    session = FakeSession(FakeResponse(200, {'id_token': 'again', 'expires_in': 300}))
+    entry['token']['expires_at'] = time.time() - 1
+    assert authenticate(session, CONFIG, entry)['id_token'] == 'again'
+    assert [request[1] for request in session.requests] == ['https://idp/token']
+
+
+def test_authenticate_revalidates_and_falls_back_to_device_code(monkeypatch):
+    monkeypatch.setattr(client, 'sleep', lambda wait: None)
+    session = FakeSession(FakeResponse(304, {}, {'Cache-Control': 'max-age=60'}),
+                          FakeResponse(400, {'error': 'invalid_grant'}),
+                          FakeResponse(200, {'device_code': 'code', 'user_code': 'user', 'expires_in': 600,
+                                             'verification_uri': 'https://idp/verify',
+                                             'verification_uri_complete': 'https://idp/verify?code=user'}),
+                          FakeResponse(200, {'id_token': 'new', 'expires_in': 300}))
+    entry = {'discovery': {'document': DISCOVERY, 'fresh_until': time.time() - 1, 'etag': '"v1"',
+                           'last_modified': None},
+             'token': {'id_token': 'expired', 'refresh_token': 'refresh', 'expires_at': time.time() - 1}}
+    assert authenticate(session, CONFIG, entry)['id_token'] == 'new'
+    assert session.requests[0] == ('GET', CONFIG['discovery_url'], {'If-None-Match': '"v1"'})
+    assert entry['discovery']['fresh_until'] > time.time()
+    assert entry['discovery']['etag'] == '"v1"'
+    assert [request[1] for request in session.requests] == [CONFIG['discovery_url'], 'https://idp/token',
+                                                            'https://idp/device', 'https://idp/token']
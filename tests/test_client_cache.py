@@ -0,0 +1,93 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import stat
+
+from mrmat_python_api_flask.client_cache import ClientCache, freshness, token_expiry, is_valid
+
+NOW = 1_600_000_000.0
+
+
+def test_cache_roundtrip(tmp_path):
+    cache = ClientCache(str(tmp_path / 'cache'))
+    assert cache.load('https://idp/.well-known/openid-configuration', 'client') == {}
+    assert not os.path.exists(cache.directory)
+    cache.save('https://idp/.well-known/openid-configuration', 'client', {'token': {'id_token': 'token'}})
+    assert stat.S_IMODE(os.stat(cache.directory).st_mode) == 0o700
+    assert cache.load('https://idp/.well-known/openid-configuration', 'client') == {'token': {'id_token': 'token'}}
+    assert cache.load('https://idp/.well-known/openid-configuration', 'other') == {}
+    assert cache.load('https://other/.well-known/openid-configuration', 'client') == {}
+    (path,) = [os.path.join(cache.directory, name) for name in os.listdir(cache.directory)]
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_cache_ignores_exposed_entries(tmp_path):
+    cache = ClientCache(str(tmp_path))
+    cache.save('https://idp/', 'client', {'token': {'id_token': 'token'}})
+    (path,) = [os.path.join(cache.directory, name) for name in os.listdir(cache.directory)]
+    os.chmod(path, 0o644)
+    assert cache.load('https://idp/', 'client') == {}
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"truncated')
+    os.chmod(path, 0o600)
+    assert cache.load('https://idp/', 'client') == {}
+
+
+def test_cache_keeps_existing_directory(tmp_path):
+    os.chmod(tmp_path, 0o755)
+    cache = ClientCache(str(tmp_path))
+    cache.save('https://idp/', 'client', {'token': {'id_token': 'token'}})
+    assert stat.S_IMODE(os.stat(tmp_path).st_mode) == 0o755
+    assert cache.load('https://idp/', 'client') == {'token': {'id_token': 'token'}}
+
+
+def test_cache_unusable(tmp_path):
+    (tmp_path / 'file').write_text('')
+    cache = ClientCache(str(tmp_path / 'file' / 'cache'))
+    assert cache.load('https://idp/', 'client') == {}
+    cache.save('https://idp/', 'client', {'token': {'id_token': 'token'}})
+    assert cache.disabled
+    assert cache.load('https://idp/', 'client') == {}
+
+
+def test_freshness():
+    assert freshness({'Cache-Control': 'public, max-age=3600'}, NOW) == NOW + 3600
+    assert freshness({'Cache-Control': 'max-age=3600', 'Age': '600'}, NOW) == NOW + 3000
+    assert freshness({'Cache-Control': 'no-cache, max-age=3600'}, NOW) == NOW
+    assert freshness({'Cache-Control': 'no-store'}, NOW) is None
+    assert freshness({'Date': 'Sun, 13 Sep 2020 12:26:40 GMT',
+                      'Expires': 'Sun, 13 Sep 2020 13:26:40 GMT'}, NOW) == NOW + 3600
+    assert freshness({'Expires': '0'}, NOW) == NOW
+    assert freshness({'Date': 'Sun, 13 Sep 2020 12:26:40 GMT',
+                      'Last-Modified': 'Sun, 13 Sep 2020 02:26:40 GMT'}, NOW) == NOW + 3600
+    assert freshness({}, NOW) == NOW
+
+
+def test_token_expiry():
+    token = token_expiry({'id_token': 'token', 'expires_in': 300, 'refresh_expires_in': 1800}, NOW)
+    assert token['expires_at'] == NOW + 300
+    assert token['refresh_expires_at'] == NOW + 1800
+    assert is_valid(token, now=NOW + 200)
+    assert not is_valid(token, now=NOW + 280)
+    assert is_valid(token, 'refresh_expires_at', now=NOW + 280)
+    assert not is_valid(None)
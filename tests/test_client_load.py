@@ -0,0 +1,129 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import pytest
+import requests
+
+from mrmat_python_api_flask import client
+from mrmat_python_api_flask.client import make_session, load
+from mrmat_python_api_flask.client_load import LoadPlan, LoadResult, parse_mix, percentile, run_threads, run_asyncio
+
+SCOPES = ['mrmat-python-api-flask-resource-read', 'mrmat-python-api-flask-resource-write']
+
+
+def test_parse_mix():
+    assert parse_mix('greeting_v1=3, resource_get') == {'greeting_v1': 3.0, 'resource_get': 1.0}
+    with pytest.raises(ValueError):
+        parse_mix('greeting_v4')
+    with pytest.raises(ValueError):
+        parse_mix('greeting_v1=0')
+
+
+def test_summary():
+    result = LoadResult()
+    for latency in range(1, 101):
+        result.record('greeting_v1', 200, latency / 1000)
+    result.record('greeting_v2', 500, 0.5)
+    result.record('greeting_v2', None, 0.5)
+    result.elapsed = 2
+    (greeting_v1, greeting_v2, total) = result.summary()
+    assert greeting_v1 == {'operation': 'greeting_v1', 'requests': 100, 'errors': 0, 'throughput': 50.0,
+                           'p50': 0.05, 'p95': 0.095, 'p99': 0.099}
+    assert greeting_v2['errors'] == 2
+    assert total['requests'] == 102
+    assert total['errors'] == 2
+    assert percentile([], 99) == 0.0
+
+
+@pytest.mark.parametrize('model', ['threads', 'asyncio'])
+def test_load(live_server, local_idp, model):
+    token = local_idp.token(SCOPES)['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+    plan = LoadPlan(parse_mix('greeting_v1,greeting_v2,greeting_v3,resource_list,resource_create'),
+                    concurrency=4, rate=0, duration=0.5)
+    with make_session({'pool_size': 4}) as session:
+        if model == 'threads':
+            result = run_threads(live_server, plan, session, headers)
+        else:
+            result = run_asyncio(live_server, plan, headers)
+        rows = {row['operation']: row for row in result.summary()}
+        assert rows['total']['requests'] > 0
+        assert rows['total']['errors'] == 0
+        assert len(result.created) == rows['resource_create']['requests']
+        assert len(session.get(f'{live_server}/api/resource/v1/?limit=1000',
+                               headers=headers).json()['resources']) == len(result.created)
+
+
+def test_load_at_rate(live_server):
+    plan = LoadPlan(parse_mix('greeting_v1'), concurrency=2, rate=40, duration=0.5)
+    with make_session({}) as session:
+        result = run_threads(live_server, plan, session, {})
+    assert result.summary()[-1]['requests'] == 20
+
+
+def test_load_command(live_server, local_idp):
+    token = local_idp.token(SCOPES)['access_token']
+    config = {'url': live_server, 'token': token, 'concurrency': 2, 'model': 'threads', 'rate': 0, 'duration': 0.3,
+              'mix': 'resource_get,resource_create'}
+    with make_session(config) as session:
+        assert load(session, config) == 0
+        # The resource read and all resources created were removed again
+        resp = requests.get(f'{live_server}/api/resource/v1/', headers={'Authorization': f'Bearer {token}'})
+        assert resp.json()['resources'] == []
+
+
+def test_load_command_reports_leftovers(live_server, local_idp, monkeypatch):
+    token = local_idp.token(SCOPES)['access_token']
+    config = {'url': live_server, 'token': token, 'concurrency': 1, 'model': 'threads', 'rate': 0, 'duration': 0.1,
+              'mix': 'resource_get'}
+    with make_session(config) as session:
+        with monkeypatch.context() as m:
+            m.setattr(session, 'delete', lambda *args, **kwargs: requests.Response())
+            assert load(session, config) == 1
+        # The seed left behind does not get in the way of the next run
+        assert load(session, config) == 0
+    resp = requests.get(f'{live_server}/api/resource/v1/', headers={'Authorization': f'Bearer {token}'})
+    assert len(resp.json()['resources']) == 1
+
+
+def test_load_command_does_not_retry(live_server, monkeypatch):
+    sessions = []
+
+    def run(url, plan, session, headers):
+        sessions.append(session)
+        return LoadResult()
+
+    monkeypatch.setattr(client, 'run_threads', run)
+    config = {'url': live_server, 'no_auth': True, 'concurrency': 20, 'model': 'threads', 'rate': 0, 'duration': 0.1,
+              'retries': 3}
+    with make_session(config) as session:
+        load(session, config)
+    adapter = sessions[0].get_adapter(live_server)
+    assert sessions[0] is not session
+    assert adapter.max_retries.total == 0
+    assert adapter._pool_maxsize == 20  # pylint: disable=protected-access
+
+
+def test_load_command_without_auth(live_server):
+    config = {'url': live_server, 'no_auth': True, 'concurrency': 2, 'model': 'asyncio', 'rate': 0, 'duration': 0.3}
+    with make_session(config) as session:
+        assert load(session, config) == 0
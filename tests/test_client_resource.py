@@ -0,0 +1,124 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import asyncio
+
+import pytest
+
+from mrmat_python_api_flask.client_resource import AsyncResourceClient, ResourceAPIError
+
+SCOPES = ['mrmat-python-api-flask-resource-read', 'mrmat-python-api-flask-resource-write']
+
+
+def test_crud(live_server, local_idp):
+    token = local_idp.token(SCOPES)['access_token']
+
+    async def crud():
+        async with AsyncResourceClient(live_server, token=token) as client:
+            created = await client.create('crud')
+            assert created['name'] == 'crud'
+            assert await client.get_one(created['id']) == created
+            modified = await client.modify(created['id'], 'renamed')
+            assert modified['name'] == 'renamed'
+            with pytest.raises(ResourceAPIError) as rae:
+                await client.create('renamed')
+            assert rae.value.status == 409
+            await client.remove(created['id'])
+            with pytest.raises(ResourceAPIError) as rae:
+                await client.get_one(created['id'])
+            assert rae.value.status == 404
+
+    asyncio.run(crud())
+
+
+def test_batches_and_iteration(live_server, local_idp):
+    token = local_idp.token(SCOPES)['access_token']
+
+    async def batches():
+        async with AsyncResourceClient(live_server, token=token, batch_size=10) as client:
+            results = await client.create_batch([f'batch-{idx}' for idx in range(0, 25)])
+            assert [result['status'] for result in results] == [201] * 25
+            ids = [result['resource']['id'] for result in results]
+            results = await client.create_batch(['batch-0', 'batch-25'])
+            assert [result['status'] for result in results] == [409, 201]
+            ids.append(results[1]['resource']['id'])
+            # The chunks are created concurrently, so identifiers are not necessarily in the order of the names
+            assert [resource['id'] async for resource in client.get_all(limit=7)] == sorted(ids)
+
+            modified = await client.modify_batch({i: f'renamed-{i}' for i in ids + [999999]})
+            assert sorted(resource['id'] for resource in modified['modified']) == sorted(ids)
+            assert modified['missing'] == [999999]
+
+            removed = await client.remove_batch(ids)
+            assert sorted(removed['removed']) == sorted(ids)
+            assert [resource async for resource in client.get_all()] == []
+
+    asyncio.run(batches())
+
+
+def test_create_batch_partial_failure(live_server, local_idp):
+    token = local_idp.token(SCOPES)['access_token']
+
+    async def create():
+        async with AsyncResourceClient(live_server, token=token, batch_size=2) as client:
+            request = client._request  # pylint: disable=protected-access
+
+            async def failing_request(method, path, params=None, json=None, expected=(200,)):
+                if json and {'name': 'c'} in json:
+                    raise ResourceAPIError(503, 'Service Unavailable')
+                return await request(method, path, params=params, json=json, expected=expected)
+
+            client._request = failing_request  # pylint: disable=protected-access
+            # Without de-duplication, the repeated 'a' would land in a concurrent chunk and fail all of it with 409
+            results = await client.create_batch(['a', 'b', 'c', 'd', 'a', 'e'])
+            assert [result['status'] for result in results] == [201, 201, 503, 503, 409, 201]
+            assert [result['resource']['name'] for result in results if result['status'] == 201] == ['a', 'b', 'e']
+            assert results[2]['message'] == 'Service Unavailable'
+            assert sorted([resource['name'] async for resource in client.get_all()]) == ['a', 'b', 'e']
+
+    asyncio.run(create())
+
+
+def test_bounded_fan_out(live_server, local_idp):
+    token = local_idp.token(SCOPES)['access_token']
+
+    async def fan_out():
+        async with AsyncResourceClient(live_server, token=token, concurrency=4) as client:
+            created = await client.create('fan-out')
+            in_flight = []
+            request = client._session.request     # pylint: disable=protected-access
+
+            def counting_request(*args, **kwargs):
+                in_flight.append(client.concurrency - client._semaphore._value)     # pylint: disable=protected-access
+                return request(*args, **kwargs)
+
+            client._session.request = counting_request     # pylint: disable=protected-access
+            resources = await asyncio.gather(*[client.get_one(created['id']) for _ in range(0, 200)])
+            assert resources == [created] * 200
+            assert max(in_flight) == 4
+
+    asyncio.run(fan_out())
+
+
+def test_requires_context():
+    with pytest.raises(RuntimeError):
+        asyncio.run(AsyncResourceClient('http://127.0.0.1:1').get_one(1))
@@ -0,0 +1,90 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import time
+import threading
+
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+import pytest
+from flask.testing import FlaskClient
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from mrmat_python_api_flask import create_app, db
+from mrmat_python_api_flask import db_migrations
+from mrmat_python_api_flask.db_migrations import HEAD_REVISION, current_revisions, migrate
+
+
+def _stamp(revision: str):
+    db.session.execute(text('CREATE TABLE IF NOT EXISTS alembic_version '
+                            '(version_num VARCHAR(32) NOT NULL PRIMARY KEY)'))
+    db.session.execute(text('DELETE FROM alembic_version'))
+    db.session.execute(text('INSERT INTO alembic_version VALUES (:revision)'), {'revision': revision})
+    db.session.commit()
+
+
+def test_head_revision():
+    config = Config()
+    config.set_main_option('script_location', 'migrations')
+    assert ScriptDirectory.from_config(config).get_heads() == [HEAD_REVISION]
+
+
+def test_current_revisions(client: FlaskClient):
+    with client.application.app_context():
+        assert current_revisions() == set()
+        _stamp('d11062fbec93')
+        assert current_revisions() == {'d11062fbec93'}
+
+
+def test_current_revisions_error(client: FlaskClient):
+    """Only a missing version table means that the database has never been migrated"""
+    with client.application.app_context():
+        db.session.execute(text('CREATE TABLE alembic_version (revision VARCHAR(32) NOT NULL PRIMARY KEY)'))
+        db.session.commit()
+        with pytest.raises(OperationalError):
+            current_revisions()
+
+
+def test_migrate_once(tmp_path, monkeypatch):
+    """Of several processes starting at the same time only one migrates, the others wait for it"""
+    upgrades = []
+
+    def fake_upgrade():
+        upgrades.append(threading.get_ident())
+        time.sleep(0.2)
+        _stamp(HEAD_REVISION)
+
+    monkeypatch.setattr(db_migrations, 'upgrade', fake_upgrade)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "migrate.sqlite"}'},
+                     instance_path=str(tmp_path))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(migrate(app))) for _ in range(0, 4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(upgrades) == 1
+    assert sorted(results) == [False, False, False, True]
+
+    assert migrate(app) is False
+    assert len(upgrades) == 1
@@ -0,0 +1,107 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import pytest
+
+from flask.testing import FlaskClient
+
+from mrmat_python_api_flask import create_app, db
+from mrmat_python_api_flask.db_routing import ReplicaSet
+from resource_api_client import ResourceAPIClient
+
+
+@pytest.fixture
+def replicated_client(tmp_path, test_config, local_idp):
+    """An app with a primary and a replica in two separate SQLite files, which do not replicate to each other"""
+    if test_config is not None:
+        pytest.skip('Replica routing is tested against the stand-in identity provider')
+    config = {'TESTING': True,
+              'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "primary.sqlite"}',
+              'DB_REPLICA_URIS': [f'sqlite:///{tmp_path / "replica.sqlite"}'],
+              **local_idp.config()}
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+        db.Model.metadata.create_all(db.get_engine(app, bind='replica_0'))
+    with app.test_client() as client:
+        yield client
+
+
+def test_reads_from_replica(replicated_client: FlaskClient, local_idp):
+    writer = ResourceAPIClient(replicated_client, token=local_idp.token(['mrmat-python-api-flask-resource-write']))
+    (resp, resp_body) = writer.create(name='Primary Resource')
+    assert resp.status_code == 201
+    i = resp_body['id']
+
+    # Another caller reads from the replica, which never received the write
+    reader = ResourceAPIClient(replicated_client,
+                               token=local_idp.token(['mrmat-python-api-flask-resource-read'], azp='other-client'))
+    (resp, resp_body) = reader.get_all()
+    assert resp.status_code == 200
+    assert resp_body['resources'] == []
+    (resp, resp_body) = reader.get_one(i)
+    assert resp.status_code == 404
+
+    # The writer reads its own write from the primary
+    own_reader = ResourceAPIClient(replicated_client,
+                                   token=local_idp.token(['mrmat-python-api-flask-resource-read']))
+    (resp, resp_body) = own_reader.get_all()
+    assert [r['id'] for r in resp_body['resources']] == [i]
+    (resp, resp_body) = own_reader.get_one(i)
+    assert resp.status_code == 200
+
+
+def test_replica_fallback(tmp_path, local_idp, test_config):
+    if test_config is not None:
+        pytest.skip('Replica routing is tested against the stand-in identity provider')
+    app = create_app({'TESTING': True,
+                      'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "primary.sqlite"}',
+                      'DB_REPLICA_URIS': [f'sqlite:///{tmp_path / "missing" / "replica.sqlite"}'],
+                      'DB_REPLICA_STICKINESS': 0,
+                      **local_idp.config()})
+    with app.app_context():
+        db.create_all(bind=None)
+    with app.test_client() as client:
+        writer = ResourceAPIClient(client, token=local_idp.token(['mrmat-python-api-flask-resource-write']))
+        (resp, resp_body) = writer.create(name='Primary Resource')
+        assert resp.status_code == 201
+
+        reader = ResourceAPIClient(client, token=local_idp.token(['mrmat-python-api-flask-resource-read']))
+        (resp, resp_body) = reader.get_all()
+        assert resp.status_code == 200
+        assert len(resp_body['resources']) == 1
+        assert client.get('/internal/replicas').status_code == 401
+        admin = {'Authorization': f'Bearer {local_idp.token(["mrmat-python-api-flask-admin"])["access_token"]}'}
+        assert client.get('/internal/replicas', headers=admin).get_json() == {'replicas': {'replica_0': False}}
+
+
+def test_replica_set():
+    replicas = ReplicaSet(bind_keys=['replica_0', 'replica_1'], retry_interval=60, stickiness=60)
+    assert {replicas.choose(), replicas.choose()} == {'replica_0', 'replica_1'}
+    replicas.mark_down('replica_0')
+    assert [replicas.choose(), replicas.choose()] == ['replica_1', 'replica_1']
+    replicas.mark_written('writer')
+    assert replicas.choose('writer') is None
+    assert replicas.choose('reader') == 'replica_1'
+    replicas.mark_down('replica_1')
+    assert replicas.choose('reader') is None
+    assert replicas.health() == {'replica_0': False, 'replica_1': False}
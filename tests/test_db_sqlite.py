@@ -0,0 +1,71 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+from flask import Flask
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+from mrmat_python_api_flask import create_app, db
+from mrmat_python_api_flask.db_pool import InstrumentedQueuePool, pool_statistics
+from mrmat_python_api_flask.db_sqlite import configure_sqlite, sqlite_pragmas
+
+
+def test_sqlite_profile(tmp_path):
+    app = create_app({'TESTING': True,
+                      'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "profile.sqlite"}',
+                      'DB_SQLITE_BUSY_TIMEOUT': 1234})
+    with app.app_context():
+        assert isinstance(db.engine.pool, InstrumentedQueuePool)
+        for (pragma, expected) in {'journal_mode': 'wal',
+                                   'synchronous': 1,
+                                   'busy_timeout': 1234,
+                                   'mmap_size': 256 * 1024 * 1024,
+                                   'cache_size': -64 * 1024,
+                                   'foreign_keys': 1}.items():
+            assert db.session.execute(f'PRAGMA {pragma}').scalar() == expected
+        assert pool_statistics(db.engine.pool)['checkouts'] >= 1
+
+
+def test_sqlite_engine_options(tmp_path):
+    app = create_app({'TESTING': True,
+                      'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "nullpool.sqlite"}',
+                      'SQLALCHEMY_ENGINE_OPTIONS': {'poolclass': NullPool}})
+    with app.app_context():
+        assert isinstance(db.engine.pool, NullPool)
+        assert db.session.execute('PRAGMA journal_mode').scalar() == 'wal'
+
+    app = create_app({'TESTING': True,
+                      'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "sized.sqlite"}',
+                      'SQLALCHEMY_ENGINE_OPTIONS': {'pool_size': 2}})
+    with app.app_context():
+        assert isinstance(db.engine.pool, QueuePool)
+        assert db.engine.pool.size() == 2
+
+
+def test_sqlite_pragmas():
+    app = Flask(__name__)
+    configure_sqlite(app)
+    assert sqlite_pragmas(app, make_url('sqlite:////var/db/mrmat.sqlite'))['journal_mode'] == 'wal'
+    assert sqlite_pragmas(app, make_url('sqlite://')) == {'foreign_keys': 'ON'}
+    assert sqlite_pragmas(app, make_url('postgresql://localhost/mrmat')) == {}
+    app.config['DB_SQLITE_PROFILE'] = False
+    assert sqlite_pragmas(app, make_url('sqlite:////var/db/mrmat.sqlite')) == {'foreign_keys': 'ON'}
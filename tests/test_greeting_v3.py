@@ -35,4 +35,6 @@ def test_greeting_v3(client: FlaskClient, test_config: Dict, oidc_token_read: Op
     assert rv.status_code == 200
     json_body = rv.get_json()
     assert 'message' in json_body
-    assert json_body['message'] == f'Hello {test_config["client"]["preferred_name"]}'
+    preferred_name = test_config['client']['preferred_name'] if test_config is not None \
+        else oidc_token_read['jwt']['preferred_username']
+    assert json_body['message'] == f'Hello {preferred_name}'
@@ -20,8 +20,13 @@
 #  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 #  SOFTWARE.
 
+from alembic.config import Config
+from alembic.script import ScriptDirectory
 from flask import Response
 from flask.testing import FlaskClient
+from sqlalchemy import text
+
+from mrmat_python_api_flask import create_app, db
 
 
 def test_healthz(client: FlaskClient):
@@ -29,3 +34,51 @@ def test_healthz(client: FlaskClient):
     json_body = rv.get_json()
     assert 'status' in json_body
     assert json_body['status'] == 'OK'
+
+
+def test_live(client: FlaskClient):
+    rv: Response = client.get('/healthz/live')
+    assert rv.status_code == 200
+    assert rv.get_json()['status'] == 'OK'
+
+
+def test_ready(client: FlaskClient, test_config, query_counter):
+    rv: Response = client.get('/healthz/ready')
+    assert rv.status_code == 503
+    json_body = rv.get_json()
+    assert json_body['status'] == 'UNAVAILABLE'
+    assert json_body['checks']['database']['status'] == 'OK'
+    assert json_body['checks']['migrations']['status'] == 'FAILED'
+    if test_config is None:
+        assert json_body['checks']['identity_provider']['status'] == 'OK'
+
+    config = Config()
+    config.set_main_option('script_location', 'migrations')
+    with client.application.app_context():
+        db.session.execute(text('CREATE TABLE alembic_version (version_num VARCHAR(32) NOT NULL PRIMARY KEY)'))
+        for head in ScriptDirectory.from_config(config).get_heads():
+            db.session.execute(text('INSERT INTO alembic_version VALUES (:head)'), {'head': head})
+        db.session.commit()
+
+    # Results are cached, so repeated probes neither touch the database nor see the change yet
+    query_counter.reset()
+    rv = client.get('/healthz/ready')
+    assert rv.status_code == 503
+    assert query_counter.count == 0
+
+    client.application.extensions['healthz_cache'].clear()
+    rv = client.get('/healthz/ready')
+    assert rv.status_code == 200
+    assert rv.get_json()['checks']['migrations']['status'] == 'OK'
+
+
+def test_ready_unreachable_database(tmp_path):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "missing" / "db.sqlite"}'})
+    with app.test_client() as client:
+        rv: Response = client.get('/healthz/ready')
+        assert rv.status_code == 503
+        json_body = rv.get_json()
+        assert json_body['checks']['database']['status'] == 'FAILED'
+        assert json_body['checks']['migrations']['status'] == 'FAILED'
+        # The failure is cached like any other result, so probes do not keep hitting the database
+        assert app.extensions['healthz_cache'].get('migrations') == json_body['checks']['migrations']
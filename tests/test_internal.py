@@ -0,0 +1,76 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import pytest
+
+from flask import Flask, Response
+from flask.testing import FlaskClient
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from mrmat_python_api_flask.db_pool import InstrumentedQueuePool, configure_pool, pool_statistics, pool_exhausted
+
+
+def test_pool(client: FlaskClient, oidc_token_read, oidc_token_admin):
+    assert client.get('/internal/pool').status_code == 401
+    rv: Response = client.get('/internal/pool', headers={'Authorization': f'Bearer {oidc_token_read["access_token"]}'})
+    assert rv.status_code == 401
+    rv = client.get('/internal/pool', headers={'Authorization': f'Bearer {oidc_token_admin["access_token"]}'})
+    assert rv.status_code == 200
+    json_body = rv.get_json()
+    assert json_body['pool'] == 'StaticPool'
+
+
+def test_configure_pool():
+    app = Flask(__name__)
+    app.config.update({'SQLALCHEMY_DATABASE_URI': 'postgresql://localhost/mrmat',
+                       'DB_POOL_SIZE': 20,
+                       'SQLALCHEMY_ENGINE_OPTIONS': {'pool_recycle': 60}})
+    configure_pool(app)
+    options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    assert options['poolclass'] is InstrumentedQueuePool
+    assert options['pool_size'] == 20
+    assert options['max_overflow'] == 10
+    assert options['pool_recycle'] == 60
+    assert options['pool_pre_ping'] is True
+
+    app.config.update({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SQLALCHEMY_ENGINE_OPTIONS': {}})
+    configure_pool(app)
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS'] == {'pool_pre_ping': True}
+
+
+def test_pool_statistics():
+    engine = create_engine('sqlite://', poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.1)
+    connection = engine.connect()
+    stats = pool_statistics(engine.pool)
+    assert stats['checked_out'] == 1
+    assert stats['checkouts'] == 1
+    assert pool_exhausted(engine.pool)
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    stats = pool_statistics(engine.pool)
+    assert stats['timeouts'] == 1
+    assert stats['checkouts'] == 1
+    assert stats['wait_time_max'] >= 0.1
+    connection.close()
+    assert pool_statistics(engine.pool)['checked_in'] == 1
+    assert not pool_exhausted(engine.pool)
@@ -0,0 +1,138 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import json
+import queue
+import logging
+
+import pytest
+from flask import Flask
+
+from mrmat_python_api_flask import logs
+from mrmat_python_api_flask.logs import JSONFormatter, SamplingFilter, DroppingQueueHandler, configure_logging, \
+    reset_after_fork, access_log
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(self.format(record))
+
+
+def test_json_formatter():
+    record = logging.LogRecord('mrmat', logging.INFO, __file__, 1, 'Called by %s (%s)', ('Test', 'test-client'), None)
+    record.client_id = 'test-client'
+    entry = json.loads(JSONFormatter().format(record))
+    assert entry['message'] == 'Called by Test (test-client)'
+    assert entry['level'] == 'INFO'
+    assert entry['client_id'] == 'test-client'
+
+
+def test_sampling_filter():
+    record = logging.LogRecord('mrmat', logging.INFO, __file__, 1, 'Called', None, None)
+    assert SamplingFilter(1.0).filter(record)
+    assert not SamplingFilter(0.0).filter(record)
+
+
+def test_dropping_queue_handler():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    for _ in range(0, 3):
+        handler.handle(logging.LogRecord('mrmat', logging.INFO, __file__, 1, 'Called', None, None))
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 2
+
+
+def test_configure_logging():
+    root = logging.getLogger()
+    capture = ListHandler()
+    root.addHandler(capture)
+    app = Flask(__name__)
+    try:
+        app.config.update({'LOG_QUEUE': True, 'LOG_ACCESS_SAMPLE_RATE': 0.0})
+        configure_logging(app)
+        assert len(root.handlers) == 1
+        assert isinstance(root.handlers[0], DroppingQueueHandler)
+        logging.getLogger('mrmat_python_api_flask').warning('Queued %s', 'record')
+        access_log.warning('Sampled out')
+
+        # Switching back stops the listener, which flushes the queue and restores the handlers
+        app.config.update({'LOG_QUEUE': False, 'LOG_ACCESS_SAMPLE_RATE': 1.0})
+        configure_logging(app)
+        assert capture in root.handlers
+        assert capture.records == ['Queued record']
+        assert access_log.filters == []
+    finally:
+        root.removeHandler(capture)
+
+
+def test_configure_logging_json():
+    root = logging.getLogger()
+    capture = ListHandler()
+    plain = logging.Formatter('%(levelname)s %(message)s')
+    capture.setFormatter(plain)
+    root.addHandler(capture)
+    app = Flask(__name__)
+    try:
+        app.config.update({'LOG_JSON': True})
+        configure_logging(app)
+        logging.getLogger('mrmat_python_api_flask').warning('As %s', 'JSON')
+        assert json.loads(capture.records[-1])['message'] == 'As JSON'
+
+        # Switching back restores the formatter the handler had before
+        app.config.update({'LOG_JSON': False})
+        configure_logging(app)
+        assert capture.formatter is plain
+        logging.getLogger('mrmat_python_api_flask').warning('As %s', 'text')
+        assert capture.records[-1] == 'WARNING As text'
+    finally:
+        root.removeHandler(capture)
+
+
+def test_reset_after_fork(monkeypatch):
+    root = logging.getLogger()
+    capture = ListHandler()
+    root.addHandler(capture)
+    app = Flask(__name__)
+    try:
+        app.config.update({'LOG_QUEUE': True})
+        configure_logging(app)
+        inherited = root.handlers[0]
+        listener = logs._listener   # pylint: disable=protected-access
+        # The queue of the inherited listener may be full or locked, so it must not be stopped
+        with monkeypatch.context() as m:
+            m.setattr(listener, 'stop', lambda: pytest.fail('The inherited listener was stopped'))
+            reset_after_fork()
+        assert capture in root.handlers
+        configure_logging(app)
+        assert root.handlers[0] is not inherited
+        logging.getLogger('mrmat_python_api_flask').warning('Fresh')
+
+        app.config.update({'LOG_QUEUE': False})
+        configure_logging(app)
+        assert 'Fresh' in capture.records
+        # Without a fork, the thread of the inherited listener is still running here
+        listener.stop()
+    finally:
+        root.removeHandler(capture)
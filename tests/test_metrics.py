@@ -0,0 +1,84 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import pytest
+import os
+import sys
+import subprocess
+
+from typing import Dict
+from flask import Response
+from flask.testing import FlaskClient
+from prometheus_client import REGISTRY
+
+from resource_api_client import ResourceAPIClient
+
+
+def _sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_request_metrics(client: FlaskClient):
+    labels = {'endpoint': 'healthz.live', 'method': 'GET', 'status': '200'}
+    before = _sample('http_requests_total', **labels)
+    client.get('/healthz/live')
+    client.get('/healthz/live')
+    assert _sample('http_requests_total', **labels) == before + 2
+    assert _sample('http_request_duration_seconds_count', **labels) >= 2
+
+    rv: Response = client.get('/metrics')
+    assert rv.status_code == 200
+    assert _sample('http_requests_in_progress', endpoint='healthz.live') == 0
+    assert rv.mimetype == 'text/plain'
+    assert 'http_requests_total{endpoint="healthz.live",method="GET",status="200"}' in rv.get_data(as_text=True)
+
+
+def test_db_and_token_metrics(client: FlaskClient, oidc_token_read: Dict, test_config):
+    if test_config is not None:
+        pytest.skip('Token validation metrics are tested against the stand-in identity provider')
+    queries_before = _sample('http_request_db_queries_sum', endpoint='resource_v1.get_all')
+    local_before = _sample('token_validation_duration_seconds_count', method='local', result='valid')
+    cache_before = _sample('token_validation_duration_seconds_count', method='cache', result='valid')
+    rac = ResourceAPIClient(client, token=oidc_token_read)
+    rac.get_all()
+    rac.get_all()
+    assert _sample('http_request_db_queries_sum', endpoint='resource_v1.get_all') == queries_before + 4
+    assert _sample('http_request_db_duration_seconds_sum', endpoint='resource_v1.get_all') > 0
+    assert _sample('token_validation_duration_seconds_count', method='local', result='valid') == local_before + 1
+    assert _sample('token_validation_duration_seconds_count', method='cache', result='valid') == cache_before + 1
+
+
+def test_multiprocess_metrics(tmp_path):
+    """Metrics of several worker processes are aggregated by whichever worker is scraped"""
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    env.pop('FLASK_CONFIG', None)
+    worker = "from mrmat_python_api_flask import create_app\n" \
+             "client = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'}).test_client()\n" \
+             "for _ in range(3):\n" \
+             "    client.get('/healthz/live')\n"
+    for _ in range(2):
+        subprocess.run([sys.executable, '-c', worker], env=env, check=True, capture_output=True)
+    scraper = "from mrmat_python_api_flask import create_app\n" \
+              "client = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'}).test_client()\n" \
+              "print(client.get('/metrics').get_data(as_text=True))\n"
+    exposition = subprocess.run([sys.executable, '-c', scraper], env=env, check=True, capture_output=True, text=True)
+    assert 'http_requests_total{endpoint="healthz.live",method="GET",status="200"} 6.0' in exposition.stdout
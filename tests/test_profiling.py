@@ -0,0 +1,109 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import pytest
+
+from flask.testing import FlaskClient
+
+from mrmat_python_api_flask import create_app, db
+from mrmat_python_api_flask.profiling import Profiler
+
+
+@pytest.fixture
+def profiled_client(tmp_path, test_config, local_idp):
+    if test_config is not None:
+        pytest.skip('Profiling is tested against the stand-in identity provider')
+    app = create_app({'TESTING': True,
+                      'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+                      'PROFILING_SECRET': 'profiling-secret',
+                      'PROFILING_DIRECTORY': str(tmp_path),
+                      'PROFILING_MAX_REPORTS': 2,
+                      **local_idp.config()})
+    with app.app_context():
+        db.create_all()
+    with app.test_client() as client:
+        yield client
+
+
+def admin_headers(local_idp) -> dict:
+    return {'Authorization': f'Bearer {local_idp.token(["mrmat-python-api-flask-admin"])["access_token"]}'}
+
+
+def test_profiling(profiled_client: FlaskClient, local_idp):
+    headers = {'Authorization': f'Bearer {local_idp.token(["mrmat-python-api-flask-resource-read"])["access_token"]}'}
+    profiled_client.get('/api/resource/v1/', headers=headers, buffered=True)
+    profiled_client.get('/api/resource/v1/', headers=dict(headers, **{'X-Profile': 'forged'}), buffered=True)
+    assert profiled_client.get('/internal/profiles', headers=admin_headers(local_idp)).get_json() == {'profiles': []}
+
+    headers['X-Profile'] = Profiler.sign('profiling-secret')
+    rv = profiled_client.get('/api/resource/v1/', headers=headers, buffered=True)
+    assert rv.status_code == 200
+    profiles = profiled_client.get('/internal/profiles', headers=admin_headers(local_idp)).get_json()['profiles']
+    assert len(profiles) == 1
+    assert profiles[0]['path'] == '/api/resource/v1/'
+    assert profiles[0]['status'] == 200
+    assert profiles[0]['sql_count'] == 2
+
+    report = profiled_client.get(f'/internal/profiles/{profiles[0]["id"]}', headers=admin_headers(local_idp)).get_json()
+    assert all(statement['statement'].startswith('SELECT') for statement in report['sql'])
+    assert 'function calls' in report['profile']
+    assert profiled_client.get('/internal/profiles/unknown', headers=admin_headers(local_idp)).status_code == 404
+
+
+def test_profiling_requires_admin(profiled_client: FlaskClient, local_idp):
+    read = {'Authorization': f'Bearer {local_idp.token(["mrmat-python-api-flask-resource-read"])["access_token"]}'}
+    for path in ['/internal/profiles', '/internal/profiles/unknown']:
+        assert profiled_client.get(path).status_code == 401
+        assert profiled_client.get(path, headers=read).status_code == 401
+
+
+def test_profiling_stream(profiled_client: FlaskClient, local_idp):
+    headers = {'Authorization': f'Bearer {local_idp.token(["mrmat-python-api-flask-resource-read"])["access_token"]}',
+               'Accept': 'application/x-ndjson',
+               'X-Profile': Profiler.sign('profiling-secret')}
+    profiled_client.get('/api/resource/v1/', headers=headers, buffered=True)
+    profiles = profiled_client.get('/internal/profiles', headers=admin_headers(local_idp)).get_json()['profiles']
+    assert len(profiles) == 1
+    assert profiles[0]['sql_count'] == 1
+
+
+def test_profiling_ring_buffer(profiled_client: FlaskClient, local_idp):
+    for _ in range(0, 3):
+        profiled_client.get('/healthz/live', headers={'X-Profile': Profiler.sign('profiling-secret')}, buffered=True)
+    profiles = profiled_client.get('/internal/profiles', headers=admin_headers(local_idp)).get_json()['profiles']
+    assert len(profiles) == 2
+    assert profiles[0]['id'] > profiles[1]['id']
+
+
+def test_profiling_sampled(tmp_path, local_idp):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+                      'PROFILING_SAMPLE_RATE': 1.0, 'PROFILING_DIRECTORY': str(tmp_path),
+                      **local_idp.config()})
+    client = app.test_client()
+    client.get('/healthz/live', buffered=True)
+    assert len(client.get('/internal/profiles', headers=admin_headers(local_idp)).get_json()['profiles']) == 1
+
+
+def test_profiling_disabled(client: FlaskClient, oidc_token_admin):
+    assert 'profiler' not in client.application.extensions
+    rv = client.get('/internal/profiles', headers={'Authorization': f'Bearer {oidc_token_admin["access_token"]}'})
+    assert rv.status_code == 404
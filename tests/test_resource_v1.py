@@ -25,6 +25,11 @@ import pytest
 from typing import Dict
 from flask.testing import FlaskClient
 
+from flask import json
+from sqlalchemy.orm import joinedload
+
+from mrmat_python_api_flask import db
+from mrmat_python_api_flask.apis.resource.v1 import Owner, Resource, ChangeMarker, ResourceSchema, ResourceRowSchema
 from resource_api_client import ResourceAPIClient
 
 
@@ -38,6 +43,117 @@ def test_create(client: FlaskClient, oidc_token_write: Dict):
     assert resp_body['name'] == 'Test Resource 1'
 
 
+def test_create_duplicate(client: FlaskClient, local_idp, test_config, oidc_token_write):
+    if oidc_token_write is None:
+        pytest.skip('No OIDC configuration is available')
+    rac = ResourceAPIClient(client, token=oidc_token_write)
+    (resp, resp_body) = rac.create(name='Unique Resource')
+    assert resp.status_code == 201
+    i = resp_body['id']
+    (resp, resp_body) = rac.create(name='Unique Resource')
+    assert resp.status_code == 409
+    assert resp_body['message'].endswith(f'with id {i}')
+
+    (resp, resp_body) = rac.create(name='Other Resource')
+    assert resp.status_code == 201
+    (resp, resp_body) = rac.modify(resp_body['id'], name='Unique Resource')
+    assert resp.status_code == 409
+
+    if test_config is None:
+        rac_other = ResourceAPIClient(client, token=local_idp.token(['mrmat-python-api-flask-resource-write'],
+                                                                    azp='other-client', preferred_username='other'))
+        (resp, resp_body) = rac_other.create(name='Unique Resource')
+        assert resp.status_code == 201
+
+
+def test_owner_cache(client: FlaskClient, query_counter, oidc_token_write):
+    if oidc_token_write is None:
+        pytest.skip('No OIDC configuration is available')
+    rac = ResourceAPIClient(client, token=oidc_token_write)
+    owner_cache = client.application.extensions['owner_cache']
+    client_id = oidc_token_write['jwt']['azp']
+    (resp, resp_body) = rac.create(name='First Owned Resource')
+    assert resp.status_code == 201
+    assert owner_cache.get(client_id) == resp_body['owner']['id']
+
+    query_counter.reset()
+    (resp, resp_body) = rac.create(name='Second Owned Resource')
+    assert resp.status_code == 201
+    assert query_counter.count == 3     # INSERT, collection change marker and reading back the resource
+
+    with client.application.app_context():
+        owner = Owner.query.filter(Owner.client_id == client_id).one()
+        owner.name = 'Renamed Owner'
+        db.session.commit()
+    assert owner_cache.get(client_id) is None
+
+
+def test_create_batch(client: FlaskClient, oidc_token_write):
+    if oidc_token_write is None:
+        pytest.skip('No OIDC configuration is available')
+    rac = ResourceAPIClient(client, token=oidc_token_write)
+    (resp, resp_body) = rac.create(name='Existing Resource')
+    assert resp.status_code == 201
+
+    (resp, resp_body) = rac.create_batch([{'name': 'Batch Resource 1'},
+                                          {'name': 'Existing Resource'},
+                                          {'name': 'Batch Resource 2'},
+                                          {'name': 'Batch Resource 1'},
+                                          {'name': 42}])
+    assert resp.status_code == 207
+    assert [r['status'] for r in resp_body['results']] == [201, 409, 201, 409, 422]
+    assert resp_body['results'][0]['resource']['name'] == 'Batch Resource 1'
+    assert resp_body['results'][2]['resource']['name'] == 'Batch Resource 2'
+    assert resp_body['results'][0]['resource']['owner']['client_id'] == oidc_token_write['jwt']['azp']
+
+    (resp, resp_body) = rac.create_batch([])
+    assert resp.status_code == 400
+
+
+def test_create_stale_owner(client: FlaskClient, oidc_token_write):
+    if oidc_token_write is None:
+        pytest.skip('No OIDC configuration is available')
+    rac = ResourceAPIClient(client, token=oidc_token_write)
+    owner_cache = client.application.extensions['owner_cache']
+    client_id = oidc_token_write['jwt']['azp']
+    (resp, resp_body) = rac.create(name='Existing Resource')
+    owner_id = resp_body['owner']['id']
+
+    owner_cache.put(client_id, 4242)
+    (resp, resp_body) = rac.create(name='Stale Resource')
+    assert resp.status_code == 201
+    assert resp_body['owner']['id'] == owner_id
+    assert owner_cache.get(client_id) == owner_id
+
+    owner_cache.put(client_id, 4242)
+    (resp, resp_body) = rac.create(name='Existing Resource')
+    assert resp.status_code == 409
+    with client.application.app_context():
+        assert Resource.query.filter(Resource.owner_id == 4242).count() == 0
+
+
+def test_create_batch_stale_owner(client: FlaskClient, query_counter, oidc_token_write):
+    if oidc_token_write is None:
+        pytest.skip('No OIDC configuration is available')
+    rac = ResourceAPIClient(client, token=oidc_token_write)
+    owner_cache = client.application.extensions['owner_cache']
+    client_id = oidc_token_write['jwt']['azp']
+    owner_cache.put(client_id, 4242)
+
+    (resp, resp_body) = rac.create_batch([{'name': 'Batch Resource 1'}])
+    assert resp.status_code == 207
+    assert resp_body['results'][0]['status'] == 201
+    owner_id = resp_body['results'][0]['resource']['owner']['id']
+    assert owner_id != 4242
+    assert owner_cache.get(client_id) == owner_id
+
+    query_counter.reset()
+    (resp, resp_body) = rac.create_batch([{'name': 'Batch Resource 2'}, {'name': 'Batch Resource 3'}])
+    assert [r['status'] for r in resp_body['results']] == [201, 201]
+    assert all(r['resource']['owner']['id'] == owner_id for r in resp_body['results'])
+    assert query_counter.count == 4     # Existing names, two INSERTs and the collection change marker
+
+
 def test_modify(client: FlaskClient, oidc_token_write):
     if oidc_token_write is None:
         pytest.skip('No OIDC configuration is available')
@@ -67,6 +183,57 @@ def test_remove(client: FlaskClient, oidc_token_write):
     assert resp_body is None
 
 
+def test_modify_batch(client: FlaskClient, local_idp, test_config, oidc_token_read, oidc_token_write):
+    if test_config is not None:
+        pytest.skip('Requires the local stand-in identity provider to impersonate a second owner')
+    rac = ResourceAPIClient(client, token=oidc_token_write)
+    rac_other = ResourceAPIClient(client, token=local_idp.token(['mrmat-python-api-flask-resource-write'],
+                                                                azp='other-client', preferred_username='other'))
+    ids = [rac.create(name=f'Renamed Resource {i}')[1]['id'] for i in range(0, 2)]
+    other_id = rac_other.create(name='Foreign Resource')[1]['id']
+
+    (resp, resp_body) = rac.modify_batch([{'id': ids[0], 'name': 'Renamed A'},
+                                          {'id': ids[1], 'name': 'Renamed B'},
+                                          {'id': other_id, 'name': 'Hijacked'},
+                                          {'id': 999, 'name': 'Nonexistent'}])
+    assert resp.status_code == 200
+    assert resp_body['modified'] == [{'id': ids[0], 'name': 'Renamed A'}, {'id': ids[1], 'name': 'Renamed B'}]
+    assert resp_body['not_owned'] == [other_id]
+    assert resp_body['missing'] == [999]
+
+    rac_read = ResourceAPIClient(client, token=oidc_token_read)
+    assert rac_read.get_one(ids[0])[1]['name'] == 'Renamed A'
+    assert rac_read.get_one(ids[1])[1]['name'] == 'Renamed B'
+    assert rac_read.get_one(other_id)[1]['name'] == 'Foreign Resource'
+
+    (resp, resp_body) = rac.modify_batch([{'name': 'No identifier'}])
+    assert resp.status_code == 422
+
+
+def test_remove_batch(client: FlaskClient, local_idp, test_config, oidc_token_read, oidc_token_write):
+    if test_config is not None:
+        pytest.skip('Requires the local stand-in identity provider to impersonate a second owner')
+    rac = ResourceAPIClient(client, token=oidc_token_write)
+    rac_other = ResourceAPIClient(client, token=local_idp.token(['mrmat-python-api-flask-resource-write'],
+                                                                azp='other-client', preferred_username='other'))
+    ids = [rac.create(name=f'Removed Resource {i}')[1]['id'] for i in range(0, 3)]
+    other_id = rac_other.create(name='Foreign Resource')[1]['id']
+
+    (resp, resp_body) = rac.remove_batch([ids[0], ids[1], other_id, 999])
+    assert resp.status_code == 200
+    assert resp_body['removed'] == [ids[0], ids[1]]
+    assert resp_body['not_owned'] == [other_id]
+    assert resp_body['missing'] == [999]
+
+    rac_read = ResourceAPIClient(client, token=oidc_token_read)
+    assert rac_read.get_one(ids[0])[0].status_code == 404
+    assert rac_read.get_one(ids[2])[0].status_code == 200
+    assert rac_read.get_one(other_id)[0].status_code == 200
+
+    (resp, resp_body) = rac.remove_batch(['one'])
+    assert resp.status_code == 422
+
+
 def test_get_all(client: FlaskClient, oidc_token_read, oidc_token_write):
     if oidc_token_read is None or oidc_token_write is None:
         pytest.skip('No OIDC configuration is available')
@@ -87,6 +254,53 @@ def test_get_all(client: FlaskClient, oidc_token_read, oidc_token_write):
     assert len(resp_body['resources']) == 1
 
 
+def test_get_all_paginated(client: FlaskClient, oidc_token_read, oidc_token_write):
+    if oidc_token_read is None or oidc_token_write is None:
+        pytest.skip('No OIDC configuration is available')
+    rac_read = ResourceAPIClient(client, token=oidc_token_read)
+    rac_write = ResourceAPIClient(client, token=oidc_token_write)
+
+    for i in range(0, 5):
+        (resp, resp_body) = rac_write.create(name=f'Paged Resource {i}')
+        assert resp.status_code == 201
+
+    (resp, resp_body) = rac_read.get_all(limit=2)
+    assert resp.status_code == 200
+    assert [r['name'] for r in resp_body['resources']] == ['Paged Resource 0', 'Paged Resource 1']
+    assert resp_body['next'] is not None
+
+    (resp, resp_body) = rac_read.get_all(limit=2, after=resp_body['next'])
+    assert resp.status_code == 200
+    assert [r['name'] for r in resp_body['resources']] == ['Paged Resource 2', 'Paged Resource 3']
+
+    (resp, resp_body) = rac_read.get_all(limit=2, after=resp_body['next'])
+    assert resp.status_code == 200
+    assert [r['name'] for r in resp_body['resources']] == ['Paged Resource 4']
+    assert resp_body['next'] is None
+
+    (resp, resp_body) = rac_read.get_all(limit=0)
+    assert resp.status_code == 400
+
+    (resp, resp_body) = rac_read.get_all(after='not-a-cursor')
+    assert resp.status_code == 400
+
+
+def test_export(client: FlaskClient, oidc_token_read, oidc_token_write):
+    if oidc_token_read is None or oidc_token_write is None:
+        pytest.skip('No OIDC configuration is available')
+    rac_read = ResourceAPIClient(client, token=oidc_token_read)
+    rac_write = ResourceAPIClient(client, token=oidc_token_write)
+    client.application.config['RESOURCE_EXPORT_BATCH_SIZE'] = 2
+    (resp, resp_body) = rac_write.create_batch([{'name': f'Exported Resource {i}'} for i in range(0, 5)])
+    assert resp.status_code == 207
+
+    (resp, resp_body) = rac_read.export()
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/x-ndjson'
+    assert resp_body == rac_read.get_all()[1]['resources']
+    assert [r['name'] for r in resp_body] == [f'Exported Resource {i}' for i in range(0, 5)]
+
+
 def test_get_one(client: FlaskClient, oidc_token_read, oidc_token_write):
     if oidc_token_read is None or oidc_token_write is None:
         pytest.skip('No OIDC configuration is available')
@@ -105,3 +319,124 @@ def test_get_one(client: FlaskClient, oidc_token_read, oidc_token_write):
     assert resp.status_code == 200
     assert resp_body['id'] == 1
     assert resp_body['name'] == 'Test Resource 3'
+
+
+def test_query_count(client: FlaskClient, query_counter, oidc_token_read, oidc_token_write):
+    if oidc_token_read is None or oidc_token_write is None:
+        pytest.skip('No OIDC configuration is available')
+    rac_read = ResourceAPIClient(client, token=oidc_token_read)
+    rac_write = ResourceAPIClient(client, token=oidc_token_write)
+    for i in range(0, 3):
+        (resp, resp_body) = rac_write.create(name=f'Counted Resource {i}')
+        assert resp.status_code == 201
+
+    query_counter.reset()
+    (resp, resp_body) = rac_read.get_all()
+    assert resp.status_code == 200
+    assert len(resp_body['resources']) == 3
+    assert query_counter.count == 2     # The collection change marker and the page
+
+    query_counter.reset()
+    (resp, resp_body) = rac_read.get_one(resp_body['resources'][0]['id'])
+    assert resp.status_code == 200
+    assert resp_body['owner'] is not None
+    assert query_counter.count == 1
+
+
+def test_conditional_get(client: FlaskClient, query_counter, oidc_token_read, oidc_token_write):
+    if oidc_token_read is None or oidc_token_write is None:
+        pytest.skip('No OIDC configuration is available')
+    rac_read = ResourceAPIClient(client, token=oidc_token_read)
+    rac_write = ResourceAPIClient(client, token=oidc_token_write)
+    (resp, resp_body) = rac_write.create(name='Cached Resource')
+    assert resp.status_code == 201
+    i = resp_body['id']
+
+    (resp, resp_body) = rac_read.get_one(i)
+    etag = resp.headers['ETag']
+    assert resp.status_code == 200
+    (resp, resp_body) = rac_read.get_one(i, etag=etag)
+    assert resp.status_code == 304
+
+    (resp, resp_body) = rac_read.get_all()
+    collection_etag = resp.headers['ETag']
+    query_counter.reset()
+    (resp, resp_body) = rac_read.get_all(etag=collection_etag)
+    assert resp.status_code == 304
+    assert query_counter.count == 1
+
+    (resp, resp_body) = rac_write.modify(i, name='Modified Cached Resource')
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+    (resp, resp_body) = rac_read.get_one(i, etag=etag)
+    assert resp.status_code == 200
+    (resp, resp_body) = rac_read.get_all(etag=collection_etag)
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != collection_etag
+
+
+def test_change_marker_per_owner(client: FlaskClient, local_idp, test_config, oidc_token_read):
+    if test_config is not None:
+        pytest.skip('Several owners are only available from the stand-in identity provider')
+    rac_read = ResourceAPIClient(client, token=oidc_token_read)
+    rac_first = ResourceAPIClient(client, token=local_idp.token(['mrmat-python-api-flask-resource-write'],
+                                                                azp='first-client', preferred_username='first'))
+    rac_second = ResourceAPIClient(client, token=local_idp.token(['mrmat-python-api-flask-resource-write'],
+                                                                 azp='second-client', preferred_username='second'))
+    (resp, resp_body) = rac_first.create(name='First Resource')
+    first_owner = resp_body['owner']['id']
+    (resp, resp_body) = rac_read.get_all()
+    collection_etag = resp.headers['ETag']
+
+    # Writes of another owner bump a marker of its own but still change the collection
+    (resp, resp_body) = rac_second.create(name='Second Resource')
+    second_owner = resp_body['owner']['id']
+    (resp, resp_body) = rac_read.get_all(etag=collection_etag)
+    assert resp.status_code == 200
+    assert len(resp_body['resources']) == 2
+    with client.application.app_context():
+        assert ChangeMarker.current(f'resources:{first_owner}') == 1
+        assert ChangeMarker.current(f'resources:{second_owner}') == 1
+
+
+def test_conditional_write(client: FlaskClient, oidc_token_write):
+    if oidc_token_write is None:
+        pytest.skip('No OIDC configuration is available')
+    rac = ResourceAPIClient(client, token=oidc_token_write)
+    (resp, resp_body) = rac.create(name='Contended Resource')
+    assert resp.status_code == 201
+    (i, etag) = (resp_body['id'], resp.headers['ETag'])
+
+    (resp, resp_body) = rac.modify(i, name='First Writer', etag=etag)
+    assert resp.status_code == 200
+    assert resp_body['name'] == 'First Writer'
+    new_etag = resp.headers['ETag']
+    assert new_etag != etag
+
+    (resp, resp_body) = rac.modify(i, name='Second Writer', etag=etag)
+    assert resp.status_code == 412
+    assert resp.headers['ETag'] == new_etag
+    (resp, resp_body) = rac.remove(i, etag=etag)
+    assert resp.status_code == 412
+    (resp, resp_body) = rac.modify(999, name='Nonexistent', etag='"999-1"')
+    assert resp.status_code == 404
+
+    (resp, resp_body) = rac.remove(i, etag=new_etag)
+    assert resp.status_code == 204
+    (resp, resp_body) = rac.remove(i, etag=new_etag)
+    assert resp.status_code == 410
+
+
+def test_row_schema(client: FlaskClient):
+    with client.application.app_context():
+        owner = Owner(client_id='row-schema-client', name='Row Schema Owner')
+        db.session.add_all([Resource(owner=owner, name=f'Row Schema Resource {i}') for i in range(0, 3)])
+        db.session.commit()
+
+        resources = Resource.query.options(joinedload(Resource.owner)).order_by(Resource.id).all()
+        rows = ResourceRowSchema.query().order_by(Resource.id).all()
+        for sort_keys in [True, False]:
+            client.application.config['JSON_SORT_KEYS'] = sort_keys
+            assert json.dumps(ResourceRowSchema(many=True).dump(rows)) == \
+                json.dumps(ResourceSchema(many=True).dump(resources))
+            assert json.dumps(ResourceRowSchema().dump(rows[0])) == json.dumps(ResourceSchema().dump(resources[0]))
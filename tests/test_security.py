@@ -0,0 +1,106 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import time
+
+from flask import Response
+
+from mrmat_python_api_flask import create_app, db
+from mrmat_python_api_flask.security import TokenCache
+
+
+def _client(local_idp, **overrides):
+    config = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'}
+    config.update(local_idp.config())
+    config.update(overrides)
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+    return app.test_client()
+
+
+def _get(client, token: str, path: str = '/api/greeting/v3/') -> Response:
+    return client.get(path, headers={'Authorization': f'Bearer {token}'})
+
+
+def test_local_validation(local_idp):
+    client = _client(local_idp)
+    jwks_requests = local_idp.jwks_requests
+    for _ in range(0, 3):
+        rv = _get(client, local_idp.token([])['access_token'])
+        assert rv.status_code == 200
+        assert rv.get_json()['message'] == f'Hello {local_idp.preferred_name}'
+    assert local_idp.jwks_requests == jwks_requests + 1
+
+
+def test_local_validation_refusals(local_idp):
+    client = _client(local_idp)
+    assert client.get('/api/greeting/v3/').status_code == 401
+    assert _get(client, local_idp.token([], expires_in=-60)['access_token']).status_code == 401
+    assert _get(client, local_idp.token([], aud='someone-else')['access_token']).status_code == 401
+    assert _get(client, local_idp.token([], iss='https://evil.test')['access_token']).status_code == 401
+
+    token = local_idp.token([])['access_token']
+    (header, payload, signature) = token.split('.')
+    assert _get(client, f'{header}.{payload}.{signature[::-1]}').status_code == 401
+
+
+def test_local_validation_scopes(local_idp):
+    client = _client(local_idp)
+    rv = _get(client, local_idp.token(['mrmat-python-api-flask-resource-write'])['access_token'], '/api/resource/v1/')
+    assert rv.status_code == 401
+    assert rv.get_json()['error_description'] == 'Token does not have required scopes'
+    rv = _get(client, local_idp.token(['mrmat-python-api-flask-resource-read'])['access_token'], '/api/resource/v1/')
+    assert rv.status_code == 200
+
+
+def test_local_validation_key_rotation(local_idp):
+    client = _client(local_idp, OIDC_JWKS_MIN_REFRESH_INTERVAL=0)
+    assert _get(client, local_idp.token([])['access_token']).status_code == 200
+    local_idp.rotate()
+    assert _get(client, local_idp.token([])['access_token']).status_code == 200
+
+
+def test_token_cache(local_idp):
+    client = _client(local_idp)
+    token = local_idp.token(['mrmat-python-api-flask-resource-read'])['access_token']
+    assert _get(client, token).status_code == 200
+    assert _get(client, token).status_code == 200
+    assert _get(client, token, '/api/resource/v1/').status_code == 200
+    cache = client.application.extensions['token_cache']
+    assert cache.misses == 1
+    assert cache.hits == 2
+    assert len(cache) == 1
+
+
+def test_token_cache_eviction():
+    cache = TokenCache(max_size=2, ttl=300)
+    cache.put('expired', {'exp': time.time() - 1})
+    assert cache.get('expired') is None
+    cache.put('a', {'sub': 'a'})
+    cache.put('b', {'sub': 'b'})
+    assert cache.get('a') == {'sub': 'a'}
+    cache.put('c', {'sub': 'c'})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'sub': 'a'}
+    assert cache.get('c') == {'sub': 'c'}
+    assert len(cache) == 2
@@ -0,0 +1,89 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import sys
+import time
+import signal
+import socket
+import subprocess
+
+import requests
+from flask import Flask
+
+from mrmat_python_api_flask.server import Server, default_workers
+
+
+def test_server_config():
+    server = Server(Flask(__name__), {'bind': '127.0.0.1:8080', 'threads': 2, 'keepalive': 7, 'max_requests': None})
+    assert server.cfg.workers == default_workers()
+    assert server.cfg.threads == 2
+    assert server.cfg.worker_class_str == 'gthread'
+    assert server.cfg.keepalive == 7
+    assert server.cfg.max_requests == 0
+    assert server.cfg.preload_app is True
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_serving(url: str, deadline: float) -> requests.Response:
+    while True:
+        try:
+            return requests.get(url, timeout=1)
+        except requests.ConnectionError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def test_server(tmp_path):
+    port = _free_port()
+    script = "from mrmat_python_api_flask import create_app, db\n" \
+             "from mrmat_python_api_flask.server import Server\n" \
+             f"app = create_app({{'SQLALCHEMY_DATABASE_URI': 'sqlite:///{tmp_path}/server.sqlite'}}, " \
+             f"instance_path='{tmp_path}')\n" \
+             "with app.app_context():\n" \
+             "    db.create_all()\n" \
+             f"Server(app, {{'bind': '127.0.0.1:{port}', 'workers': 2, 'graceful_timeout': 5}}).run()\n"
+    env = dict(os.environ)
+    env.pop('FLASK_CONFIG', None)
+    process = subprocess.Popen([sys.executable, '-c', script], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        url = f'http://127.0.0.1:{port}/healthz/live'
+        assert _wait_until_serving(url, time.monotonic() + 30).status_code == 200
+
+        # A graceful restart replaces the workers without refusing connections
+        process.send_signal(signal.SIGHUP)
+        for _ in range(0, 20):
+            assert requests.get(url, timeout=5).status_code == 200
+            time.sleep(0.05)
+
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=30) == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
@@ -0,0 +1,72 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+from mrmat_python_api_flask import __version__, create_app
+
+#: Scenario, statement, budget in seconds and modules which must not be imported
+SCENARIOS = [
+    ('package', 'import mrmat_python_api_flask', 0.1,
+     ['pkg_resources', 'flask', 'sqlalchemy', 'flask_oidc', 'alembic']),
+    ('client', 'import mrmat_python_api_flask.client', 1.0,
+     ['pkg_resources', 'flask', 'sqlalchemy', 'flask_oidc', 'alembic', 'IPython']),
+    ('create_app',
+     'from mrmat_python_api_flask import create_app\n'
+     'create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://"}, instance_path=instance_path)', 3.0,
+     ['flask_oidc', 'oauth2client', 'alembic', 'flask_migrate'])
+]
+
+
+def startup(statement: str, instance_path: str) -> dict:
+    script = 'import sys, time, json\n' \
+             f'instance_path = {instance_path!r}\n' \
+             'start = time.perf_counter()\n' \
+             f'{statement}\n' \
+             'print(json.dumps({"elapsed": time.perf_counter() - start, "modules": list(sys.modules.keys())}))\n'
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, check=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(__file__)))
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+@pytest.mark.parametrize('name,statement,budget,forbidden', SCENARIOS, ids=[scenario[0] for scenario in SCENARIOS])
+def test_startup(tmp_path, name, statement, budget, forbidden):
+    # The best of a few runs, so that a busy machine does not fail the budget
+    results = [startup(statement, str(tmp_path)) for _ in range(0, 3)]
+    assert set(forbidden).isdisjoint(results[0]['modules']), f'{name} imports slow modules it does not need'
+    assert min(result['elapsed'] for result in results) < budget, f'{name} takes longer than {budget}s'
+
+
+def test_version():
+    assert isinstance(__version__, str) and __version__ != ''
+
+
+def test_app_name(tmp_path):
+    """The name determines the logger and, for an installed package, the default instance path"""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'}, instance_path=str(tmp_path))
+    assert app.name == 'mrmat_python_api_flask'
+    assert app.logger.name == 'mrmat_python_api_flask'
@@ -0,0 +1,96 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Benchmark of the per-request overhead of the metrics
+
+Issues requests through the WSGI test client with metrics switched off and on. Since the difference is close to the
+noise of whole requests, the hooks the metrics add to every request are also timed on their own. Run as
+'python var/bench/metrics_overhead.py [requests] [repeat]'.
+"""
+
+import sys
+import time
+
+from flask import Response
+
+from mrmat_python_api_flask import create_app, db
+from mrmat_python_api_flask.metrics import _before_request, _after_request, _teardown_request, \
+    _before_cursor_execute, _after_cursor_execute
+
+PATHS = ['/healthz/live', '/api/greeting/v1/', '/healthz/ready']
+
+
+def make_client(enabled: bool):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'METRICS_ENABLED': enabled})
+    with app.app_context():
+        db.create_all()
+    return app.test_client()
+
+
+def timed(client, path: str, requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(0, requests):
+        client.get(path)
+    return (time.perf_counter() - start) / requests
+
+
+class FakeConnection:
+    info: dict = {}
+
+
+def hooks(client, requests: int) -> float:
+    """Time the hooks of a request executing two statements, within a single request context"""
+    response = Response()
+    connection = FakeConnection()
+    with client.application.test_request_context('/healthz/live'):
+        start = time.perf_counter()
+        for _ in range(0, requests):
+            _before_request()
+            for _ in range(0, 2):
+                _before_cursor_execute(connection)
+                _after_cursor_execute(connection)
+            _after_request(response)
+            _teardown_request(None)
+        return (time.perf_counter() - start) / requests
+
+
+def main() -> int:
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+    clients = {False: make_client(False), True: make_client(True)}
+    print(f'{"path":>20} {"disabled":>12} {"enabled":>12} {"overhead":>12}')
+    for path in PATHS:
+        best = {False: None, True: None}
+        for _ in range(0, repeat):
+            # Alternate between both apps so that drift on the machine affects both alike
+            for (enabled, client) in clients.items():
+                elapsed = timed(client, path, requests)
+                best[enabled] = elapsed if best[enabled] is None else min(best[enabled], elapsed)
+        print(f'{path:>20} {best[False] * 1e6:10.1f}us {best[True] * 1e6:10.1f}us '
+              f'{(best[True] - best[False]) * 1e6:10.1f}us')
+    best = min(hooks(clients[True], requests * 10) for _ in range(0, repeat))
+    print(f'{"hooks alone":>20} {"":>12} {"":>12} {best * 1e6:10.1f}us')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Benchmark of the serialisation of the resource collection
+
+Compares loading ORM instances and dumping them through marshmallow with reading plain row tuples and dumping them
+through ResourceRowSchema. Run as 'python var/bench/resource_serialisation.py [rows]'.
+"""
+
+import sys
+import time
+import tempfile
+
+from flask import json
+from sqlalchemy.orm import joinedload
+
+from mrmat_python_api_flask import create_app, db
+from mrmat_python_api_flask.apis.resource.v1.model import Owner, Resource, ResourceRowSchema, resources_schema, \
+    resource_rows_schema
+
+
+def orm_path() -> str:
+    return json.dumps(resources_schema.dump(
+        Resource.query.options(joinedload(Resource.owner)).order_by(Resource.id).all()))
+
+
+def row_path() -> str:
+    return json.dumps(resource_rows_schema.dump(ResourceRowSchema.query().order_by(Resource.id).all()))
+
+
+def measure(name: str, fn, rows: int, repeat: int = 3) -> str:
+    best = None
+    output = None
+    for _ in range(0, repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        output = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{name:>20}: {best:8.3f}s {rows / best:12,.0f} rows/s')
+    return output
+
+
+def main(rows: int = 100000) -> int:
+    with tempfile.TemporaryDirectory() as instance_path:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'}, instance_path=instance_path)
+        with app.app_context():
+            db.create_all()
+            owners = [Owner(client_id=f'client-{i}', name=f'Owner {i}') for i in range(0, 100)]
+            db.session.add_all(owners)
+            db.session.flush()
+            db.session.execute(Resource.__table__.insert(),
+                               [{'owner_id': owners[i % 100].id, 'name': f'Resource {i}'} for i in range(0, rows)])
+            db.session.commit()
+
+            print(f'Serialising {rows} resources')
+            orm_output = measure('ORM + marshmallow', orm_path, rows)
+            row_output = measure('Rows', row_path, rows)
+            if orm_output != row_output:
+                print('Output differs between both paths')
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000))
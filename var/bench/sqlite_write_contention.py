@@ -0,0 +1,115 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Benchmark of concurrent writers and readers on a file-based SQLite database
+
+Starts a number of worker processes against the same database file, like gunicorn workers would. Half of them run the
+transaction of creating a resource, the other half read a page of resources. Compares the rollback journal SQLite uses
+by default with the SQLite profile. Run as 'python var/bench/sqlite_write_contention.py [workers] [seconds]'.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+
+from sqlalchemy.exc import OperationalError
+
+from mrmat_python_api_flask import create_app, db
+from mrmat_python_api_flask.apis.resource.v1.model import Owner, Resource, ChangeMarker, ResourceRowSchema, \
+    resource_rows_schema
+
+
+def make_app(path: str, profile: bool):
+    return create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'DB_SQLITE_PROFILE': profile},
+                      instance_path=os.path.dirname(path))
+
+
+def prepare(path: str, profile: bool):
+    app = make_app(path, profile)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Owner(client_id='bench', name='Benchmark'))
+        db.session.add(ChangeMarker(name='resources:1', version=1))
+        for i in range(0, 1000):
+            db.session.add(Resource(owner_id=1, name=f'Seed {i}'))
+        db.session.commit()
+        db.engine.dispose()
+
+
+def work(path: str, profile: bool, writer: bool, seconds: float, worker: int, results):
+    app = make_app(path, profile)
+    done = 0
+    errors = 0
+    with app.app_context():
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            try:
+                if writer:
+                    owner_id = db.session.query(Owner.id).filter(Owner.client_id == 'bench').scalar()
+                    db.session.add(Resource(owner_id=owner_id, name=f'Worker {worker} Resource {done}'))
+                    db.session.flush()
+                    ChangeMarker.bump(f'resources:{owner_id}')
+                    db.session.commit()
+                else:
+                    resource_rows_schema.dump(ResourceRowSchema.query().order_by(Resource.id).limit(100).all())
+                    db.session.rollback()
+                done += 1
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+    results.put((writer, done, errors))
+
+
+def run(workers: int, seconds: float, profile: bool):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'contention.sqlite')
+        prepare(path, profile)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=work, args=(path, profile, idx % 2 == 0, seconds, idx, results))
+                     for idx in range(0, workers)]
+        for process in processes:
+            process.start()
+        totals = {True: [0, 0], False: [0, 0]}
+        for _ in processes:
+            (writer, done, errors) = results.get()
+            totals[writer][0] += done
+            totals[writer][1] += errors
+        for process in processes:
+            process.join()
+    name = 'sqlite profile' if profile else 'rollback journal'
+    print(f'{name:>20}: {totals[True][0] / seconds:10,.0f} writes/s {totals[False][0] / seconds:10,.0f} reads/s '
+          f'{totals[True][1] + totals[False][1]:6} errors')
+
+
+def main() -> int:
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print(f'{workers} workers for {seconds}s each')
+    run(workers, seconds, profile=False)
+    run(workers, seconds, profile=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
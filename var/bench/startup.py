@@ -0,0 +1,79 @@
+#  MIT License
+#
+#  Copyright (c) 2021 MrMat
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+"""Benchmark of the time it takes to import the package, the client and to create the app
+
+Every scenario runs in a fresh interpreter, since anything imported once is free afterwards. The budgets enforced by
+tests/test_startup.py are deliberately generous, this reports the actual numbers. Run as
+'python var/bench/startup.py [repeat]'.
+"""
+
+import sys
+import json
+import tempfile
+import subprocess
+
+SCENARIOS = {
+    'package': 'import mrmat_python_api_flask',
+    'client': 'import mrmat_python_api_flask.client',
+    'create_app': 'from mrmat_python_api_flask import create_app\n'
+                  'create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://"}, instance_path=instance_path)'
+}
+
+#: Modules which are slow to import and worth knowing about when they are
+HEAVY_MODULES = ['pkg_resources', 'flask', 'sqlalchemy', 'flask_oidc', 'alembic', 'IPython']
+
+
+def measure(statement: str) -> dict:
+    """Execute a statement in a fresh interpreter
+
+    Args:
+        statement: The statement to time, which may refer to a temporary instance_path
+
+    Returns:
+        A dictionary with the seconds the statement took and the heavy modules it imported
+    """
+    with tempfile.TemporaryDirectory() as instance_path:
+        script = 'import sys, time, json\n' \
+                 f'instance_path = {instance_path!r}\n' \
+                 'start = time.perf_counter()\n' \
+                 f'{statement}\n' \
+                 'elapsed = time.perf_counter() - start\n' \
+                 f'print(json.dumps({{"elapsed": elapsed, "modules": [m for m in {HEAVY_MODULES!r} ' \
+                 'if m in sys.modules]}))\n'
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, check=True, text=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main() -> int:
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f'{"scenario":>12} {"best":>10} {"worst":>10}  heavy modules')
+    for (name, statement) in SCENARIOS.items():
+        results = [measure(statement) for _ in range(0, repeat)]
+        elapsed = [result['elapsed'] for result in results]
+        print(f'{name:>12} {min(elapsed) * 1e3:8.1f}ms {max(elapsed) * 1e3:8.1f}ms  '
+              f'{", ".join(results[0]["modules"]) or "-"}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())